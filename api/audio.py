@@ -0,0 +1,204 @@
+"""Waveform helpers shared by the engine workers and the API."""
+
+import numpy as np
+
+
+def crossfade_concat(waves, crossfade_samples):
+    """Join waveforms, linearly cross-fading ``crossfade_samples`` at each seam"""
+    if not waves:
+        return np.zeros(0, dtype=np.float32)
+
+    final_wave = waves[0]
+    for next_wave in waves[1:]:
+        samples = min(crossfade_samples, len(final_wave), len(next_wave))
+        if samples <= 0:
+            final_wave = np.concatenate([final_wave, next_wave])
+            continue
+
+        fade_out = np.linspace(1, 0, samples)
+        fade_in = np.linspace(0, 1, samples)
+        overlap = final_wave[-samples:] * fade_out + next_wave[:samples] * fade_in
+        final_wave = np.concatenate([final_wave[:-samples], overlap, next_wave[samples:]])
+    return final_wave.astype(np.float32, copy=False)
+
+
+class StreamingCrossfader:
+    """Cross-fade waveform chunks that arrive one at a time
+
+    The tail of each chunk is held back until the next chunk arrives, so the
+    concatenated output matches ``crossfade_concat`` over all chunks.
+    """
+
+    def __init__(self, crossfade_samples):
+        self.crossfade_samples = max(0, crossfade_samples)
+        self._tail = None
+
+    def push(self, wave):
+        """Add a chunk and return the samples that are now final"""
+        wave = np.asarray(wave, dtype=np.float32)
+        if self._tail is None:
+            combined = wave
+        else:
+            samples = min(self.crossfade_samples, len(self._tail), len(wave))
+            if samples > 0:
+                fade_out = np.linspace(1, 0, samples)
+                fade_in = np.linspace(0, 1, samples)
+                overlap = self._tail[-samples:] * fade_out + wave[:samples] * fade_in
+                combined = np.concatenate([self._tail[:-samples], overlap, wave[samples:]]).astype(np.float32)
+            else:
+                combined = np.concatenate([self._tail, wave])
+
+        # Hold back the part that the next seam may blend into
+        hold = min(self.crossfade_samples, len(combined))
+        self._tail = combined[len(combined) - hold:]
+        return combined[:len(combined) - hold]
+
+    def flush(self):
+        """Return the held-back tail once no more chunks will arrive"""
+        tail, self._tail = self._tail, None
+        return tail if tail is not None else np.zeros(0, dtype=np.float32)
+
+
+def float_to_pcm16(wave):
+    """Convert a float waveform in [-1, 1] to little-endian 16-bit PCM bytes"""
+    wave = np.clip(np.asarray(wave, dtype=np.float32), -1.0, 1.0)
+    return (wave * 32767).astype("<i2").tobytes()
+
+
+# Size of the header written by wav_header
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(sample_rate, num_samples=None, channels=1, sample_width=2):
+    """RIFF/WAVE header for PCM audio
+
+    Without ``num_samples`` the size fields are set to their maximum value,
+    which players treat as "read until end of stream".
+    """
+    if num_samples is None:
+        data_size = 0xFFFFFFFF
+        riff_size = 0xFFFFFFFF
+    else:
+        data_size = num_samples * channels * sample_width
+        riff_size = 36 + data_size
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return (
+        b"RIFF" + riff_size.to_bytes(4, "little") + b"WAVE"
+        + b"fmt " + (16).to_bytes(4, "little")
+        + (1).to_bytes(2, "little") + channels.to_bytes(2, "little")
+        + sample_rate.to_bytes(4, "little") + byte_rate.to_bytes(4, "little")
+        + block_align.to_bytes(2, "little") + (sample_width * 8).to_bytes(2, "little")
+        + b"data" + data_size.to_bytes(4, "little")
+    )
+
+
+class TimeStretcher:
+    """Pitch-preserving WSOLA time-stretch that works on a stream of chunks
+
+    Output frames are taken from the input every ``speed`` times the output
+    hop, each shifted within a small tolerance to the position whose waveform
+    best continues the previous frame (maximum cross-correlation), and then
+    overlap-added with a Hann window. ``speed`` > 1 makes speech faster.
+    """
+
+    def __init__(self, speed, sample_rate, frame_ms=40, tolerance_ms=10):
+        if speed <= 0:
+            raise ValueError(f"Time-stretch speed must be positive, got {speed}")
+        self.speed = speed
+        self.frame_length = int(sample_rate * frame_ms / 1000) // 2 * 2
+        self.synthesis_hop = self.frame_length // 2
+        self.analysis_hop = self.synthesis_hop * speed
+        self.tolerance = int(sample_rate * tolerance_ms / 1000)
+
+        # Periodic Hann windows sum to one at 50% overlap
+        n = np.arange(self.frame_length)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / self.frame_length)).astype(np.float32)
+        # The first frame has nothing to overlap with, so it must not fade in
+        self.first_window = self.window.copy()
+        self.first_window[:self.synthesis_hop] = 1.0
+
+        self._input = np.zeros(0, dtype=np.float32)
+        self._input_offset = 0
+        self._input_total = 0
+        self._frame_index = 0
+        self._prev_position = None
+        self._overlap = np.zeros(self.frame_length, dtype=np.float32)
+        self._emitted = 0
+
+    def _segment(self, start, length):
+        """Input samples [start, start + length) in absolute positions, zero-padded"""
+        begin = start - self._input_offset
+        segment = self._input[max(begin, 0):begin + length]
+        if len(segment) < length:
+            segment = np.concatenate([segment, np.zeros(length - len(segment), dtype=np.float32)])
+        return segment
+
+    def _process(self, final):
+        output = []
+        N = self.frame_length
+        while True:
+            nominal = int(round(self._frame_index * self.analysis_hop))
+            if final and nominal >= self._input_total:
+                break
+
+            if self._prev_position is None:
+                position = nominal
+                if not final and self._input_total < position + N:
+                    break
+            else:
+                natural = self._prev_position + self.synthesis_hop
+                low = max(0, nominal - self.tolerance)
+                high = nominal + self.tolerance
+                if not final and self._input_total < max(high, natural) + N:
+                    break
+                template = self._segment(natural, N)
+                region = self._segment(low, high - low + N)
+                correlation = np.correlate(region, template, mode="valid")
+                position = low + int(np.argmax(correlation))
+
+            window = self.first_window if self._prev_position is None else self.window
+            self._overlap += self._segment(position, N) * window
+
+            # The first half of the accumulator is final once this frame is added
+            output.append(self._overlap[:self.synthesis_hop].copy())
+            self._overlap = np.concatenate([self._overlap[self.synthesis_hop:],
+                                            np.zeros(self.synthesis_hop, dtype=np.float32)])
+            self._prev_position = position
+            self._frame_index += 1
+
+        # Drop input that no future frame can reach
+        if self._prev_position is not None:
+            next_nominal = int(round(self._frame_index * self.analysis_hop))
+            keep_from = min(self._prev_position + self.synthesis_hop, next_nominal - self.tolerance)
+            drop = keep_from - self._input_offset
+            if drop > 0:
+                self._input = self._input[drop:]
+                self._input_offset += drop
+
+        return np.concatenate(output) if output else np.zeros(0, dtype=np.float32)
+
+    def push(self, wave):
+        """Add input samples and return the stretched samples that are now final"""
+        wave = np.asarray(wave, dtype=np.float32)
+        self._input = np.concatenate([self._input, wave])
+        self._input_total += len(wave)
+        out = self._process(final=False)
+        self._emitted += len(out)
+        return out
+
+    def flush(self):
+        """Finish the stream and return the remaining stretched samples"""
+        out = np.concatenate([self._process(final=True), self._overlap])
+        target = int(round(self._input_total / self.speed))
+        out = out[:max(0, target - self._emitted)]
+        self._emitted += len(out)
+        return out
+
+
+def time_stretch(wave, speed, sample_rate):
+    """Change the tempo of a whole waveform by ``speed`` without changing pitch"""
+    if speed == 1.0:
+        return np.asarray(wave, dtype=np.float32)
+    stretcher = TimeStretcher(speed, sample_rate)
+    return np.concatenate([stretcher.push(wave), stretcher.flush()])
@@ -0,0 +1,227 @@
+"""Bulk synthesis of JSONL job files.
+
+Each line of a job file is a ``TTSRequest``-shaped JSON object. Lines go
+through the regular job queue a few at a time, so they share the resident
+engine (and its request batching) with interactive traffic and reuse the
+cached reference transcripts and voice features. Results are written into a
+zip or tar archive that is streamed while lines complete, and per-line
+progress is kept for the status endpoint.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import tarfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MEDIA_TYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+}
+
+
+def parse_jsonl(text):
+    """(line number, object, error) for every non-blank line of a JSONL document"""
+    parsed = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            parsed.append((number, None, f"Invalid JSON: {e}"))
+            continue
+        if not isinstance(obj, dict):
+            parsed.append((number, None, "Line is not a JSON object"))
+            continue
+        parsed.append((number, obj, None))
+    return parsed
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file object collecting archive bytes between reads"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArchiveWriter:
+    """Build a zip or tar archive incrementally, handing back new bytes after each file"""
+
+    def __init__(self, archive_format="zip"):
+        if archive_format not in ARCHIVE_MEDIA_TYPES:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self.format = archive_format
+        self._buffer = _StreamBuffer()
+        if archive_format == "zip":
+            # WAV data hardly compresses; storing keeps the stream cheap to produce
+            self._archive = zipfile.ZipFile(self._buffer, "w", compression=zipfile.ZIP_STORED)
+        else:
+            self._archive = tarfile.open(fileobj=self._buffer, mode="w|")
+
+    def add(self, name, data):
+        """Add a file and return the archive bytes produced so far"""
+        if self.format == "zip":
+            self._archive.writestr(zipfile.ZipInfo(name, date_time=time.localtime()[:6]), data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        return self._buffer.take()
+
+    def close(self):
+        """Finish the archive and return its remaining bytes"""
+        self._archive.close()
+        return self._buffer.take()
+
+
+class BulkJob:
+    """Per-line progress of one JSONL job file; ``on_update(job)`` is called after every change"""
+
+    def __init__(self, batch_id, parsed, on_update=None):
+        self.batch_id = batch_id
+        self.created = time.time()
+        self.finished = None
+        self._on_update = on_update or (lambda job: None)
+        self._lock = threading.Lock()
+        self.lines = OrderedDict()
+        for number, _, error in parsed:
+            self.lines[number] = {
+                "line": number,
+                "status": "failed" if error else "pending",
+                "request_id": None,
+                "error": error,
+                "file": None,
+            }
+
+    def update(self, number, **fields):
+        with self._lock:
+            self.lines[number].update(fields)
+        self._on_update(self)
+
+    def finish(self):
+        with self._lock:
+            self.finished = time.time()
+        self._on_update(self)
+
+    def to_dict(self, include_lines=True):
+        with self._lock:
+            counts = {"pending": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0}
+            for entry in self.lines.values():
+                counts[entry["status"]] += 1
+            status = {
+                "batch_id": self.batch_id,
+                "status": "completed" if self.finished else "running",
+                "total": len(self.lines),
+                **counts,
+                "created": self.created,
+                "elapsed": (self.finished or time.time()) - self.created,
+            }
+            if include_lines:
+                status["lines"] = [dict(entry) for entry in self.lines.values()]
+            return status
+
+
+class BulkJobRegistry:
+    """Recent bulk jobs by batch ID; the oldest finished ones are forgotten first
+
+    ``on_update`` is passed on to every job.
+    """
+
+    def __init__(self, max_jobs=100, on_update=None):
+        self.max_jobs = max_jobs
+        self._on_update = on_update
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, batch_id, parsed):
+        job = BulkJob(batch_id, parsed, self._on_update)
+        with self._lock:
+            self._jobs[batch_id] = job
+            for old_id in [key for key, old in self._jobs.items() if old.finished]:
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                del self._jobs[old_id]
+        return job
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._jobs.get(batch_id)
+
+
+async def run_bulk_job(job, parsed, synthesize, concurrency):
+    """Synthesize every valid line, yielding (line entry, audio bytes) as lines complete
+
+    ``synthesize(obj, request_id)`` is an async function returning the WAV
+    bytes of one line. Failed lines are recorded on ``job`` and not yielded.
+    If the consumer stops early, lines that have not finished are cancelled.
+    """
+    done = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_line(number, obj):
+        request_id = obj.get("request_id") or f"{job.batch_id}-{number:05d}"
+        async with semaphore:
+            job.update(number, status="running", request_id=request_id)
+            start_time = time.time()
+            try:
+                audio = await synthesize(obj, request_id)
+            except asyncio.CancelledError:
+                job.update(number, status="cancelled")
+                raise
+            except Exception as e:
+                error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+                logger.warning(f"Bulk job {job.batch_id} line {number} failed: {error}")
+                job.update(number, status="failed", error=str(error))
+                await done.put(None)
+                return
+            job.update(number, status="completed", generation_time=time.time() - start_time)
+            await done.put((number, audio))
+
+    tasks = [asyncio.create_task(run_line(number, obj)) for number, obj, error in parsed if error is None]
+    try:
+        for _ in tasks:
+            item = await done.get()
+            if item is not None:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        job.finish()
+
+
+async def stream_bulk_archive(job, parsed, synthesize, concurrency, archive_format="zip"):
+    """Archive bytes for a bulk job: one WAV per completed line, then a manifest"""
+    writer = ArchiveWriter(archive_format)
+    async for number, audio in run_bulk_job(job, parsed, synthesize, concurrency):
+        name = f"{number:05d}.wav"
+        job.update(number, file=name)
+        data = writer.add(name, audio)
+        if data:
+            yield data
+
+    manifest = json.dumps(job.to_dict(), indent=2).encode("utf-8")
+    yield writer.add("manifest.json", manifest) + writer.close()
+    status = job.to_dict(include_lines=False)
+    logger.info(f"Bulk job {job.batch_id} finished: {status['completed']} completed, "
+                f"{status['failed']} failed in {status['elapsed']:.1f}s")
@@ -0,0 +1,77 @@
+"""Run a JSONL bulk job without going through HTTP.
+
+Starts the same resident engine, job queue and caches the server uses, runs
+every line of the job file through them and writes the results archive
+(WAV files plus ``manifest.json``) to disk. Run it from the repository root:
+
+    python -m api.bulk_cli jobs.jsonl -o results.zip
+    python -m api.bulk_cli jobs.jsonl -o results.tar --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from .bulk import ARCHIVE_MEDIA_TYPES, BulkJob, parse_jsonl, stream_bulk_archive
+
+
+async def run(args):
+    from . import main
+
+    with open(args.jobs, "r", encoding="utf-8") as f:
+        parsed = parse_jsonl(f.read())
+    if not parsed:
+        print(f"{args.jobs} contains no requests", file=sys.stderr)
+        return 1
+
+    job = BulkJob(str(uuid.uuid4()), parsed)
+    concurrency = args.concurrency or main.BULK_CONCURRENCY
+    print(f"Bulk job {job.batch_id}: {len(parsed)} line(s), {concurrency} in flight")
+
+    main.tts_engine.start()
+    try:
+        tmp_path = args.output + ".tmp"
+        with open(tmp_path, "wb") as out:
+            last_report = 0
+            async for data in stream_bulk_archive(job, parsed, main.synthesize_bulk_line, concurrency, args.format):
+                out.write(data)
+                if time.time() - last_report >= 1:
+                    status = job.to_dict(include_lines=False)
+                    print(f"  {status['completed']} completed, {status['failed']} failed, "
+                          f"{status['pending'] + status['running']} remaining")
+                    last_report = time.time()
+        os.replace(tmp_path, args.output)
+    finally:
+        main.job_queue.shutdown()
+        main.tts_engine.stop()
+
+    status = job.to_dict()
+    for entry in status["lines"]:
+        if entry["status"] == "failed":
+            print(f"  line {entry['line']}: {entry['error']}", file=sys.stderr)
+    print(f"{status['completed']}/{status['total']} line(s) completed in {status['elapsed']:.1f}s, "
+          f"results written to {args.output}")
+    return 0 if status["failed"] == 0 else 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("jobs", help="JSONL file, one TTS request per line")
+    parser.add_argument("-o", "--output", help="Archive to write (default: <jobs>.zip or .tar)")
+    parser.add_argument("--format", choices=sorted(ARCHIVE_MEDIA_TYPES), help="Archive format (default: from --output, else zip)")
+    parser.add_argument("--concurrency", type=int, help="Lines in flight at once (default: F5_TTS_BULK_CONCURRENCY)")
+    args = parser.parse_args()
+
+    if args.format is None:
+        args.format = "tar" if args.output and args.output.endswith(".tar") else "zip"
+    if args.output is None:
+        args.output = os.path.splitext(args.jobs)[0] + "." + args.format
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
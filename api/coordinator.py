@@ -0,0 +1,381 @@
+"""Coordination between server instances sharing a job registry.
+
+Several server processes (``uvicorn --workers N``) or nodes can serve the
+same clients. Each instance publishes the state of the requests it owns to
+a job registry, along with a heartbeat carrying its load and the voices it
+has used recently. Any instance can then answer a status query for a
+request owned by another, and forward a cancellation: the owner picks up
+cancellation flags on its requests with every heartbeat.
+
+Synthesis requests are routed by ``ref_audio``: to an instance that has the
+voice warm (conditioning features on disk, reference text and results
+cached), unless it is busier than the least busy instance by more than
+``affinity_slack``. Among equally suitable instances the choice is made by
+rendezvous hashing, so every instance routes a voice the same way and a
+cold voice settles on one instance instead of warming up everywhere.
+
+``InMemoryJobRegistry`` serves a single process. ``SQLiteJobRegistry``
+shares a database file between the processes of one host; other backends
+implement the same methods.
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Request states in the registry; the last three are final
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+FINAL_STATES = (STATE_COMPLETED, STATE_FAILED, STATE_CANCELLED)
+
+
+class InMemoryJobRegistry:
+    """Job registry of a single process
+
+    ``publish(updates)`` takes (request_id, instance_id, status, time)
+    tuples, where ``status`` is a dict with at least ``status`` (the
+    state). Cancellation flags stay set until the owner takes them.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, instance_id, url, load, voices, now):
+        with self._lock:
+            self._instances[instance_id] = {
+                "instance_id": instance_id, "url": url, "load": load, "voices": list(voices), "heartbeat": now,
+            }
+
+    def instances(self):
+        with self._lock:
+            return [dict(instance) for instance in self._instances.values()]
+
+    def remove_instance(self, instance_id):
+        with self._lock:
+            self._instances.pop(instance_id, None)
+
+    def publish(self, updates):
+        with self._lock:
+            for request_id, instance_id, status, now in updates:
+                job = self._jobs.pop(request_id, None)
+                cancel_requested = job is not None and job["cancel_requested"]
+                self._jobs[request_id] = {
+                    "instance_id": instance_id, "status": status, "updated": now, "cancel_requested": cancel_requested,
+                }
+
+    def lookup(self, request_id):
+        with self._lock:
+            job = self._jobs.get(request_id)
+            return dict(job) if job is not None else None
+
+    def request_cancel(self, request_id, requester):
+        """Flag a request owned by another instance than ``requester``; returns its owner or None"""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None or job["instance_id"] == requester or job["status"]["status"] in FINAL_STATES:
+                return None
+            job["cancel_requested"] = True
+            return job["instance_id"]
+
+    def take_cancellations(self, instance_id):
+        with self._lock:
+            flagged = [request_id for request_id, job in self._jobs.items()
+                       if job["instance_id"] == instance_id and job["cancel_requested"]]
+            for request_id in flagged:
+                self._jobs[request_id]["cancel_requested"] = False
+            return flagged
+
+    def prune(self, before):
+        with self._lock:
+            # Entries are kept in update order
+            while self._jobs and next(iter(self._jobs.values()))["updated"] < before:
+                self._jobs.popitem(last=False)
+            for instance_id in [i for i, instance in self._instances.items() if instance["heartbeat"] < before]:
+                del self._instances[instance_id]
+
+
+class SQLiteJobRegistry:
+    """Job registry in an SQLite database shared by the instances on one host
+
+    The database runs in WAL mode, so status reads do not wait for writers.
+    Every call is one short transaction.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS instances (
+                    instance_id TEXT PRIMARY KEY, url TEXT, load REAL, voices TEXT, heartbeat REAL
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    request_id TEXT PRIMARY KEY, instance_id TEXT, status TEXT, state TEXT, updated REAL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated);
+                CREATE INDEX IF NOT EXISTS jobs_cancel ON jobs (instance_id) WHERE cancel_requested = 1;
+            """)
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def heartbeat(self, instance_id, url, load, voices, now):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO instances (instance_id, url, load, voices, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (instance_id, url, load, json.dumps(list(voices)), now)
+            )
+
+    def instances(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT instance_id, url, load, voices, heartbeat FROM instances").fetchall()
+        return [
+            {"instance_id": row[0], "url": row[1], "load": row[2], "voices": json.loads(row[3]), "heartbeat": row[4]}
+            for row in rows
+        ]
+
+    def remove_instance(self, instance_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM instances WHERE instance_id = ?", (instance_id,))
+
+    def publish(self, updates):
+        rows = [(request_id, instance_id, json.dumps(status), status["status"], now)
+                for request_id, instance_id, status, now in updates]
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT INTO jobs (request_id, instance_id, status, state, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (request_id) DO UPDATE SET instance_id = excluded.instance_id, status = excluded.status, "
+            "state = excluded.state, updated = excluded.updated",
+            rows
+        ))
+
+    def lookup(self, request_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT instance_id, status, updated, cancel_requested FROM jobs WHERE request_id = ?", (request_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"instance_id": row[0], "status": json.loads(row[1]), "updated": row[2], "cancel_requested": bool(row[3])}
+
+    def request_cancel(self, request_id, requester):
+        """Flag a request owned by another instance than ``requester``; returns its owner or None"""
+        def flag(conn):
+            row = conn.execute(
+                "SELECT instance_id FROM jobs WHERE request_id = ? AND instance_id != ? "
+                f"AND state NOT IN ({', '.join('?' * len(FINAL_STATES))})",
+                (request_id, requester, *FINAL_STATES)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE request_id = ?", (request_id,))
+            return row[0]
+
+        return self._transaction(flag)
+
+    def take_cancellations(self, instance_id):
+        def take(conn):
+            flagged = [row[0] for row in conn.execute(
+                "SELECT request_id FROM jobs WHERE instance_id = ? AND cancel_requested = 1", (instance_id,)
+            )]
+            if flagged:
+                conn.execute("UPDATE jobs SET cancel_requested = 0 WHERE instance_id = ? AND cancel_requested = 1",
+                             (instance_id,))
+            return flagged
+
+        return self._transaction(take)
+
+    def prune(self, before):
+        def delete(conn):
+            conn.execute("DELETE FROM jobs WHERE updated < ?", (before,))
+            conn.execute("DELETE FROM instances WHERE heartbeat < ?", (before,))
+
+        self._transaction(delete)
+
+
+def _rendezvous(voice, instance_id):
+    digest = hashlib.blake2b(f"{voice}\0{instance_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class Coordinator:
+    """This instance's view of the registry: publishes its requests, routes voices, relays cancellations
+
+    ``load()`` returns the instance's current load (0 when idle, 1 with every
+    job slot busy). Status updates are written to the registry by a
+    background thread, so publishing never blocks a request. ``heartbeat()``
+    is called every ``heartbeat_interval`` seconds; instances that missed
+    heartbeats for ``instance_ttl`` seconds are not routed to, and
+    requests not updated for ``retention`` seconds are forgotten. Routing
+    is only enabled when this instance has a ``url`` for the others to
+    reach it by.
+    """
+
+    def __init__(self, registry, instance_id, url=None, load=None, heartbeat_interval=1.0, instance_ttl=5.0,
+                 affinity_slack=0.5, max_voices=64, retention=3600):
+        self.registry = registry
+        self.instance_id = instance_id
+        self.url = url.rstrip("/") if url else None
+        self.heartbeat_interval = heartbeat_interval
+        self.instance_ttl = instance_ttl
+        self.affinity_slack = affinity_slack
+        self.max_voices = max_voices
+        self.retention = retention
+        self._load = load or (lambda: 0.0)
+        self._voices = OrderedDict()
+        self._peers = []
+        self._updates = queue.SimpleQueue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.routed = 0
+
+    def start(self):
+        self._writer = threading.Thread(target=self._write_updates, name="registry-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Write out pending updates and leave the registry"""
+        if self._writer is not None:
+            self._updates.put(None)
+            self._writer.join(timeout=5)
+            self._writer = None
+        try:
+            self.registry.remove_instance(self.instance_id)
+        except Exception as e:
+            logger.warning(f"Could not remove instance {self.instance_id} from the job registry: {e}")
+
+    def _write_updates(self):
+        while True:
+            update = self._updates.get()
+            if update is None:
+                return
+            updates = [update]
+            # Write whatever queued up meanwhile in the same transaction
+            while True:
+                try:
+                    update = self._updates.get_nowait()
+                except queue.Empty:
+                    break
+                if update is None:
+                    self._updates.put(None)
+                    break
+                updates.append(update)
+            try:
+                self.registry.publish(updates)
+            except Exception as e:
+                logger.error(f"Could not publish {len(updates)} request update(s) to the job registry: {e}")
+
+    def publish(self, request_id, state, **fields):
+        """Record the state of a request owned by this instance (non-blocking)"""
+        self._updates.put((request_id, self.instance_id, dict(fields, status=state), time.time()))
+
+    def touch_voice(self, voice):
+        """Note that this instance has just used ``voice`` (it is warm here)"""
+        with self._lock:
+            self._voices[voice] = time.time()
+            self._voices.move_to_end(voice)
+            while len(self._voices) > self.max_voices:
+                self._voices.popitem(last=False)
+
+    def heartbeat(self):
+        """Publish this instance's load and voices, refresh the peer list; returns requests to cancel here"""
+        now = time.time()
+        with self._lock:
+            voices = list(reversed(self._voices))
+        self.registry.heartbeat(self.instance_id, self.url, self._load(), voices, now)
+        peers = [instance for instance in self.registry.instances() if instance["instance_id"] != self.instance_id]
+        with self._lock:
+            self._peers = peers
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            self.registry.prune(now - self.retention)
+        return self.registry.take_cancellations(self.instance_id)
+
+    def lookup(self, request_id):
+        """Registry record of a request owned by another instance, or None"""
+        record = self.registry.lookup(request_id)
+        if record is None or record["instance_id"] == self.instance_id:
+            return None
+        return record
+
+    def request_cancel(self, request_id):
+        """Ask the instance owning a request to cancel it; returns that instance's ID or None"""
+        return self.registry.request_cancel(request_id, self.instance_id)
+
+    def peer(self, instance_id):
+        """Last heartbeat of another live instance, or None"""
+        now = time.time()
+        with self._lock:
+            for instance in self._peers:
+                if instance["instance_id"] == instance_id and now - instance["heartbeat"] <= self.instance_ttl:
+                    return instance
+        return None
+
+    def route(self, voice):
+        """Instance that should synthesize with ``voice``: None for this one, else the peer's heartbeat record"""
+        if self.url is None:
+            return None
+        now = time.time()
+        with self._lock:
+            candidates = [dict(instance) for instance in self._peers
+                          if instance["url"] and now - instance["heartbeat"] <= self.instance_ttl]
+            if not candidates:
+                return None
+            candidates.append({"instance_id": self.instance_id, "url": self.url, "load": self._load(),
+                               "voices": list(self._voices)})
+
+        lightest = min(candidate["load"] for candidate in candidates)
+        eligible = [candidate for candidate in candidates if candidate["load"] <= lightest + self.affinity_slack]
+        warm = [candidate for candidate in eligible if voice in candidate["voices"]]
+        chosen = max(warm or eligible, key=lambda candidate: _rendezvous(voice, candidate["instance_id"]))
+        # Processes behind the same address cannot be told apart by a client
+        if chosen["instance_id"] == self.instance_id or chosen["url"] == self.url:
+            return None
+        with self._lock:
+            self.routed += 1
+        return chosen
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "instance_id": self.instance_id,
+                "url": self.url,
+                "registry": self.registry.name,
+                "load": self._load(),
+                "warm_voices": len(self._voices),
+                "routed_requests": self.routed,
+                "peers": [
+                    {"instance_id": instance["instance_id"], "url": instance["url"], "load": instance["load"],
+                     "warm_voices": len(instance["voices"]), "heartbeat_age": now - instance["heartbeat"]}
+                    for instance in self._peers
+                ],
+            }
@@ -0,0 +1,418 @@
+"""Resumable synthesis of long documents.
+
+A document (an audiobook chapter, a long article) is split into chunks at
+paragraph and sentence boundaries. Each chunk runs as its own job through the
+regular job queue, several at a time, so the chunks spread over the engine
+workers and share batches with other traffic. Every finished chunk is
+written to the job's directory at once, next to a manifest holding the
+request, so a job that failed, was cancelled or was interrupted by a
+restart continues from the chunks it already has. Once all chunks exist they
+are stitched in order, cross-faded by the request's ``crossfade_duration``,
+into one WAV file.
+
+Server processes on one host share the job directories. A process runs a
+job only while it holds the lock file in the job's directory, so a job is
+never synthesized twice at once, and a process that dies gives it up.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .audio import WAV_HEADER_SIZE, StreamingCrossfader, float_to_pcm16, wav_header
+from .output_store import safe_name
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|(?<=[。！？])")
+
+
+def _pack(pieces, max_chars, separator):
+    """Join consecutive pieces into chunks of at most ``max_chars`` (longer pieces stay whole)"""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_document(text, max_chars=800):
+    """Split a document into chunks of at most about ``max_chars`` characters
+
+    Whole paragraphs are packed together where they fit. A paragraph longer
+    than ``max_chars`` is split between sentences; a single sentence longer
+    than that becomes a chunk of its own (the engine splits it further).
+    """
+    chunks = []
+    paragraphs = [" ".join(p.split()) for p in _PARAGRAPH_BREAK.split(text)]
+    pending = []
+    for paragraph in filter(None, paragraphs):
+        if len(paragraph) <= max_chars:
+            pending.append(paragraph)
+            continue
+        chunks.extend(_pack(pending, max_chars, "\n\n"))
+        pending = []
+        sentences = [s.strip() for s in _SENTENCE_END.split(paragraph) if s.strip()]
+        chunks.extend(_pack(sentences, max_chars, " "))
+    chunks.extend(_pack(pending, max_chars, "\n\n"))
+    return chunks
+
+
+class DocumentJob:
+    """Chunks and progress of one document, persisted in its own directory"""
+
+    def __init__(self, job_id, directory, request, chunks, seed, client=None, created=None):
+        self.job_id = job_id
+        self.directory = directory
+        # TTSRequest fields shared by every chunk
+        self.request = request
+        self.chunks = chunks
+        self.seed = seed
+        self.client = client
+        self.created = created or time.time()
+        self.updated = self.created
+        self.status = JOB_RUNNING
+        self.error = None
+        self.done = set()
+        self.running = set()
+        self.task = None
+        self._claim = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        """Whether the job is running in this process"""
+        return self.task is not None and not self.task.done()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def chunk_path(self, index):
+        return os.path.join(self.directory, "chunks", f"{index:05d}.wav")
+
+    def chunk_request_id(self, index):
+        return f"{self.job_id}-{index:05d}"
+
+    def chunk_seed(self, index):
+        # Fixed per chunk, so a chunk redone after a restart sounds the same
+        return (self.seed + index) % 2**31
+
+    def missing(self):
+        with self._lock:
+            return [index for index in range(len(self.chunks)) if index not in self.done]
+
+    def mark_done(self, index):
+        with self._lock:
+            self.done.add(index)
+
+    def set_status(self, status, error=None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.updated = time.time()
+
+    def save(self):
+        """Write the manifest (atomically)"""
+        with self._lock:
+            manifest = {
+                "job_id": self.job_id,
+                "request": self.request,
+                "chunks": self.chunks,
+                "seed": self.seed,
+                "client": self.client,
+                "created": self.created,
+                "updated": self.updated,
+                "status": self.status,
+                "error": self.error,
+            }
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    @classmethod
+    def load(cls, directory):
+        """Job from its directory, with the chunks already on disk counted as done"""
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        job = cls(manifest["job_id"], directory, manifest["request"], manifest["chunks"], manifest["seed"],
+                  client=manifest.get("client"), created=manifest["created"])
+        job._read_progress(manifest)
+        return job
+
+    def refresh(self):
+        """Re-read status and finished chunks from disk, where another process may have advanced them"""
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            self._read_progress(json.load(f))
+
+    def _read_progress(self, manifest):
+        if manifest["status"] == JOB_COMPLETED:
+            # The chunk files were removed once the result was stitched
+            done = set(range(len(self.chunks)))
+        else:
+            done = {index for index in range(len(self.chunks)) if os.path.isfile(self.chunk_path(index))}
+        with self._lock:
+            self.updated = manifest.get("updated", self.created)
+            self.status = manifest["status"]
+            self.error = manifest.get("error")
+            self.done = done
+
+    def claim(self):
+        """Take the job's lock file; returns False if another process holds it"""
+        fd = os.open(os.path.join(self.directory, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._claim = fd
+        return True
+
+    def release(self):
+        """Give up the lock file taken by ``claim()``"""
+        if self._claim is not None:
+            os.close(self._claim)
+            self._claim = None
+
+    def to_dict(self):
+        with self._lock:
+            total = len(self.chunks)
+            status = {
+                "status": self.status,
+                "request_id": self.job_id,
+                "chunks_done": len(self.done),
+                "chunks_running": len(self.running),
+                "chunks_total": total,
+                "progress": len(self.done) / total if total else 1.0,
+                "created": self.created,
+                "updated": self.updated,
+            }
+            if self.error:
+                status["error"] = self.error
+            return status
+
+
+class DocumentJobManager:
+    """Runs document jobs and keeps them resumable across failures and restarts
+
+    ``synthesize(job, index, request_id)`` is an async function returning
+    the WAV bytes of one chunk. ``store(job_id, path)`` takes over the
+    stitched WAV file of a finished job. ``on_update(job)``, if given, is
+    called whenever a job running here changes status or finishes a chunk.
+    At most ``concurrency`` chunks of a job are synthesized at once.
+    Finished, failed and cancelled jobs whose last update is more than
+    ``ttl`` seconds old are removed at startup.
+    """
+
+    def __init__(self, directory, synthesize, store, sample_rate, concurrency=1, ttl=24 * 3600, on_update=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.concurrency = max(1, concurrency)
+        self.ttl = ttl
+        self._synthesize = synthesize
+        self._store = store
+        self._on_update = on_update or (lambda job: None)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """Index the jobs of previous runs; returns those that were still running
+
+        Other processes sharing the directory return the same jobs; ``start()``
+        lets only one of them run each.
+        """
+        now = time.time()
+        interrupted = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not os.path.isfile(os.path.join(path, "manifest.json")):
+                continue
+            try:
+                job = DocumentJob.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable document job {name}: {e}")
+                continue
+            if job.status != JOB_RUNNING and now - job.updated > self.ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            with self._lock:
+                self._jobs[job.job_id] = job
+            if job.status == JOB_RUNNING:
+                interrupted.append(job)
+        if self._jobs:
+            logger.info(f"Indexed {len(self._jobs)} document job(s), {len(interrupted)} to resume")
+        return interrupted
+
+    def get(self, job_id):
+        """Job by ID; jobs not running in this process are read from disk, another process may own them"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and job.active:
+            return job
+        try:
+            loaded = DocumentJob.load(os.path.join(self.directory, safe_name(job_id)))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read document job {job_id}: {e}")
+            return job
+        if loaded.job_id != job_id:
+            return None
+        with self._lock:
+            # A concurrent start() may have begun running the indexed job meanwhile
+            current = self._jobs.get(job_id)
+            if current is not None and current.active:
+                return current
+            self._jobs[job_id] = loaded
+        return loaded
+
+    def create(self, job_id, request, chunks, seed, client=None):
+        """Persist a new job and start it"""
+        job = DocumentJob(job_id, os.path.join(self.directory, safe_name(job_id)), request, chunks, seed, client)
+        os.makedirs(os.path.join(job.directory, "chunks"), exist_ok=True)
+        job.save()
+        with self._lock:
+            self._jobs[job_id] = job
+        self.start(job)
+        return job
+
+    def start(self, job):
+        """Run the missing chunks of a job (after creation, a restart, or to resume it)
+
+        Returns False if the job is running already, here or in another
+        process, or another process has completed it meanwhile.
+        """
+        if job.active or not job.claim():
+            return False
+        try:
+            job.refresh()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not re-read document job {job.job_id}, using its last known state: {e}")
+        if job.status == JOB_COMPLETED:
+            job.release()
+            return False
+        job.set_status(JOB_RUNNING)
+        job.save()
+        job.task = asyncio.ensure_future(self._run(job))
+        self._on_update(job)
+        return True
+
+    def cancel(self, job_id):
+        """Stop a job running in this process, keeping its finished chunks; returns False if it is not running"""
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.set_status(JOB_CANCELLED)
+        job.task.cancel()
+        return True
+
+    def shutdown(self):
+        """Stop all jobs without changing their status, so they resume on the next start"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.task is not None:
+                job.task.cancel()
+
+    async def _run(self, job):
+        started = time.time()
+        missing = job.missing()
+        logger.info(f"Document job {job.job_id}: {len(missing)} of {len(job.chunks)} chunk(s) to synthesize")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = []
+
+        async def run_chunk(index):
+            async with semaphore:
+                job.running.add(index)
+                try:
+                    audio = await self._synthesize(job, index, job.chunk_request_id(index))
+                    await asyncio.to_thread(_write_atomic, job.chunk_path(index), audio)
+                    job.mark_done(index)
+                    self._on_update(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+                    logger.warning(f"Document job {job.job_id} chunk {index} failed: {error}")
+                    errors.append(f"chunk {index}: {error}")
+                finally:
+                    job.running.discard(index)
+
+        tasks = [asyncio.ensure_future(run_chunk(index)) for index in missing]
+        try:
+            # A failed chunk does not stop the others; their audio is kept for the resume
+            await asyncio.gather(*tasks)
+            if errors:
+                job.set_status(JOB_FAILED, "; ".join(errors[:5]))
+                logger.warning(f"Document job {job.job_id} failed: {len(errors)} chunk(s) failed, "
+                               f"{len(job.done)}/{len(job.chunks)} done")
+                return
+            path = await asyncio.to_thread(self._stitch, job)
+            await asyncio.to_thread(self._store, job.job_id, path)
+            await asyncio.to_thread(shutil.rmtree, os.path.join(job.directory, "chunks"), True)
+            job.set_status(JOB_COMPLETED)
+            logger.info(f"Document job {job.job_id} completed: {len(job.chunks)} chunk(s) "
+                        f"in {time.time() - started:.1f}s")
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Document job {job.job_id} stopped ({job.status}) with {len(job.done)}/{len(job.chunks)} "
+                        f"chunk(s) done")
+            raise
+        except Exception as e:
+            logger.error(f"Document job {job.job_id} could not be stitched: {e}")
+            job.set_status(JOB_FAILED, f"{type(e).__name__}: {e}")
+        finally:
+            await asyncio.to_thread(job.save)
+            job.release()
+            self._on_update(job)
+
+    def _stitch(self, job):
+        """Join the chunk files in order into one WAV file in the job directory"""
+        crossfade_samples = int(job.request.get("crossfade_duration", 0.0) * self.sample_rate)
+        crossfader = StreamingCrossfader(crossfade_samples)
+        path = os.path.join(job.directory, "result.wav")
+        samples = 0
+        with open(path, "wb") as f:
+            f.write(wav_header(self.sample_rate, 0))
+            for index in range(len(job.chunks)):
+                with open(job.chunk_path(index), "rb") as chunk:
+                    data = chunk.read()
+                wave = np.frombuffer(data, dtype="<i2", offset=WAV_HEADER_SIZE).astype(np.float32) / 32767
+                out = crossfader.push(wave)
+                samples += len(out)
+                f.write(float_to_pcm16(out))
+            out = crossfader.flush()
+            samples += len(out)
+            f.write(float_to_pcm16(out))
+            f.seek(0)
+            f.write(wav_header(self.sample_rate, samples))
+        return path
+
+
+def _write_atomic(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
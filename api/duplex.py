@@ -0,0 +1,271 @@
+"""Duplex (WebSocket) synthesis of incrementally arriving text.
+
+Text arrives in fragments, for example tokens streamed from a language
+model. ``ClauseSegmenter`` cuts it into clauses as soon as a boundary is
+confirmed, and ``DuplexSession`` synthesizes each clause as its own job,
+starting the next few while earlier ones are still being sent so the engine
+can batch them. Audio goes back as binary 16-bit PCM frames, strictly in
+clause order, with JSON events marking where each clause starts and ends.
+A barge-in (``cancel()``) drops buffered text, cancels the clauses in
+flight and stops their audio at once.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+from .audio import StreamingCrossfader, TimeStretcher, float_to_pcm16
+
+logger = logging.getLogger(__name__)
+
+# Punctuation ending a sentence or a clause
+SENTENCE_ENDS = set(".!?…。！？")
+CLAUSE_ENDS = set(",;:，；：、")
+# Full-width punctuation is final as soon as it arrives; other marks only once whitespace follows
+# (so that "3.5" or "e.g" in the middle of a token stream is not cut)
+FULLWIDTH_ENDS = set("。！？，；：、")
+
+_END = object()
+
+
+class ClauseSegmenter:
+    """Buffers text fragments and hands out complete clauses
+
+    A sentence end cuts a clause of at least ``min_chars`` characters, a
+    clause mark (comma, semicolon, ...) one of at least ``clause_chars``, so
+    the first audio comes quickly without synthesizing fragments too short
+    to sound natural. Text without any boundary is cut at a word boundary
+    once it reaches ``max_chars``.
+    """
+
+    def __init__(self, min_chars=8, clause_chars=30, max_chars=300):
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def push(self, text):
+        """Add a fragment and return the clauses it completed"""
+        self._buffer += text
+        clauses = []
+        while True:
+            end = self._boundary()
+            if end is None:
+                break
+            clause, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+            if clause:
+                clauses.append(clause)
+        return clauses
+
+    def flush(self):
+        """Return the buffered rest as a final clause, or None"""
+        clause, self._buffer = self._buffer.strip(), ""
+        return clause or None
+
+    def clear(self):
+        self._buffer = ""
+
+    def _boundary(self):
+        buffer = self._buffer
+        for i, char in enumerate(buffer):
+            if char in SENTENCE_ENDS:
+                minimum = self.min_chars
+            elif char in CLAUSE_ENDS:
+                minimum = self.clause_chars
+            else:
+                continue
+            if char not in FULLWIDTH_ENDS and not (i + 1 < len(buffer) and buffer[i + 1].isspace()):
+                continue
+            if len(buffer[:i + 1].strip()) >= minimum:
+                return i + 1
+
+        if len(buffer) >= self.max_chars:
+            space = buffer.rfind(" ", 0, self.max_chars)
+            return space if space > 0 else self.max_chars
+        return None
+
+
+class _Clause:
+    def __init__(self, index, text, request_id, crossfade_duration, speed):
+        self.index = index
+        self.text = text
+        self.request_id = request_id
+        self.crossfade_duration = crossfade_duration
+        self.speed = speed
+        self.created = time.perf_counter()
+        self.chunks = asyncio.Queue()
+        self.task = None
+        self.error = None
+        self.cancelled = False
+
+
+class DuplexSession:
+    """Synthesizes the clauses of one connection and sends their audio in order
+
+    ``synthesize(text, request_id, on_chunk)`` is a coroutine that runs one
+    clause, passing every finished waveform chunk to ``on_chunk`` (from any
+    thread); cancelling it must cancel the job. ``send_bytes`` and
+    ``send_json`` write to the connection. At most ``lookahead`` clauses are
+    synthesized at once.
+    """
+
+    def __init__(self, session_id, synthesize, send_bytes, send_json, sample_rate,
+                 crossfade_duration=0.15, speed=1.0, lookahead=2, segmenter=None):
+        self.session_id = session_id
+        self.sample_rate = sample_rate
+        self.crossfade_duration = crossfade_duration
+        self.speed = speed
+        self.lookahead = max(1, lookahead)
+        self.segmenter = segmenter or ClauseSegmenter()
+        self._synthesize = synthesize
+        self._send_bytes = send_bytes
+        self._send_json = send_json
+        self._clauses = deque()
+        self._next_index = 0
+        self._flush_pending = False
+        self._wake = asyncio.Event()
+        self._sender = asyncio.ensure_future(self._send_loop())
+
+    def push_text(self, text):
+        """Add a text fragment; returns the number of clauses it completed"""
+        clauses = self.segmenter.push(text)
+        for clause in clauses:
+            self._add(clause)
+        return len(clauses)
+
+    def flush(self):
+        """Synthesize the buffered rest; a ``done`` event follows once all audio is sent"""
+        rest = self.segmenter.flush()
+        if rest is not None:
+            self._add(rest)
+        self._flush_pending = True
+        self._wake.set()
+
+    async def cancel(self):
+        """Barge-in: drop buffered text and all unsent clauses
+
+        Sends a ``cancelled`` event; audio frames received before it belong
+        to the cancelled clauses. Returns the number of clauses whose
+        synthesis was started.
+        """
+        self.segmenter.clear()
+        self._flush_pending = False
+        clauses = list(self._clauses)
+        self._clauses.clear()
+        started = 0
+        for clause in clauses:
+            clause.cancelled = True
+            if clause.task is not None:
+                started += not clause.task.done()
+                clause.task.cancel()
+            clause.chunks.put_nowait(_END)
+        logger.info(f"Duplex session {self.session_id}: barge-in cancelled {len(clauses)} clause(s)")
+        await self._send_json({"type": "cancelled", "clauses": [clause.index for clause in clauses]})
+        return started
+
+    async def close(self):
+        """Stop sending and cancel everything in flight (the connection is gone)"""
+        self._sender.cancel()
+        for clause in self._clauses:
+            if clause.task is not None:
+                clause.task.cancel()
+        tasks = [clause.task for clause in self._clauses if clause.task is not None]
+        self._clauses.clear()
+        await asyncio.gather(self._sender, *tasks, return_exceptions=True)
+
+    def _add(self, text):
+        index = self._next_index
+        self._next_index += 1
+        clause = _Clause(index, text, f"{self.session_id}-{index}", self.crossfade_duration, self.speed)
+        self._clauses.append(clause)
+        self._start_ready()
+        self._wake.set()
+
+    def _start_ready(self):
+        for clause in list(self._clauses)[:self.lookahead]:
+            if clause.task is None:
+                clause.task = asyncio.ensure_future(self._run(clause))
+
+    async def _run(self, clause):
+        loop = asyncio.get_running_loop()
+
+        def on_chunk(wave):
+            loop.call_soon_threadsafe(clause.chunks.put_nowait, wave)
+
+        try:
+            await self._synthesize(clause.text, clause.request_id, on_chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            clause.error = e
+        finally:
+            clause.chunks.put_nowait(_END)
+
+    async def _send_loop(self):
+        while True:
+            if not self._clauses:
+                if self._flush_pending:
+                    self._flush_pending = False
+                    await self._send_json({"type": "done"})
+                    continue
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            clause = self._clauses[0]
+            await self._send_clause(clause)
+            if self._clauses and self._clauses[0] is clause:
+                self._clauses.popleft()
+            self._start_ready()
+
+    async def _send_clause(self, clause):
+        crossfader = StreamingCrossfader(int(clause.crossfade_duration * self.sample_rate))
+        stretcher = TimeStretcher(clause.speed, self.sample_rate) if clause.speed != 1.0 else None
+        samples = 0
+        started = False
+
+        async def send(wave):
+            nonlocal samples, started
+            if clause.cancelled or not len(wave):
+                return
+            if not started:
+                started = True
+                await self._send_json({
+                    "type": "clause_start",
+                    "clause": clause.index,
+                    "text": clause.text,
+                    "latency": time.perf_counter() - clause.created,
+                })
+                if clause.cancelled:
+                    return
+            samples += len(wave)
+            await self._send_bytes(float_to_pcm16(wave))
+
+        while True:
+            item = await clause.chunks.get()
+            if item is _END or clause.cancelled:
+                break
+            wave = crossfader.push(item)
+            if stretcher is not None:
+                wave = stretcher.push(wave)
+            await send(wave)
+        if clause.cancelled:
+            return
+
+        wave = crossfader.flush()
+        if stretcher is not None:
+            wave = np.concatenate([stretcher.push(wave), stretcher.flush()])
+        await send(wave)
+
+        if clause.error is not None:
+            detail = getattr(clause.error, "detail", None) or str(clause.error)
+            await self._send_json({"type": "error", "clause": clause.index, "detail": detail})
+        await self._send_json({
+            "type": "clause_end",
+            "clause": clause.index,
+            "samples": samples,
+            "duration": samples / self.sample_rate,
+        })
@@ -0,0 +1,271 @@
+"""Incremental encoders for the audio output formats.
+
+WAV stays the default. FLAC, MP3 and Opus (in Ogg) are encoded with
+libsndfile through ``soundfile``, chunk by chunk: every ``encode()`` call
+returns the bytes that are ready so far, so compressed audio can be streamed
+while synthesis is still running.
+
+libsndfile goes back to patch a few header fields when a file is closed
+(FLAC STREAMINFO totals, the MP3 info tag). When streaming, those bytes have
+already been sent: FLAC totals keep their "unknown" values, which decoders
+accept for streams, and the placeholder frame reserved for the MP3 info tag
+is left out. That is only safe at a constant bitrate, where decoders work out
+the length from the frame size, so streamed MP3 needs a bitrate. Encoders for complete waveforms keep their output until
+``finish()`` so the patches apply.
+"""
+
+import time
+
+import numpy as np
+import soundfile as sf
+
+from .audio import float_to_pcm16, wav_header
+
+# Output formats; the bitrate range (kbps) is what libsndfile's compression level spans
+OUTPUT_FORMATS = {
+    "wav": {"media_type": "audio/wav", "extension": ".wav"},
+    "flac": {"media_type": "audio/flac", "extension": ".flac", "format": "FLAC", "subtype": "PCM_16"},
+    "mp3": {
+        "media_type": "audio/mpeg", "extension": ".mp3", "format": "MP3", "subtype": "MPEG_LAYER_III",
+        # MPEG-2 Layer III at 24 kHz; the highest compression level is rejected
+        "bitrate_range": (8, 160), "max_level": 0.95, "bitrate_mode": "CONSTANT",
+    },
+    "opus": {
+        "media_type": "audio/ogg; codecs=opus", "extension": ".opus", "format": "OGG", "subtype": "OPUS",
+        "bitrate_range": (6, 256), "max_level": 1.0,
+    },
+}
+
+# Accept header media types and the formats they select
+ACCEPT_TYPES = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+}
+
+
+# MPEG audio Layer III bitrates (kbps) by bitrate index, and sample rates by sample rate index
+_MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_info_frame_length(data):
+    """Length of a leading LAME info frame in ``data``, 0 if the first frame is audio, None if more data is needed
+
+    The info frame holds a ``Xing`` or ``Info`` tag right after the side
+    information; while encoding is still running LAME leaves it zeroed and
+    only fills it in on close. At low bitrates LAME writes no info frame
+    at all.
+    """
+    if len(data) < 4:
+        return None
+    if data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return 0
+    version = (data[1] >> 3) & 3
+    bitrate_index = data[2] >> 4
+    rate_index = (data[2] >> 2) & 3
+    if version == 1 or (data[1] >> 1) & 3 != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        # Reserved version, not Layer III, free format or invalid fields
+        return 0
+    bitrate = _MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[2] >> 1) & 1
+    length = (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+    mono = data[3] >> 6 == 3
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    offset = 4 + (0 if data[1] & 1 else 2) + side_info
+    if len(data) < length:
+        return None
+    if data[offset:offset + 4] in (b"Xing", b"Info") or not any(data[4:length]):
+        return length
+    return 0
+
+
+def negotiate_format(requested=None, accept=None, default="wav"):
+    """Output format from an explicit request field, else from an Accept header
+
+    Raises ``ValueError`` for an unknown explicit format. Accept entries are
+    tried by descending quality; wildcards and unsupported types fall back
+    to ``default``.
+    """
+    if requested:
+        fmt = requested.lower()
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {requested!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        return fmt
+
+    entries = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            entries.append((-quality, position, media_type.lower()))
+
+    for _, _, media_type in sorted(entries):
+        if media_type in ACCEPT_TYPES:
+            return ACCEPT_TYPES[media_type]
+        if media_type in ("audio/*", "*/*"):
+            return default
+    return default
+
+
+def compression_level(fmt, bitrate):
+    """libsndfile compression level for a target bitrate in kbps"""
+    low, high = OUTPUT_FORMATS[fmt]["bitrate_range"]
+    level = (high - min(max(bitrate, low), high)) / (high - low)
+    return min(level, OUTPUT_FORMATS[fmt]["max_level"])
+
+
+class _Sink:
+    """Write-only file object handing out what was written since the last drain
+
+    libsndfile seeks and tells as if this were a real file. Writes behind
+    what has already been drained are dropped.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._base = 0
+        self._pos = 0
+        self._size = 0
+
+    def write(self, data):
+        data = bytes(data)
+        offset = self._pos - self._base
+        if offset >= 0:
+            self._buffer[offset:offset + len(data)] = data
+        self._pos += len(data)
+        self._size = max(self._size, self._pos)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self._pos = offset
+        elif whence == 1:
+            self._pos += offset
+        else:
+            self._pos = self._size + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        return b""
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._base += len(data)
+        self._buffer = bytearray()
+        return data
+
+
+class AudioEncoder:
+    """Encodes a mono float waveform chunk by chunk into one output format
+
+    WAV output uses a streaming header (unknown length). ``bitrate`` (kbps)
+    applies to MP3 and Opus; streaming MP3 requires it, since a variable
+    bitrate stream is unreadable without the info tag. Without ``streaming``, output is held back
+    until ``finish()``, which lets the encoder complete its headers.
+    ``cpu_seconds`` accumulates the CPU time of the calling threads spent
+    encoding.
+    """
+
+    def __init__(self, fmt, sample_rate, bitrate=None, streaming=True):
+        if streaming and fmt == "mp3" and not bitrate:
+            raise ValueError("Streaming MP3 output needs a constant bitrate")
+        self.format = fmt
+        self.media_type = OUTPUT_FORMATS[fmt]["media_type"]
+        self.sample_rate = sample_rate
+        self.streaming = streaming
+        self.cpu_seconds = 0.0
+        self._header_sent = False
+        self._file = None
+        self._sink = None
+        # Output held back until it is known whether it starts with LAME's info tag frame
+        self._tag_pending = bytearray() if streaming and fmt == "mp3" else None
+
+        spec = OUTPUT_FORMATS[fmt]
+        if "format" in spec:
+            self._sink = _Sink()
+            level = compression_level(fmt, bitrate) if bitrate and "bitrate_range" in spec else None
+            self._file = sf.SoundFile(
+                self._sink, "w", samplerate=sample_rate, channels=1, subtype=spec["subtype"], format=spec["format"],
+                compression_level=level, bitrate_mode=spec.get("bitrate_mode") if level is not None else None
+            )
+
+    def _timed(self, fn, *args):
+        start = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            self.cpu_seconds += time.thread_time() - start
+
+    def encode(self, wave):
+        """Encode the next samples and return the output bytes ready so far"""
+        return self._timed(self._encode, np.asarray(wave, dtype=np.float32))
+
+    def _encode(self, wave):
+        if self._file is None:
+            header = b"" if self._header_sent else wav_header(self.sample_rate)
+            self._header_sent = True
+            return header + float_to_pcm16(wave)
+        if len(wave):
+            self._file.write(wave)
+        return self._drain()
+
+    def _drain(self):
+        if not self.streaming:
+            return b""
+        data = self._sink.drain()
+        if self._tag_pending is not None:
+            self._tag_pending += data
+            # The info frame would only be completed on close, after it was sent; leave it out
+            length = mp3_info_frame_length(self._tag_pending)
+            if length is None:
+                return b""
+            data = bytes(self._tag_pending[length:])
+            self._tag_pending = None
+        return data
+
+    def finish(self):
+        """Flush the encoder and return the remaining bytes"""
+        return self._timed(self._finish)
+
+    def _finish(self):
+        if self._file is None:
+            return self._encode(np.zeros(0, dtype=np.float32))
+        self._file.close()
+        if not self.streaming:
+            return self._sink.drain()
+        data = self._drain()
+        if self._tag_pending is not None:
+            # Less than one frame in total; send it as it is
+            data, self._tag_pending = bytes(self._tag_pending), None
+        return data
+
+
+def encode_waveform(wave, fmt, sample_rate, bitrate=None, block_seconds=1.0):
+    """Encode a complete waveform block by block; returns the bytes and the encoder CPU seconds"""
+    encoder = AudioEncoder(fmt, sample_rate, bitrate, streaming=False)
+    block = max(1, int(block_seconds * sample_rate))
+    parts = [encoder.encode(wave[i:i + block]) for i in range(0, len(wave), block)]
+    parts.append(encoder.finish())
+    return b"".join(parts), encoder.cpu_seconds
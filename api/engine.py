@@ -0,0 +1,1075 @@
+"""Resident F5-TTS inference engine.
+
+Instead of starting ``f5-tts_infer-cli`` (a fresh interpreter that imports
+torch and loads the model and vocoder from disk) for every request, the
+engine keeps one or more worker processes alive. Each worker loads the model
+and vocoder once and then serves synthesis jobs sent over a pipe.
+
+Requests that arrive close together are batched: their sentence batches run
+through the flow-matching sampler and the vocoder as one padded batch, which
+keeps the GPU busy without changing any single request's output.
+
+Cancellation is cooperative: every worker shares one flag per batch slot
+with the parent, and checks the flags between sampler steps and between
+sentence batches. A cancelled job stops costing compute within one step,
+and the warm worker keeps serving the rest of its batch.
+
+Each worker runs in one of ``WORKER_MODES``: ``auto`` uses the device
+F5-TTS picks (a GPU when there is one), ``cpu`` forces the CPU, and
+``cpu-int8`` additionally quantizes the linear layers of the transformer and
+the vocoder to int8 with dynamic activation scaling. Every worker gets its
+own torch thread budget, so workers running at once do not oversubscribe
+the cores.
+"""
+
+import collections
+import contextvars
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+from .audio import crossfade_concat, time_stretch
+
+logger = logging.getLogger(__name__)
+
+
+class EngineError(Exception):
+    """Raised when the engine cannot complete a synthesis job"""
+
+
+class EngineCancelled(EngineError):
+    """Raised when a synthesis job was cancelled while running"""
+
+
+class _BatchCancelled(Exception):
+    """Raised inside the sampler once every job of a sentence batch is cancelled"""
+
+
+# F5-TTS output sample rate
+SAMPLE_RATE = 24000
+
+# Inference settings, matching the f5-tts_infer-cli defaults
+TARGET_RMS = 0.1
+CFG_STRENGTH = 2.0
+SWAY_SAMPLING_COEF = -1.0
+NFE_STEPS = 32
+CROSSFADE_DURATION = 0.15
+
+WORKER_MODES = ("auto", "cpu", "cpu-int8")
+
+# Pipeline stages of a worker batch, and how many finished batches may wait between two stages
+PIPELINE_STAGES = ("prepare", "sampling", "vocoding", "postprocess")
+PIPELINE_DEPTH = 2
+
+
+def available_cores():
+    """Cores this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class _Sampled:
+    """Sampled mel spectrograms of a sentence batch on their way to the vocoder"""
+
+    def __init__(self, items, sampled, lens, duration, ready, seconds):
+        self.items = items
+        self.sampled = sampled
+        self.lens = lens
+        self.duration = duration
+        # CUDA event recorded once sampling is queued, or None on the CPU
+        self.ready = ready
+        self.seconds = seconds
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def clip_reference_audio(ref_audio, ref_text=""):
+    """Path of ``ref_audio`` clipped and trimmed by F5-TTS reference preprocessing, without transcription"""
+    from f5_tts.infer.utils_infer import preprocess_ref_audio_text
+
+    # Only the clipping/trimming is wanted here; a placeholder text keeps ASR from running
+    clipped_path, _ = preprocess_ref_audio_text(ref_audio, ref_text or "-", show_info=_quiet)
+    return clipped_path
+
+
+def _normalize_ref_text(ref_text):
+    """Make sure the reference text ends like F5-TTS preprocessing leaves it"""
+    if not ref_text.endswith(". ") and not ref_text.endswith("。"):
+        if ref_text.endswith("."):
+            ref_text += " "
+        else:
+            ref_text += ". "
+    return ref_text
+
+
+class _Synthesizer:
+    """Model, vocoder and inference loop living inside a worker process"""
+
+    def __init__(self, model_name, mode="auto"):
+        from f5_tts.api import F5TTS
+
+        tts = F5TTS(model=model_name, device=None if mode == "auto" else "cpu")
+        self.mode = mode
+        self.model = tts.ema_model
+        self.vocoder = tts.vocoder
+        self.mel_spec_type = tts.mel_spec_type
+        self.sample_rate = tts.target_sample_rate
+        self.hop_length = self.model.mel_spec.hop_length
+        self.device = tts.device
+        self._stream = None
+        if mode == "cpu-int8":
+            self.quantize()
+
+    def quantize(self):
+        """Dynamic int8 quantization of the transformer's and vocoder's linear layers (CPU only)
+
+        Weights are stored as int8 and activations are quantized on the fly
+        per batch, so no calibration data is needed. The mel extractor,
+        convolutions and embeddings stay in float32.
+        """
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        quantize_dynamic(self.model.transformer, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        quantize_dynamic(self.vocoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    def compute_features(self, ref_audio, ref_text, processed_ref_audio=None):
+        """Decode, clip, normalize and resample reference audio into a mel spectrogram
+
+        ``processed_ref_audio`` is an already clipped copy of ``ref_audio``
+        (from the reference cache); clipping is skipped when it still exists.
+        """
+        import torch
+        import torchaudio
+
+        if not (processed_ref_audio and os.path.isfile(processed_ref_audio)):
+            processed_ref_audio = clip_reference_audio(ref_audio, ref_text)
+        audio, sr = torchaudio.load(processed_ref_audio)
+        if audio.shape[0] > 1:
+            audio = torch.mean(audio, dim=0, keepdim=True)
+
+        rms = float(torch.sqrt(torch.mean(torch.square(audio))))
+        if rms < TARGET_RMS:
+            audio = audio * TARGET_RMS / rms
+        if sr != self.sample_rate:
+            audio = torchaudio.transforms.Resample(sr, self.sample_rate)(audio)
+
+        with torch.inference_mode():
+            mel = self.model.mel_spec(audio.to(self.device))
+        mel = mel[0].permute(1, 0).float().cpu().numpy()
+        meta = {
+            "rms": rms,
+            "frames": int(mel.shape[0]),
+            "sample_rate": self.sample_rate,
+            "hop_length": self.hop_length,
+        }
+        return mel, meta
+
+    def load_features(self, job):
+        """Conditioning mel for a job, memory-mapped from the voice registry when available"""
+        import numpy as np
+
+        features_path = job.get("features_path")
+        if features_path:
+            meta_path = os.path.splitext(features_path)[0] + ".json"
+            if os.path.isfile(features_path) and os.path.isfile(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                # Copy-on-write mapping: pages stay shared between workers
+                return np.load(features_path, mmap_mode="c"), meta
+
+        mel, meta = self.compute_features(job["ref_audio"], job["ref_text"], job.get("processed_ref_audio"))
+
+        if features_path:
+            # Write to temporary files first so other workers never see partial features
+            tmp_suffix = f".{os.getpid()}.tmp"
+            with open(features_path + tmp_suffix, "wb") as f:
+                np.save(f, mel)
+            with open(meta_path + tmp_suffix, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + tmp_suffix, meta_path)
+            os.replace(features_path + tmp_suffix, features_path)
+        return mel, meta
+
+    def _prepare(self, job):
+        """Resolve the reference text, load conditioning and split the text of a job"""
+        from f5_tts.infer.utils_infer import chunk_text, preprocess_ref_audio_text
+
+        timings = {}
+        start = time.perf_counter()
+        ref_text = job["ref_text"]
+        if not ref_text:
+            _, ref_text = preprocess_ref_audio_text(job["ref_audio"], "", show_info=_quiet)
+            timings["ref_text"] = time.perf_counter() - start
+        ref_text = _normalize_ref_text(ref_text)
+
+        start = time.perf_counter()
+        mel, meta = self.load_features(job)
+        timings["features"] = time.perf_counter() - start
+
+        # Split the text the same way infer_process does
+        ref_seconds = mel.shape[0] * self.hop_length / self.sample_rate
+        max_chars = int(len(ref_text.encode("utf-8")) / ref_seconds * (22 - ref_seconds))
+
+        return {
+            "job": job,
+            "mel": mel,
+            "meta": meta,
+            "ref_text": ref_text,
+            "texts": chunk_text(job["gen_text"], max_chars=max_chars),
+            "waves": {},
+            "next_chunk": 0,
+            "samples": 0,
+            "failed": False,
+            "timings": timings,
+        }
+
+    def _sample_batch(self, items, nfe_steps, should_stop=None):
+        """Sample the mel spectrograms of sentence batches of several jobs in one pass
+
+        ``items`` are (job state, sentence batch index) pairs. Conditioning,
+        text and noise are padded to the longest item and masked, as in
+        ``CFM.sample``. Each item draws its noise from its own generator,
+        seeded from the job seed and batch index, so its output does not
+        depend on which other requests share the batch. Returns a
+        ``_Sampled`` for ``_vocode``.
+
+        ``should_stop()`` is checked before every sampler step; once it
+        returns True the batch is abandoned with ``_BatchCancelled``.
+        """
+        import numpy as np
+        import torch
+        import torch.nn.functional as F
+        from f5_tts.model.utils import (
+            convert_char_to_pinyin,
+            get_epss_timesteps,
+            lens_to_mask,
+            list_str_to_idx,
+            list_str_to_tensor,
+        )
+        from torch.nn.utils.rnn import pad_sequence
+        from torchdiffeq import odeint
+
+        model = self.model
+        device = self.device
+        dtype = next(model.parameters()).dtype
+
+        conds, texts, durations, seeds = [], [], [], []
+        for state, index in items:
+            gen_text = state["texts"][index]
+            ref_frames = state["mel"].shape[0]
+            local_speed = 1.0 if len(gen_text.encode("utf-8")) >= 10 else 0.3
+            ref_text_len = len(state["ref_text"].encode("utf-8"))
+            gen_text_len = len(gen_text.encode("utf-8"))
+            conds.append(torch.from_numpy(np.asarray(state["mel"])))
+            texts.append(state["ref_text"] + gen_text)
+            durations.append(ref_frames + int(ref_frames / ref_text_len * gen_text_len / local_speed))
+            seeds.append((state["job"]["seed"] + index) % 2**32)
+
+        with torch.inference_mode():
+            lens = torch.tensor([c.shape[0] for c in conds], device=device, dtype=torch.long)
+            cond = pad_sequence(conds, batch_first=True).to(device, dtype)
+
+            text_lists = convert_char_to_pinyin(texts)
+            if model.vocab_char_map is not None:
+                text = list_str_to_idx(text_lists, model.vocab_char_map).to(device)
+            else:
+                text = list_str_to_tensor(text_lists).to(device)
+
+            duration = torch.tensor(durations, device=device, dtype=torch.long)
+            duration = torch.maximum(torch.maximum((text != -1).sum(dim=-1), lens) + 1, duration)
+            duration = duration.clamp(max=4096)
+            max_duration = int(duration.amax())
+
+            cond = F.pad(cond, (0, 0, 0, max_duration - cond.shape[1]), value=0.0)
+            cond_mask = lens_to_mask(lens, length=max_duration).unsqueeze(-1)
+            step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
+            mask = lens_to_mask(duration) if len(items) > 1 else None
+
+            def fn(t, x):
+                if should_stop is not None and should_stop():
+                    raise _BatchCancelled()
+                pred_cfg = model.transformer(
+                    x=x, cond=step_cond, text=text, time=t, mask=mask, cfg_infer=True, cache=True
+                )
+                pred, null_pred = torch.chunk(pred_cfg, 2, dim=0)
+                return pred + (pred - null_pred) * CFG_STRENGTH
+
+            y0 = [
+                torch.randn(int(frames), model.num_channels, generator=torch.Generator().manual_seed(seed))
+                for frames, seed in zip(duration.tolist(), seeds)
+            ]
+            y0 = pad_sequence(y0, batch_first=True).to(device, dtype)
+
+            sampling_start = time.perf_counter()
+            t = get_epss_timesteps(nfe_steps, device=device, dtype=dtype)
+            t = t + SWAY_SAMPLING_COEF * (torch.cos(torch.pi / 2 * t) - 1 + t)
+            try:
+                trajectory = odeint(fn, y0, t, **model.odeint_kwargs)
+            finally:
+                model.transformer.clear_cache()
+            sampled = trajectory[-1].to(torch.float32)
+            ready = None
+            if str(device).startswith("cuda"):
+                ready = torch.cuda.Event()
+                ready.record()
+            self._synchronize()
+        return _Sampled(items, sampled, lens, duration, ready, time.perf_counter() - sampling_start)
+
+    def _vocode(self, batch):
+        """Vocode the generated part of every item of a sampled batch as one padded batch
+
+        Runs on the vocoder thread; on a GPU, on its own stream so that it
+        overlaps with sampling of the next batch. Returns the waveforms and
+        the seconds spent.
+        """
+        import torch
+        from torch.nn.utils.rnn import pad_sequence
+
+        start = time.perf_counter()
+        items, sampled, lens, duration = batch.items, batch.sampled, batch.lens, batch.duration
+        stream = self._vocoder_stream()
+        with torch.inference_mode(), (torch.cuda.stream(stream) if stream is not None else nullcontext()):
+            if stream is not None:
+                stream.wait_event(batch.ready)
+                # The sampler's allocations must not be reused before this stream is done with them
+                sampled.record_stream(stream)
+            gen_frames = (duration - lens).tolist()
+            generated = pad_sequence(
+                [sampled[i, lens[i]:duration[i]] for i in range(len(items))], batch_first=True
+            ).permute(0, 2, 1)
+            if self.mel_spec_type == "vocos":
+                waves = self.vocoder.decode(generated)
+            else:
+                waves = self.vocoder(generated)
+            waves = waves.reshape(len(items), -1)
+
+            results = []
+            for i, (state, _) in enumerate(items):
+                wave = waves[i, :gen_frames[i] * self.hop_length]
+                rms = state["meta"]["rms"]
+                if rms < TARGET_RMS:
+                    wave = wave * rms / TARGET_RMS
+                results.append(wave.cpu().numpy())
+        return results, time.perf_counter() - start
+
+    def _vocoder_stream(self):
+        import torch
+
+        if not str(self.device).startswith("cuda"):
+            return None
+        if self._stream is None:
+            self._stream = torch.cuda.Stream()
+        return self._stream
+
+    def _synchronize(self):
+        """Wait for this thread's queued GPU work so stage timings are attributed correctly"""
+        import torch
+
+        if str(self.device).startswith("cuda"):
+            torch.cuda.current_stream().synchronize()
+
+    def _remove_silence(self, wave):
+        """Apply F5-TTS silence removal (which works on files) to an in-memory waveform"""
+        import soundfile as sf
+        from f5_tts.infer.utils_infer import remove_silence_for_generated_wav
+
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            temp_path = f.name
+        try:
+            sf.write(temp_path, wave, self.sample_rate)
+            remove_silence_for_generated_wav(temp_path)
+            wave, _ = sf.read(temp_path, dtype="float32")
+        finally:
+            os.remove(temp_path)
+        return wave
+
+    def _advance(self, state, send):
+        """Emit whatever a job can emit now that another of its batches is done
+
+        Streaming jobs get each sentence batch in order as soon as it is
+        available (speed and cross-fade are then left to the caller); other
+        jobs get the cross-faded, speed-adjusted waveform once all batches
+        are done.
+        """
+        job = state["job"]
+        total = len(state["texts"])
+
+        timings = state["timings"]
+
+        if job.get("stream"):
+            waves = state["waves"]
+            while state["next_chunk"] in waves:
+                wave = waves.pop(state["next_chunk"])
+                if job["remove_silence"]:
+                    start = time.perf_counter()
+                    wave = self._remove_silence(wave)
+                    timings["postprocess"] = timings.get("postprocess", 0.0) + time.perf_counter() - start
+                state["samples"] += len(wave)
+                state["next_chunk"] += 1
+                send("chunk", job["job_id"], wave)
+            if state["next_chunk"] == total:
+                send("result", job["job_id"], {
+                    "seed": job["seed"],
+                    "sample_rate": self.sample_rate,
+                    "duration": state["samples"] / self.sample_rate,
+                    "batches": total,
+                    "timings": timings,
+                })
+            return
+
+        if len(state["waves"]) < total:
+            return
+        start = time.perf_counter()
+        waves = [state["waves"][index] for index in range(total)]
+        crossfade = job.get("crossfade_duration", CROSSFADE_DURATION)
+        wav = crossfade_concat(waves, int(crossfade * self.sample_rate))
+        if job["remove_silence"]:
+            wav = self._remove_silence(wav)
+        # Speed change happens in memory, after silence removal like the old ffmpeg pass
+        speed = job.get("speed", 1.0)
+        if speed != 1.0:
+            wav = time_stretch(wav, speed, self.sample_rate)
+        timings["postprocess"] = time.perf_counter() - start
+
+        send("result", job["job_id"], {
+            "audio": wav,
+            "seed": job["seed"],
+            "sample_rate": self.sample_rate,
+            "duration": len(wav) / self.sample_rate,
+            "batches": total,
+            "timings": timings,
+        })
+
+    def synthesize_batch(self, jobs, send, max_batch_size, is_cancelled=None):
+        """Run several synthesis jobs, sampling their sentence batches together
+
+        Sentence batches of all jobs are sampled up to ``max_batch_size`` at a
+        time, first sentences first so that streaming jobs start early.
+        ``send(kind, job_id, payload)`` reports chunks, results and errors
+        per job. Jobs for which ``is_cancelled(job)`` turns True are dropped
+        without a reply (the parent has already failed them): their remaining
+        sentence batches are skipped, and a sentence batch whose jobs are all
+        cancelled is abandoned mid-sampling.
+
+        Sampling runs on the calling thread; vocoding and post-processing
+        run on threads of their own, fed through queues of at most
+        ``PIPELINE_DEPTH`` batches, so one sentence batch is vocoded and
+        another post-processed while the next is being sampled. ``send`` is
+        only ever called by one thread at a time. Returns the number of
+        sampler calls, sampled items and abandoned sampler calls, the busy
+        seconds of every pipeline stage and the wall time of the batch.
+        """
+        if is_cancelled is None:
+            is_cancelled = lambda job: False
+
+        batch_start = time.perf_counter()
+        stage_busy = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        send_lock = threading.Lock()
+
+        def send_locked(kind, job_id, payload):
+            with send_lock:
+                send(kind, job_id, payload)
+
+        def fail(state, e):
+            with send_lock:
+                if state["failed"]:
+                    return
+                state["failed"] = True
+                send("error", state["job"]["job_id"], f"{type(e).__name__}: {e}")
+
+        def live(state):
+            return not state["failed"] and not is_cancelled(state["job"])
+
+        states = []
+        for job in jobs:
+            if is_cancelled(job):
+                continue
+            try:
+                if job.get("features_only"):
+                    start = time.perf_counter()
+                    mel, _ = self.load_features(job)
+                    send("result", job["job_id"], {
+                        "frames": int(mel.shape[0]),
+                        "timings": {"features": time.perf_counter() - start},
+                    })
+                    continue
+                states.append(self._prepare(job))
+            except Exception as e:
+                send("error", job["job_id"], f"{type(e).__name__}: {e}")
+        stage_busy["prepare"] = time.perf_counter() - batch_start
+        stats = {"sampler_calls": 0, "items": 0, "aborted_calls": 0}
+        if not states:
+            return dict(stats, stage_busy=stage_busy, wall=time.perf_counter() - batch_start)
+
+        items = sorted(
+            ((index, len(state["texts"][index]), n) for n, state in enumerate(states)
+             for index in range(len(state["texts"]))),
+        )
+        items = [(states[n], index) for index, _, n in items]
+        nfe_steps = states[0]["job"].get("nfe_steps", NFE_STEPS)
+
+        to_vocoder = queue.Queue(maxsize=PIPELINE_DEPTH)
+        to_postprocess = queue.Queue(maxsize=PIPELINE_DEPTH)
+
+        def vocode_stage():
+            try:
+                while (batch := to_vocoder.get()) is not None:
+                    if not any(live(state) for state, _ in batch.items):
+                        continue
+                    try:
+                        waves, seconds = self._vocode(batch)
+                    except Exception as e:
+                        for state, _ in batch.items:
+                            fail(state, e)
+                        continue
+                    stage_busy["vocoding"] += seconds
+                    # Every job in the group waited for the whole batch
+                    for state in {id(state): state for state, _ in batch.items}.values():
+                        state["timings"]["vocoding"] = state["timings"].get("vocoding", 0.0) + seconds
+                    to_postprocess.put(list(zip(batch.items, waves)))
+            finally:
+                to_postprocess.put(None)
+
+        def postprocess_stage():
+            while (done := to_postprocess.get()) is not None:
+                start = time.perf_counter()
+                for (state, index), wave in done:
+                    if not live(state):
+                        continue
+                    state["waves"][index] = wave
+                    try:
+                        self._advance(state, send_locked)
+                    except Exception as e:
+                        fail(state, e)
+                stage_busy["postprocess"] += time.perf_counter() - start
+
+        threads = [
+            threading.Thread(target=vocode_stage, name="tts-vocoder", daemon=True),
+            threading.Thread(target=postprocess_stage, name="tts-postprocess", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for start in range(0, len(items), max_batch_size):
+                group = [(state, index) for state, index in items[start:start + max_batch_size] if live(state)]
+                if not group:
+                    continue
+                try:
+                    batch = self._sample_batch(
+                        group, nfe_steps,
+                        should_stop=lambda group=group: all(is_cancelled(state["job"]) for state, _ in group)
+                    )
+                except _BatchCancelled:
+                    stats["aborted_calls"] += 1
+                    continue
+                except Exception as e:
+                    for state, _ in group:
+                        fail(state, e)
+                    continue
+                stats["sampler_calls"] += 1
+                stats["items"] += len(group)
+                stage_busy["sampling"] += batch.seconds
+                for state in {id(state): state for state, _ in group}.values():
+                    state["timings"]["sampling"] = state["timings"].get("sampling", 0.0) + batch.seconds
+                # Blocks while the vocoder is PIPELINE_DEPTH batches behind
+                to_vocoder.put(batch)
+        finally:
+            to_vocoder.put(None)
+            for thread in threads:
+                thread.join()
+
+        return dict(stats, stage_busy=stage_busy, wall=time.perf_counter() - batch_start)
+
+
+def _warm_up(synthesizer, job, max_batch_size):
+    """Synthesize ``job`` once so that kernels, caches and voice features are ready; returns an error or None"""
+    errors = []
+
+    def record(kind, job_id, payload):
+        if kind == "error":
+            errors.append(payload)
+
+    try:
+        synthesizer.synthesize_batch([dict(job, job_id=-1, stream=False)], record, max_batch_size)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    return errors[0] if errors else None
+
+
+def _set_threads(intra_op_threads, inter_op_threads):
+    """Limit torch's thread pools; must run before any parallel work in the process"""
+    import torch
+
+    torch.set_num_threads(intra_op_threads)
+    torch.set_num_interop_threads(inter_op_threads)
+
+
+def _worker_main(conn, worker_id, model_name, max_batch_size, cancel_flags, warmup_job=None, mode="auto",
+                 threads=None):
+    """Worker process entry point: load the model once, then serve job batches
+
+    ``cancel_flags`` is shared with the parent; the flag at a job's batch
+    slot is set once the job is cancelled. With ``warmup_job``, the worker
+    synthesizes it before reporting ready, so its first real job does not
+    pay for lazy initialization. ``mode`` is one of ``WORKER_MODES`` and
+    ``threads`` the (intra-op, inter-op) thread budget.
+    """
+    start = time.perf_counter()
+    try:
+        if threads is not None:
+            _set_threads(*threads)
+        synthesizer = _Synthesizer(model_name, mode)
+    except Exception as e:
+        conn.send(("failed", None, f"{type(e).__name__}: {e}"))
+        conn.close()
+        return
+    ready = {
+        "device": str(synthesizer.device),
+        "mode": mode,
+        "threads": threads,
+        "load_seconds": time.perf_counter() - start,
+    }
+
+    if warmup_job is not None:
+        start = time.perf_counter()
+        ready["warmup_error"] = _warm_up(synthesizer, warmup_job, max_batch_size)
+        ready["warmup_seconds"] = time.perf_counter() - start
+
+    conn.send(("ready", None, ready))
+
+    def send(kind, job_id, payload):
+        conn.send((kind, job_id, payload))
+
+    def is_cancelled(job):
+        return bool(cancel_flags[job["slot"]])
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        kind, _, payload = message
+        if kind == "stop":
+            break
+        if kind != "synthesize_batch":
+            conn.send(("error", None, f"Unknown message type: {kind}"))
+            continue
+
+        stats = {"sampler_calls": 0, "items": 0, "aborted_calls": 0}
+        try:
+            stats = synthesizer.synthesize_batch(payload, send, max_batch_size, is_cancelled)
+        except Exception as e:
+            # Jobs that already finished ignore the extra error
+            for job in payload:
+                send("error", job["job_id"], f"{type(e).__name__}: {e}")
+        conn.send(("batch_done", None, stats))
+
+    conn.close()
+
+
+class _Job:
+    """A synthesis job waiting for, or running in, a worker batch"""
+
+    def __init__(self, job_id, request_id, payload, on_dispatch, on_chunk):
+        self.job_id = job_id
+        self.request_id = request_id
+        self.payload = payload
+        self.on_dispatch = on_dispatch
+        # Callbacks run in the submitting thread's context (e.g. its request log)
+        self.context = contextvars.copy_context()
+        self.on_chunk = on_chunk
+        self.enqueued_at = time.monotonic()
+        self.dispatched_at = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.worker = None
+        self.cancelled = False
+
+
+class _Worker:
+    """Parent-side handle for one engine worker process"""
+
+    def __init__(self, worker_id, process, conn, cancel_flags, mode="auto"):
+        self.worker_id = worker_id
+        self.mode = mode
+        self.process = process
+        self.conn = conn
+        self.cancel_flags = cancel_flags
+        self.batch = {}
+
+
+class TTSEngine:
+    """Pool of resident F5-TTS worker processes
+
+    Jobs are not sent to workers one by one: a dispatcher thread collects
+    the jobs that arrive within ``max_batch_wait`` seconds of each other (up
+    to ``max_batch_size``) and hands them to an idle worker as one batch,
+    which samples and vocodes their sentence batches together.
+
+    ``worker_modes`` lists the mode of each worker (see ``WORKER_MODES``);
+    workers without an entry use the last one. Each worker gets
+    ``intra_op_threads`` torch threads (by default the cores divided among
+    the workers) and ``inter_op_threads`` inter-op threads.
+    """
+
+    def __init__(self, num_workers=1, model_name="F5TTS_v1_Base", max_batch_size=1, max_batch_wait=0.0,
+                 worker_modes=None, intra_op_threads=None, inter_op_threads=1):
+        self.num_workers = max(1, num_workers)
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_wait = max(0.0, max_batch_wait)
+        worker_modes = list(worker_modes or ["auto"])
+        for mode in worker_modes:
+            if mode not in WORKER_MODES:
+                raise ValueError(f"Unknown worker mode {mode!r}, expected one of {', '.join(WORKER_MODES)}")
+        self.worker_modes = [worker_modes[min(i, len(worker_modes) - 1)] for i in range(self.num_workers)]
+        if intra_op_threads is None:
+            intra_op_threads = available_cores() // self.num_workers
+        self.threads = (max(1, intra_op_threads), max(1, inter_op_threads))
+        self._ctx = multiprocessing.get_context("spawn")
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._idle = collections.deque()
+        self._workers = {}
+        self._ready = set()
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._load_error = None
+        self._stopped = False
+        self._dispatcher = None
+        self._warmup_job = None
+
+        # Batch fill metrics
+        self._batches = 0
+        self._batched_jobs = 0
+        self._batch_sizes = collections.Counter()
+        self._sampler_calls = 0
+        self._sampled_items = 0
+        self._aborted_calls = 0
+        self._cancelled_jobs = 0
+        self._stage_busy = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self._pipeline_wall = 0.0
+
+    def start(self, warmup_job=None):
+        """Spawn all worker processes; models load (and warm up with ``warmup_job``) in the background"""
+        self._warmup_job = warmup_job
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="f5-tts-dispatcher", daemon=True)
+        self._dispatcher.start()
+        logger.info(f"TTS engine starting {self.num_workers} worker(s) with model {self.model_name} "
+                    f"({', '.join(self.worker_modes)}; {self.threads[0]} intra-op and {self.threads[1]} inter-op "
+                    f"thread(s) each), batches of up to {self.max_batch_size} job(s) within "
+                    f"{self.max_batch_wait * 1000:.0f}ms")
+
+    def stop(self):
+        """Stop all worker processes; jobs that have not been dispatched fail"""
+        with self._cond:
+            self._stopped = True
+            pending = list(self._pending)
+            self._pending.clear()
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._cond.notify_all()
+        for job in pending:
+            self._finish(job, error=EngineError("TTS engine stopped"))
+        for worker in workers:
+            try:
+                worker.conn.send(("stop", None, None))
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+        logger.info("TTS engine stopped")
+
+    def _spawn(self, worker_id):
+        parent_conn, child_conn = self._ctx.Pipe()
+        # Written by the parent only, under self._cond; read by the worker between sampler steps
+        cancel_flags = self._ctx.Array("b", self.max_batch_size, lock=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                child_conn, worker_id, self.model_name, self.max_batch_size, cancel_flags, self._warmup_job,
+                self.worker_modes[worker_id], self.threads
+            ),
+            name=f"f5-tts-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(worker_id, process, parent_conn, cancel_flags, self.worker_modes[worker_id])
+        with self._cond:
+            self._workers[worker_id] = worker
+        threading.Thread(target=self._serve_worker, args=(worker,), daemon=True).start()
+
+    def _serve_worker(self, worker):
+        """Wait for a worker to load its model, then relay its messages until it exits"""
+        load_start = time.time()
+        try:
+            kind, _, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            kind, payload = "failed", "worker exited during model loading"
+
+        if kind != "ready":
+            logger.error(f"TTS worker {worker.worker_id} failed to load model: {payload}")
+            with self._cond:
+                self._load_error = payload
+                # Nothing will ever pick up queued jobs if no worker is ready
+                pending = [] if self._ready else list(self._pending)
+                for job in pending:
+                    self._pending.remove(job)
+                self._cond.notify_all()
+            for job in pending:
+                self._finish(job, error=EngineError(f"TTS model failed to load: {payload}"))
+            return
+
+        phases = f"model load {payload['load_seconds']:.2f}s"
+        if "warmup_seconds" in payload:
+            phases += f", warmup {payload['warmup_seconds']:.2f}s"
+        logger.info(f"TTS worker {worker.worker_id} (PID {worker.process.pid}) ready on {payload['device']} "
+                    f"in {payload['mode']} mode after {time.time() - load_start:.2f}s ({phases})")
+        if payload.get("warmup_error"):
+            logger.warning(f"TTS worker {worker.worker_id} warmup failed: {payload['warmup_error']}")
+        with self._cond:
+            self._ready.add(worker.worker_id)
+            self._idle.append(worker)
+            self._cond.notify_all()
+
+        while True:
+            try:
+                kind, job_id, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if kind == "batch_done":
+                with self._cond:
+                    self._sampler_calls += payload["sampler_calls"]
+                    self._sampled_items += payload["items"]
+                    self._aborted_calls += payload["aborted_calls"]
+                    for stage, seconds in payload.get("stage_busy", {}).items():
+                        self._stage_busy[stage] += seconds
+                    self._pipeline_wall += payload.get("wall", 0.0)
+                    leftover = list(worker.batch.values())
+                    worker.batch = {}
+                    self._idle.append(worker)
+                    self._cond.notify_all()
+                for job in leftover:
+                    self._finish(job, error=EngineError(f"TTS worker {worker.worker_id} returned no result"))
+                continue
+
+            with self._cond:
+                job = worker.batch.get(job_id)
+            if job is None:
+                # Cancelled jobs are detached from the batch; their output is dropped
+                continue
+            if kind == "chunk":
+                job.on_chunk(payload)
+            elif kind == "result":
+                self._finish(job, result=payload)
+            else:
+                self._finish(job, error=EngineError(payload))
+
+        with self._cond:
+            self._ready.discard(worker.worker_id)
+            jobs = list(worker.batch.values())
+            worker.batch = {}
+        for job in jobs:
+            if job.cancelled:
+                self._finish(job, error=EngineCancelled(f"TTS job {job.request_id} was cancelled"))
+            else:
+                self._finish(job, error=EngineError(f"TTS worker {worker.worker_id} exited unexpectedly"))
+        self._respawn(worker)
+
+    def _respawn(self, worker):
+        """Replace a worker that was killed or crashed"""
+        worker.conn.close()
+        worker.process.join(timeout=2)
+        if not self._stopped:
+            self._spawn(worker.worker_id)
+
+    def _finish(self, job, result=None, error=None):
+        with self._cond:
+            if job.done.is_set():
+                return
+            if job.worker is not None:
+                job.worker.batch.pop(job.job_id, None)
+            job.result = result
+            job.error = error
+            job.done.set()
+
+    def _compatible(self):
+        """Pending jobs that can share a batch with the oldest one"""
+        steps = self._pending[0].payload.get("nfe_steps", NFE_STEPS)
+        return [job for job in self._pending if job.payload.get("nfe_steps", NFE_STEPS) == steps]
+
+    def _dispatch_loop(self):
+        """Group pending jobs into batches and hand them to idle workers"""
+        while True:
+            with self._cond:
+                while not self._stopped and not (self._pending and self._idle):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+
+                # Hold the batch open briefly so that concurrent requests can join it
+                deadline = self._pending[0].enqueued_at + self.max_batch_wait
+                while not self._stopped and self._pending and len(self._compatible()) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopped:
+                    return
+                if not self._pending or not self._idle:
+                    continue
+
+                batch = self._compatible()[:self.max_batch_size]
+                worker = self._idle.popleft()
+                for slot, job in enumerate(batch):
+                    self._pending.remove(job)
+                    job.worker = worker
+                    job.dispatched_at = time.monotonic()
+                    job.payload["slot"] = slot
+                    worker.cancel_flags[slot] = 0
+                worker.batch = {job.job_id: job for job in batch}
+                self._batches += 1
+                self._batched_jobs += len(batch)
+                self._batch_sizes[len(batch)] += 1
+
+            for job in batch:
+                if job.on_dispatch is not None:
+                    job.context.run(job.on_dispatch, worker.process)
+            try:
+                worker.conn.send(("synthesize_batch", None, [job.payload for job in batch]))
+            except (BrokenPipeError, OSError):
+                # The worker's relay thread sees it exit and fails the batch
+                pass
+
+    def synthesize(self, request_id, job, on_dispatch=None, on_chunk=None):
+        """Run one synthesis job and wait for the result
+
+        ``job`` holds ref_audio, ref_text, gen_text, remove_silence, speed,
+        seed and optionally nfe_steps, crossfade_duration, features_path
+        (the voice registry file) and processed_ref_audio (the clipped
+        reference audio, if already known). The result carries the generated waveform
+        in ``audio``.
+        ``on_dispatch`` is called with the worker process once the
+        job has been handed to a worker. With ``on_chunk``, the job runs in
+        streaming mode: each sentence batch's waveform is passed to it as it
+        arrives instead.
+        """
+        job_id = next(self._job_ids)
+        payload = dict(job, job_id=job_id, stream=on_chunk is not None)
+        entry = _Job(job_id, request_id, payload, on_dispatch, on_chunk)
+
+        with self._cond:
+            if self._stopped:
+                raise EngineError("TTS engine stopped")
+            if self._load_error is not None and not self._ready:
+                raise EngineError(f"TTS model failed to load: {self._load_error}")
+            if request_id in self._jobs:
+                # Cancellation and status go by request ID; a second job would orphan the first
+                raise EngineError(f"TTS job {request_id} is already running")
+            self._jobs[request_id] = entry
+            self._pending.append(entry)
+            self._cond.notify_all()
+
+        try:
+            entry.done.wait()
+        finally:
+            with self._cond:
+                if self._jobs.get(request_id) is entry:
+                    del self._jobs[request_id]
+
+        if entry.error is not None:
+            raise entry.error
+        result = entry.result
+        # Time spent waiting for an idle worker and for the batch to fill
+        result.setdefault("timings", {})["batch_wait"] = entry.dispatched_at - entry.enqueued_at
+        return result
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded (and warmed up) its model
+
+        Returns False if a worker failed to load, the engine stopped or
+        ``timeout`` seconds passed first.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: len(self._ready) == self.num_workers or self._load_error is not None or self._stopped, timeout
+            )
+            return len(self._ready) == self.num_workers
+
+    def prepare_voice(self, request_id, ref_audio, features_path, ref_text=""):
+        """Compute and store a voice's conditioning features on a worker without synthesizing"""
+        job = {"ref_audio": ref_audio, "ref_text": ref_text, "features_path": features_path, "features_only": True}
+        return self.synthesize(request_id, job)
+
+    def cancel(self, request_id):
+        """Cancel a job
+
+        A job that is still waiting for a batch is simply dropped. A running
+        job is failed right away and its cancellation flag set: the worker
+        skips its remaining sentence batches, abandons the current one within
+        a sampler step if no other job shares it, and stays up.
+        """
+        with self._cond:
+            job = self._jobs.get(request_id)
+            if job is None or job.done.is_set():
+                return False
+            job.cancelled = True
+            self._cancelled_jobs += 1
+            if job.worker is None:
+                self._pending.remove(job)
+            else:
+                job.worker.cancel_flags[job.payload["slot"]] = 1
+
+        self._finish(job, error=EngineCancelled(f"TTS job {request_id} was cancelled"))
+        logger.info(f"Cancelled TTS job for request {request_id}")
+        return True
+
+    def stats(self):
+        """Worker, queue and batch fill metrics"""
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "worker_modes": list(self.worker_modes),
+                "threads_per_worker": {"intra_op": self.threads[0], "inter_op": self.threads[1]},
+                "ready_workers": len(self._ready),
+                "idle_workers": len(self._idle),
+                "pending_jobs": len(self._pending),
+                "max_batch_size": self.max_batch_size,
+                "max_batch_wait_ms": self.max_batch_wait * 1000,
+                "batches": self._batches,
+                "batched_jobs": self._batched_jobs,
+                "avg_batch_size": self._batched_jobs / self._batches if self._batches else 0.0,
+                "batch_fill": self._batched_jobs / (self._batches * self.max_batch_size) if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "sampler_calls": self._sampler_calls,
+                "avg_sampler_batch": self._sampled_items / self._sampler_calls if self._sampler_calls else 0.0,
+                "cancelled_jobs": self._cancelled_jobs,
+                "aborted_sampler_calls": self._aborted_calls,
+                "pipeline": {
+                    "stage_busy_seconds": dict(self._stage_busy),
+                    # Share of worker batch time each stage was busy; the highest one is the bottleneck
+                    "stage_occupancy": {
+                        stage: seconds / self._pipeline_wall if self._pipeline_wall else 0.0
+                        for stage, seconds in self._stage_busy.items()
+                    },
+                },
+            }
@@ -0,0 +1,132 @@
+"""Ingest of uploaded reference audio.
+
+Uploads are copied to a staging file chunk by chunk, with the size limit
+enforced while the bytes arrive. A background task then converts the upload
+into the canonical reference format: 16-bit mono PCM WAV at the model's
+sample rate, clipped to the reference length the model actually uses (the
+same silence-aware clipping F5-TTS applies at inference time). The same task
+transcribes the voice and precomputes its conditioning features, so the
+first synthesis request for a new voice does no more work than later ones.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from .engine import SAMPLE_RATE, clip_reference_audio
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+INGEST_PROCESSING = "processing"
+INGEST_READY = "ready"
+INGEST_FAILED = "failed"
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds its size limit"""
+
+
+async def save_upload(upload, path, max_size, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy an ``UploadFile`` to ``path`` in chunks and return its size
+
+    Raises ``UploadTooLarge`` (after removing the partial file) as soon as
+    more than ``max_size`` bytes have been read.
+    """
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return size
+
+
+def transcode_reference(source_path, target_path, sample_rate=SAMPLE_RATE):
+    """Decode, clip, downmix and resample reference audio into a 16-bit PCM WAV
+
+    Returns the duration of the result in seconds.
+    """
+    import soundfile as sf
+    import torch
+    import torchaudio
+
+    audio, sr = sf.read(clip_reference_audio(source_path), dtype="float32", always_2d=True)
+    audio = torch.from_numpy(audio.mean(axis=1))
+    if sr != sample_rate:
+        audio = torchaudio.functional.resample(audio, sr, sample_rate)
+
+    # Write next to the target first so a half-written file is never picked up
+    tmp_path = target_path + ".tmp"
+    sf.write(tmp_path, audio.numpy(), sample_rate, subtype="PCM_16", format="WAV")
+    os.replace(tmp_path, target_path)
+    return len(audio) / sample_rate
+
+
+class VoiceIngest:
+    """Background ingest tasks of uploaded voices, keyed by ``folder/filename``"""
+
+    def __init__(self):
+        self._tasks = {}
+
+    def start(self, key, coro):
+        """Run ``coro`` as the ingest task of ``key``"""
+        entry = {"status": INGEST_PROCESSING, "error": None, "started": time.time(), "finished": None}
+        task = asyncio.create_task(coro)
+        entry["task"] = task
+        self._tasks[key] = entry
+
+        def done(task):
+            entry["finished"] = time.time()
+            if task.cancelled():
+                entry["status"], entry["error"] = INGEST_FAILED, "Ingest was cancelled"
+            elif task.exception() is not None:
+                entry["status"], entry["error"] = INGEST_FAILED, str(task.exception())
+                logger.error(f"Ingest of {key} failed: {task.exception()}")
+            else:
+                entry["status"] = INGEST_READY
+                logger.info(f"Ingest of {key} finished in {entry['finished'] - entry['started']:.2f}s")
+
+        task.add_done_callback(done)
+
+    def is_active(self, key):
+        entry = self._tasks.get(key)
+        return entry is not None and entry["status"] == INGEST_PROCESSING
+
+    def status(self, key):
+        """Ingest status of ``key``, or None if it was not uploaded during this run"""
+        entry = self._tasks.get(key)
+        if entry is None:
+            return None
+        status = {"status": entry["status"]}
+        if entry["error"]:
+            status["error"] = entry["error"]
+        if entry["finished"]:
+            status["ingest_time"] = entry["finished"] - entry["started"]
+        return status
+
+    async def wait(self, key):
+        """Wait for a pending ingest of ``key``; ingest failures are left to the caller to notice"""
+        entry = self._tasks.get(key)
+        if entry is None or entry["status"] != INGEST_PROCESSING:
+            return
+        try:
+            await asyncio.shield(entry["task"])
+        except Exception:
+            pass
+
+    def forget(self, key):
+        self._tasks.pop(key, None)
@@ -0,0 +1,315 @@
+"""Bounded asynchronous job queue for TTS synthesis.
+
+Synthesis is blocking (reference preprocessing, engine round-trip, speed
+change), so jobs run on a thread pool instead of the event loop. At most
+``max_concurrency`` jobs run at once, and once ``max_queue_size`` jobs are
+waiting new submissions are rejected.
+
+Waiting jobs are not served in arrival order. Each job carries an estimated
+cost (see ``job_cost``) and the client it belongs to:
+
+* Clients share the slots fairly: the next slot goes to the waiting client
+  that has used the least synthesis time so far, so a bulk client cannot
+  hold every slot while an interactive one waits.
+* Within a client, the shortest expected job goes first. Waiting lowers a
+  job's effective cost by ``aging`` seconds per second, so long jobs are
+  delayed by short ones but never starved.
+* Short jobs have a fast lane: ``fast_lane_slots`` slots are kept free of
+  jobs expected to take longer than ``fast_lane_seconds``, so a preview
+  never waits for a long document to finish.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Text duration per character, used when a voice's reference text is unknown
+CHARS_PER_SECOND = 15
+# Audio F5-TTS generates per sentence batch, reference included (infer_process splits the text for this)
+BATCH_SECONDS = 22
+
+
+def job_cost(gen_chars, nfe_steps, ref_seconds, ref_chars=None):
+    """Estimated sampling work of a job, in sampler steps times seconds of audio
+
+    The text is split into sentence batches that, together with the
+    reference audio conditioning each of them, fill about ``BATCH_SECONDS``
+    of audio, and every batch runs ``nfe_steps`` model passes over all of
+    it. The generated duration follows the reference's speaking rate when
+    its text length ``ref_chars`` is known. (Speed changes are applied
+    after sampling and cost nothing here.)
+    """
+    if ref_chars:
+        gen_seconds = ref_seconds * gen_chars / ref_chars
+    else:
+        gen_seconds = gen_chars / CHARS_PER_SECOND
+    batches = max(1, math.ceil(gen_seconds / max(1.0, BATCH_SECONDS - ref_seconds)))
+    return nfe_steps * (gen_seconds + batches * ref_seconds)
+
+
+class QueueFullError(Exception):
+    """Raised when the queue has no room for another job"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"TTS queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    """Raised to a waiting job that was cancelled before it started"""
+
+
+class DuplicateJobError(Exception):
+    """Raised when a job is submitted under the request ID of one still waiting or running"""
+
+
+class _Entry:
+    """A job waiting for or holding a slot"""
+
+    def __init__(self, request_id, client, cost, sequence):
+        self.request_id = request_id
+        self.client = client
+        self.cost = cost
+        self.sequence = sequence
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.seconds = None
+        self.long = False
+        self.slot = None
+
+
+class JobQueue:
+    """Fair-share, shortest-job-first queue with a concurrency limit, driven from the event loop thread"""
+
+    # Used for Retry-After and wait estimates until a job has completed
+    DEFAULT_JOB_SECONDS = 5.0
+    # Seconds per unit of job_cost until a costed job has completed
+    DEFAULT_SECONDS_PER_COST = 0.01
+
+    def __init__(self, max_concurrency=1, max_queue_size=32, aging=1.0, fast_lane_seconds=5.0, fast_lane_slots=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max(0, max_queue_size)
+        self.aging = max(0.0, aging)
+        self.fast_lane_seconds = fast_lane_seconds
+        if fast_lane_slots is None:
+            fast_lane_slots = 1 if self.max_concurrency > 1 else 0
+        # At least one slot stays open to long jobs
+        self.fast_lane_slots = min(max(0, fast_lane_slots), self.max_concurrency - 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="tts-job")
+        self._waiting = {}
+        self._running = {}
+        self._sequence = itertools.count()
+        # Synthesis seconds of the finished jobs of each client with jobs waiting or running
+        self._served = {}
+        self._avg_job_seconds = None
+        self._seconds_per_cost = None
+
+    @property
+    def depth(self):
+        """Number of jobs waiting for a slot"""
+        return len(self._waiting)
+
+    @property
+    def in_flight(self):
+        """Number of jobs currently holding a slot"""
+        return len(self._running)
+
+    def active(self, request_id):
+        """Whether a job with this request ID is waiting or running"""
+        return request_id in self._waiting or request_id in self._running
+
+    def _job_seconds(self):
+        return self._avg_job_seconds or self.DEFAULT_JOB_SECONDS
+
+    def expected_seconds(self, cost):
+        """Expected run time of a job of ``cost`` (None: an average job)"""
+        if cost is None:
+            return self._job_seconds()
+        return cost * (self._seconds_per_cost or self.DEFAULT_SECONDS_PER_COST)
+
+    def estimate_wait(self, position):
+        """Estimated seconds until the job at 1-based ``position`` starts, assuming average jobs"""
+        rounds = math.ceil(position / self.max_concurrency)
+        return rounds * self._job_seconds()
+
+    async def run(self, request_id, fn, *args, cost=None, client=None):
+        """Run ``fn(*args)`` on the pool once the scheduler gives it a slot and return its result
+
+        ``cost`` is the job's ``job_cost`` estimate (None if unknown) and
+        ``client`` the key its fair share is accounted under. Request IDs
+        identify jobs for cancellation and status, so a second job under the
+        ID of an active one raises ``DuplicateJobError``.
+        """
+        loop = asyncio.get_running_loop()
+        if self.active(request_id):
+            raise DuplicateJobError(f"TTS job {request_id} is already queued or running")
+        if len(self._waiting) >= self.max_queue_size and (
+            self._waiting or len(self._running) >= self.max_concurrency
+        ):
+            retry_after = max(1, math.ceil(self.estimate_wait(len(self._waiting) + 1)))
+            raise QueueFullError(retry_after)
+
+        entry = _Entry(request_id, client, cost, next(self._sequence))
+        entry.slot = loop.create_future()
+        if not self._active(client):
+            # A client returning from idle starts level with the others instead of with banked credit
+            self._served[client] = min(self._served.values(), default=0.0)
+        self._waiting[request_id] = entry
+        self._dispatch()
+        try:
+            await entry.slot
+        except asyncio.CancelledError:
+            if self._waiting.get(request_id) is entry:
+                del self._waiting[request_id]
+            elif self._running.get(request_id) is entry:
+                # The slot handed to us just before we were cancelled goes to the next job
+                del self._running[request_id]
+                self._dispatch()
+            self._release(client)
+            raise
+
+        # Like asyncio.to_thread, the job sees the caller's context variables (e.g. the request log)
+        future = self._executor.submit(contextvars.copy_context().run, fn, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._finish, entry))
+        return await asyncio.wrap_future(future)
+
+    def _active(self, client):
+        return any(e.client == client for e in itertools.chain(self._waiting.values(), self._running.values()))
+
+    def _release(self, client):
+        if not self._active(client):
+            self._served.pop(client, None)
+
+    def _finish(self, entry):
+        if self._running.get(entry.request_id) is entry:
+            del self._running[entry.request_id]
+
+        elapsed = time.time() - entry.started_at
+        if self._avg_job_seconds is None:
+            self._avg_job_seconds = elapsed
+        else:
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+        if entry.cost:
+            rate = elapsed / entry.cost
+            if self._seconds_per_cost is None:
+                self._seconds_per_cost = rate
+            else:
+                self._seconds_per_cost = 0.8 * self._seconds_per_cost + 0.2 * rate
+
+        if entry.client in self._served:
+            self._served[entry.client] += elapsed
+        self._release(entry.client)
+        self._dispatch()
+
+    def _is_long(self, entry):
+        return self.fast_lane_slots > 0 and self.expected_seconds(entry.cost) > self.fast_lane_seconds
+
+    def _usage(self):
+        """Synthesis seconds per client: finished jobs, plus the expected run time of running ones"""
+        usage = dict(self._served)
+        for entry in self._running.values():
+            usage[entry.client] = usage.get(entry.client, 0.0) + entry.seconds
+        return usage
+
+    def _pick(self, waiting, now, usage, long_running):
+        """The entry the next free slot goes to, or None if only long jobs wait and they may not start"""
+        long_allowed = long_running < self.max_concurrency - self.fast_lane_slots
+        best = None
+        for entry in waiting:
+            if not long_allowed and self._is_long(entry):
+                continue
+            # Fair share across clients first, then shortest aged expected run time, then arrival
+            key = (
+                usage.get(entry.client, 0.0),
+                self.expected_seconds(entry.cost) - self.aging * (now - entry.enqueued_at),
+                entry.sequence,
+            )
+            if best is None or key < best[0]:
+                best = (key, entry)
+        return best[1] if best is not None else None
+
+    def _dispatch(self):
+        """Hand free slots to waiting jobs in scheduling order"""
+        now = time.time()
+        while self._waiting and len(self._running) < self.max_concurrency:
+            long_running = sum(entry.long for entry in self._running.values())
+            entry = self._pick(self._waiting.values(), now, self._usage(), long_running)
+            if entry is None:
+                break
+            del self._waiting[entry.request_id]
+            entry.started_at = now
+            entry.seconds = self.expected_seconds(entry.cost)
+            entry.long = self._is_long(entry)
+            self._running[entry.request_id] = entry
+            entry.slot.set_result(None)
+
+    def _schedule(self):
+        """Simulated start order of the waiting jobs: request ID to estimated seconds until start"""
+        now = time.time()
+        usage = self._usage()
+        # (free at, holds a long job) per slot, in seconds from now
+        slots = [
+            (max(0.0, entry.seconds - (now - entry.started_at)), entry.long) for entry in self._running.values()
+        ]
+        slots += [(0.0, False)] * (self.max_concurrency - len(slots))
+        waiting = list(self._waiting.values())
+        starts = {}
+        while waiting:
+            slots.sort()
+            at, _ = slots[0]
+            long_running = sum(holds_long for free_at, holds_long in slots[1:] if free_at > at)
+            entry = self._pick(waiting, now + at, usage, long_running)
+            if entry is None:
+                # Only long jobs are left; wait for the next long job to finish
+                slots[0] = (min(free_at for free_at, holds_long in slots[1:] if holds_long and free_at > at), False)
+                continue
+            waiting.remove(entry)
+            seconds = self.expected_seconds(entry.cost)
+            usage[entry.client] = usage.get(entry.client, 0.0) + seconds
+            starts[entry.request_id] = at
+            slots[0] = (at + seconds, self._is_long(entry))
+        return starts
+
+    def cancel(self, request_id):
+        """Drop a job that is still waiting; returns False if it is not queued"""
+        entry = self._waiting.pop(request_id, None)
+        if entry is None:
+            return False
+        if not entry.slot.done():
+            entry.slot.set_exception(JobCancelled(f"TTS job {request_id} was cancelled while queued"))
+        self._release(entry.client)
+        return True
+
+    def status(self, request_id):
+        """Queue status for a job, or None if the queue does not know it"""
+        now = time.time()
+        if request_id in self._waiting:
+            entry = self._waiting[request_id]
+            starts = self._schedule()
+            position = sorted(starts, key=starts.get).index(request_id) + 1
+            return {
+                "state": "queued",
+                "queue_position": position,
+                "queue_length": len(self._waiting),
+                "wait_time": now - entry.enqueued_at,
+                "estimated_wait": starts[request_id],
+                "estimated_start": now + starts[request_id],
+                "estimated_duration": self.expected_seconds(entry.cost),
+            }
+        if request_id in self._running:
+            entry = self._running[request_id]
+            return {
+                "state": "running",
+                "queue_position": 0,
+                "queue_length": len(self._waiting),
+                "wait_time": entry.started_at - entry.enqueued_at,
+                "run_time": now - entry.started_at,
+                "estimated_duration": entry.seconds,
+            }
+        return None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,171 @@
+"""Non-blocking logging with one structured record per request.
+
+Log records are put on a queue by a ``QueueHandler`` and written by a
+``QueueListener`` thread, so request handlers and the event loop never wait
+for file or console I/O. The log file rotates by size and holds one JSON
+object per line.
+
+While a request is being handled, its INFO and DEBUG records (request
+parameters, reference text resolution, engine progress, ...) are held in a
+per-request buffer instead of being written. When the request finishes, a
+single summary record with its status, latency and stage timings is
+written; the buffered details follow it only if the request failed or was
+picked by the detail sampling rate. Warnings and errors are always written
+at once, tagged with the request ID.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from contextvars import ContextVar
+
+# Buffered log of the request being handled in the current task or job thread
+_current_request = ContextVar("request_log", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including the fields passed through ``extra``"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestLog:
+    """Detail records and summary fields of one request"""
+
+    def __init__(self, request_id, max_records=200):
+        self.request_id = request_id
+        self.max_records = max_records
+        self.records = []
+        self.dropped = 0
+        self.fields = {}
+
+    def add(self, record):
+        if len(self.records) < self.max_records:
+            self.records.append(record)
+        else:
+            self.dropped += 1
+
+
+class _RequestFilter(logging.Filter):
+    """Holds back the detail records of the current request and tags the others"""
+
+    def filter(self, record):
+        request_log = _current_request.get()
+        if request_log is None or getattr(record, "_replayed", False):
+            return True
+        if record.levelno < logging.WARNING:
+            request_log.add(record)
+            return False
+        record.request_id = request_log.request_id
+        return True
+
+
+class RequestLogger:
+    """Owns the logging pipeline and the per-request buffers
+
+    ``detail_sample_rate`` is the fraction of successful requests whose
+    detail records are written along with their summary.
+    """
+
+    def __init__(self, detail_sample_rate=0.0):
+        self.detail_sample_rate = detail_sample_rate
+        self.queue_handler = None
+        self.listener = None
+        self.logger = logging.getLogger("tts.requests")
+
+    def configure(self, path, level=logging.INFO, max_bytes=50 * 1024 * 1024, backup_count=5, json_file=True):
+        """Route the root logger through a queue to a rotating file and the console"""
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        text_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(JsonFormatter() if json_file else text_formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(text_formatter)
+
+        self.queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        self.queue_handler.addFilter(_RequestFilter())
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, file_handler, console_handler, respect_handler_level=True
+        )
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(level)
+        self.listener.start()
+
+    def stop(self):
+        """Write out everything still queued"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def start(self, request_id):
+        """Start buffering the detail records of a request in the current context"""
+        request_log = RequestLog(request_id)
+        _current_request.set(request_log)
+        return request_log
+
+    def annotate(self, **fields):
+        """Add fields to the summary record of the current request"""
+        request_log = _current_request.get()
+        if request_log is not None:
+            request_log.fields.update(fields)
+
+    def finish(self, request_id, endpoint, status_code, timings):
+        """Write the summary record of a request, followed by its details if it failed or was sampled"""
+        request_log = _current_request.get()
+        if request_log is not None and request_log.request_id != request_id:
+            request_log = None
+
+        failed = status_code >= 500
+        with_details = request_log is not None and (
+            failed or (self.detail_sample_rate > 0 and random.random() < self.detail_sample_rate)
+        )
+        summary = {
+            "request_id": request_id,
+            "endpoint": endpoint,
+            "status": status_code,
+            "duration_ms": round(timings["total"] * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timings["stages"].items()},
+        }
+        if request_log is not None:
+            summary.update(request_log.fields)
+        message = f"{endpoint} request {request_id} finished with status {status_code} in {summary['duration_ms']:.1f}ms"
+        self._write(logging.ERROR if failed else logging.INFO, message, summary)
+
+        if with_details:
+            for record in request_log.records:
+                record.request_id = request_id
+                record._replayed = True
+                self.queue_handler.handle(record)
+            if request_log.dropped:
+                self._write(logging.INFO, f"{request_log.dropped} more detail record(s) of request {request_id} dropped",
+                            {"request_id": request_id})
+        if request_log is not None:
+            _current_request.set(None)
+
+    def _write(self, level, message, fields):
+        record = self.logger.makeRecord(self.logger.name, level, __file__, 0, message, (), None, extra=fields)
+        record._replayed = True
+        self.logger.handle(record)
@@ -1,19 +1,50 @@
-import subprocess
-import logging
 import time
+# Startup phases are timed from here, before the heavy imports below (torch through f5_tts)
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import re
+import socket
 import uuid
 import threading
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, HTMLResponse, FileResponse
+from fastapi.responses import (
+    StreamingResponse, HTMLResponse, FileResponse, JSONResponse, Response, PlainTextResponse, RedirectResponse
+)
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
 import os
-import io
-import wave
-import tempfile
+
+import numpy as np
+import soundfile as sf
+
+from .audio import WAV_HEADER_SIZE, StreamingCrossfader, TimeStretcher, float_to_pcm16, wav_header
+from .engine import TTSEngine, EngineError, EngineCancelled, NFE_STEPS, SAMPLE_RATE
+from .jobs import JobQueue, QueueFullError, JobCancelled, DuplicateJobError, job_cost
+from .ref_cache import RefAudioCache
+from .ref_index import RefAudioIndex
+from .metrics import MetricsRegistry, TimingStore
+from .ingest import INGEST_PROCESSING, INGEST_READY, UploadTooLarge, VoiceIngest, save_upload, transcode_reference
+from .voices import VoiceRegistry
+from .result_cache import ResultCache, make_cache_key, CACHE_BYPASS
+from .output_store import OutputStore
+from .bulk import ARCHIVE_MEDIA_TYPES, BulkJobRegistry, parse_jsonl, stream_bulk_archive
+from .documents import JOB_COMPLETED, DocumentJobManager, split_document
+from .quality import MAX_NFE_STEPS, QualityPlanner
+from .encoding import OUTPUT_FORMATS, AudioEncoder, encode_waveform, negotiate_format
+from .duplex import DuplexSession
+from .logs import RequestLogger
+from .coordinator import (
+    STATE_CANCELLED, STATE_COMPLETED, STATE_FAILED, STATE_QUEUED, STATE_RUNNING, Coordinator, InMemoryJobRegistry,
+    SQLiteJobRegistry
+)
 
 # Import F5-TTS preprocessing function
 try:
@@ -26,38 +57,247 @@ except ImportError:
 
 project_root = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
 
+# Resident inference engine: model and vocoder are loaded once per worker process
+ENGINE_WORKERS = int(os.environ.get("F5_TTS_ENGINE_WORKERS", "1"))
+ENGINE_MODEL = os.environ.get("F5_TTS_MODEL", "F5TTS_v1_Base")
+# Jobs arriving within BATCH_MAX_WAIT_MS of each other are sampled together, up to BATCH_MAX_SIZE per worker
+BATCH_MAX_SIZE = int(os.environ.get("F5_TTS_BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("F5_TTS_BATCH_MAX_WAIT_MS", "20"))
+# Per-worker mode (auto, cpu or cpu-int8) and torch thread budget (intra-op threads default to cores / workers)
+WORKER_MODES = [mode.strip() for mode in os.environ.get("F5_TTS_WORKER_MODES", "auto").split(",") if mode.strip()]
+INTRA_OP_THREADS = int(os.environ["F5_TTS_INTRA_OP_THREADS"]) if "F5_TTS_INTRA_OP_THREADS" in os.environ else None
+INTER_OP_THREADS = int(os.environ.get("F5_TTS_INTER_OP_THREADS", "1"))
+tts_engine = TTSEngine(
+    num_workers=ENGINE_WORKERS,
+    model_name=ENGINE_MODEL,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_batch_wait=BATCH_MAX_WAIT_MS / 1000,
+    worker_modes=WORKER_MODES,
+    intra_op_threads=INTRA_OP_THREADS,
+    inter_op_threads=INTER_OP_THREADS,
+)
+
+# Synthesis jobs run off the event loop, at most MAX_CONCURRENT_JOBS at a time
+MAX_CONCURRENT_JOBS = int(os.environ.get("F5_TTS_MAX_CONCURRENCY", str(ENGINE_WORKERS * BATCH_MAX_SIZE)))
+MAX_QUEUED_JOBS = int(os.environ.get("F5_TTS_MAX_QUEUE", "32"))
+# Waiting jobs are scheduled shortest-first per client with aging; short jobs get FAST_LANE_SLOTS slots of their own
+SCHED_AGING = float(os.environ.get("F5_TTS_SCHED_AGING", "1.0"))
+FAST_LANE_SECONDS = float(os.environ.get("F5_TTS_FAST_LANE_SECONDS", "5"))
+FAST_LANE_SLOTS = int(os.environ["F5_TTS_FAST_LANE_SLOTS"]) if "F5_TTS_FAST_LANE_SLOTS" in os.environ else None
+job_queue = JobQueue(
+    max_concurrency=MAX_CONCURRENT_JOBS,
+    max_queue_size=MAX_QUEUED_JOBS,
+    aging=SCHED_AGING,
+    fast_lane_seconds=FAST_LANE_SECONDS,
+    fast_lane_slots=FAST_LANE_SLOTS,
+)
+# Reference audio is clipped to this length before conditioning
+REF_MAX_SECONDS = 12
+
+# Preprocessed reference audio and ASR transcripts, keyed by audio content hash
+REF_CACHE_SIZE = int(os.environ.get("F5_TTS_REF_CACHE_SIZE", "256"))
+ref_audio_cache = RefAudioCache(os.path.join(project_root, "cache", "ref_audio"), max_entries=REF_CACHE_SIZE)
+
+# Reference voices and their texts, indexed once and kept current by the upload/delete handlers
+ref_audio_index = RefAudioIndex(
+    os.path.join(project_root, "ref_audios"),
+    known_texts={
+        "default/basic_ref_en.wav": "Some call me nature, others call me mother nature.",
+        "default/basic_ref_zh.wav": "对，这就是我，万人敬仰的太乙真人。"
+    }
+)
+
+# Uploaded voices are staged here, then converted and preprocessed in the background
+upload_staging_path = os.path.join(project_root, "cache", "uploads")
+os.makedirs(upload_staging_path, exist_ok=True)
+voice_ingest = VoiceIngest()
+
+# Precomputed conditioning features (mel spectrograms) per reference voice
+voice_registry = VoiceRegistry(os.path.join(project_root, "cache", "voices"), hasher=ref_audio_cache.content_hash)
+
+# Recently synthesized audio for reproducible (fixed-seed) requests
+RESULT_CACHE_MB = int(os.environ.get("F5_TTS_RESULT_CACHE_MB", "256"))
+RESULT_CACHE_TTL = int(os.environ.get("F5_TTS_RESULT_CACHE_TTL", "3600"))
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MB * 1024 * 1024, ttl=RESULT_CACHE_TTL)
+
+# Opt-in on-disk store for generated audio, fetchable by request ID
+STORE_OUTPUTS = os.environ.get("F5_TTS_STORE_OUTPUTS", "0") == "1"
+OUTPUT_STORE_MB = int(os.environ.get("F5_TTS_OUTPUT_STORE_MB", "1024"))
+OUTPUT_STORE_TTL = int(os.environ.get("F5_TTS_OUTPUT_STORE_TTL", str(24 * 3600)))
+OUTPUT_EVICTION_INTERVAL = 60
+output_store = OutputStore(os.path.join(project_root, "output"), max_bytes=OUTPUT_STORE_MB * 1024 * 1024, ttl=OUTPUT_STORE_TTL)
+
+# JSONL bulk jobs: lines in flight per job, and recent jobs kept for progress queries
+BULK_CONCURRENCY = int(os.environ.get("F5_TTS_BULK_CONCURRENCY", str(MAX_CONCURRENT_JOBS)))
+bulk_jobs = BulkJobRegistry(on_update=lambda job: publish_bulk_job(job))
+
+# Long-document jobs: characters per chunk and chunks of one job in flight at once
+DOCUMENT_CHUNK_CHARS = int(os.environ.get("F5_TTS_DOCUMENT_CHUNK_CHARS", "800"))
+DOCUMENT_CONCURRENCY = int(os.environ.get("F5_TTS_DOCUMENT_CONCURRENCY", str(MAX_CONCURRENT_JOBS)))
+
+# Sampler step counts for quality tiers and deadlines, from measured per-step cost
+quality_planner = QualityPlanner()
+
+# Default bitrates (kbps) of the lossy output formats; requests may override them
+OUTPUT_BITRATES = {
+    "mp3": int(os.environ.get("F5_TTS_MP3_BITRATE", "64")),
+    "opus": int(os.environ.get("F5_TTS_OPUS_BITRATE", "32")),
+}
+
+# Clauses of one /ws/tts connection synthesized at once (the next ones start while earlier ones play)
+WS_LOOKAHEAD = int(os.environ.get("F5_TTS_WS_LOOKAHEAD", "2"))
+
+# Every engine worker synthesizes this with the default voice before it takes requests
+WARMUP_ENABLED = os.environ.get("F5_TTS_WARMUP", "1") == "1"
+WARMUP_VOICE = "default/basic_ref_en.wav"
+WARMUP_TEXT = "Warming up the speech engine."
+
+# Startup phase durations and the server's state (starting, ready, engine_failed, shutting_down), for /readyz
+startup_phases = {}
+server_state = {"status": "starting"}
+
 # Global dictionary to track running TTS processes
 running_processes = {}
 process_lock = threading.Lock()
+# Requests cancelled while holding a queue slot but before reaching the engine
+cancelled_requests = set()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('tts_server.log'),
-        logging.StreamHandler()  # This will show logs in console too
-    ]
+# Job registry shared with the other server instances (an SQLite file for several processes on one host,
+# in memory for a single one): status and cancellation from any instance, and routing by voice
+REGISTRY_PATH = os.environ.get("F5_TTS_REGISTRY_PATH")
+INSTANCE_ID = os.environ.get("F5_TTS_INSTANCE_ID", f"{socket.gethostname()}-{os.getpid()}")
+# Address other instances redirect clients to; routing is off without it
+INSTANCE_URL = os.environ.get("F5_TTS_INSTANCE_URL")
+COORDINATOR_INTERVAL = float(os.environ.get("F5_TTS_COORDINATOR_INTERVAL", "1.0"))
+# How much busier (in job slots relative to capacity) a warm instance may be than the least busy one
+AFFINITY_SLACK = float(os.environ.get("F5_TTS_AFFINITY_SLACK", "0.5"))
+coordinator = Coordinator(
+    SQLiteJobRegistry(REGISTRY_PATH) if REGISTRY_PATH else InMemoryJobRegistry(),
+    INSTANCE_ID,
+    url=INSTANCE_URL,
+    load=lambda: (job_queue.depth + job_queue.in_flight) / MAX_CONCURRENT_JOBS,
+    heartbeat_interval=COORDINATOR_INTERVAL,
+    instance_ttl=5 * COORDINATOR_INTERVAL,
+    affinity_slack=AFFINITY_SLACK,
 )
-logger = logging.getLogger(__name__)
 
-def apply_speed_change(input_path, output_path, speed):
-    """Apply speed change to audio file using ffmpeg"""
-    try:
-        command = [
-            "ffmpeg", "-i", input_path,
-            "-filter:a", f"atempo={speed}",
-            "-y", output_path
-        ]
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        logger.info(f"Applied speed change {speed}x using ffmpeg")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to apply speed change with ffmpeg: {e.stderr}")
-        return False
-    except FileNotFoundError:
-        logger.warning("ffmpeg not found, speed control not available")
-        return False
+# Seconds between checks whether the client of a running request is still connected
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("F5_TTS_DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# Prometheus metrics, served by /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram("tts_stage_seconds", "Time spent in each processing stage of a request", ["stage"])
+request_seconds = metrics.histogram("tts_request_seconds", "End-to-end TTS request latency", ["endpoint"])
+requests_total = metrics.counter("tts_requests_total", "Finished TTS requests", ["endpoint", "status"])
+bytes_streamed = metrics.counter("tts_bytes_streamed_total", "Audio bytes sent to clients", ["endpoint"])
+cancellations_total = metrics.counter("tts_cancellations_total", "Cancelled TTS requests", ["reason"])
+nfe_steps_total = metrics.counter("tts_nfe_steps_total", "Requests by sampler step count and why it was chosen", ["nfe_steps", "reason"])
+voice_features_total = metrics.counter("tts_voice_features_total", "Voice feature lookups by whether they were precomputed", ["result"])
+metrics.gauge_fn("tts_queue_depth", "Jobs waiting for a slot", lambda: job_queue.depth)
+metrics.gauge_fn("tts_queue_slots_in_use", "Jobs holding a job queue slot", lambda: job_queue.in_flight)
+metrics.gauge_fn("tts_jobs_in_flight", "Jobs dispatched to an engine worker", lambda: len(running_processes))
+metrics.gauge_fn("tts_engine_pending_jobs", "Jobs waiting for an engine batch", lambda: tts_engine.stats()["pending_jobs"])
+metrics.gauge_fn("tts_engine_ready_workers", "Engine workers with a loaded model", lambda: tts_engine.stats()["ready_workers"])
+metrics.counter_fn("tts_engine_batches_total", "Job batches dispatched to engine workers", lambda: tts_engine.stats()["batches"])
+metrics.gauge_fn("tts_engine_batch_fill", "Average batch size relative to the maximum", lambda: tts_engine.stats()["batch_fill"])
+metrics.counter_fn(
+    "tts_engine_stage_busy_seconds_total", "Seconds engine workers spent in each pipeline stage",
+    lambda: {(stage,): seconds for stage, seconds in tts_engine.stats()["pipeline"]["stage_busy_seconds"].items()},
+    ["stage"]
+)
+metrics.gauge_fn(
+    "tts_engine_stage_occupancy", "Share of engine batch time each pipeline stage was busy",
+    lambda: {(stage,): share for stage, share in tts_engine.stats()["pipeline"]["stage_occupancy"].items()},
+    ["stage"]
+)
+metrics.counter_fn(
+    "tts_result_cache_requests_total", "Result cache lookups by outcome",
+    lambda: {(outcome,): result_cache.stats()[outcome] for outcome in ("hits", "misses", "coalesced")},
+    ["outcome"]
+)
+metrics.gauge_fn("tts_result_cache_hit_ratio", "Share of result cache lookups served without synthesis",
+                 lambda: cache_hit_ratio(result_cache.stats(), "hits", "coalesced"))
+metrics.gauge_fn("tts_result_cache_bytes", "Memory held by cached results", lambda: result_cache.stats()["bytes"])
+metrics.counter_fn(
+    "tts_ref_cache_requests_total", "Reference preprocessing cache lookups by outcome",
+    lambda: {(outcome,): ref_audio_cache.stats()[outcome] for outcome in ("hits", "misses")},
+    ["outcome"]
+)
+metrics.gauge_fn("tts_ref_cache_hit_ratio", "Share of reference preprocessing served from cache",
+                 lambda: cache_hit_ratio(ref_audio_cache.stats(), "hits"))
+metrics.gauge_fn("tts_output_store_bytes", "Disk used by stored results", lambda: output_store.stats()["bytes"])
+metrics.counter_fn("tts_routed_requests_total", "Requests redirected to an instance with their voice warm",
+                   lambda: coordinator.routed)
+
+# Per-request stage timings, also fed into the stage histogram
+request_timings = TimingStore(on_stage=lambda stage, seconds: stage_seconds.observe(seconds, stage=stage))
+
+def cache_hit_ratio(stats, *hit_fields):
+    hits = sum(stats[field] for field in hit_fields)
+    total = hits + stats["misses"]
+    return hits / total if total else 0.0
+
+def start_request(request_id):
+    """Start the stage timer and the buffered log of a request, and register it for the other instances
+    
+    Raises a 409 if a request with the same ID is still in progress (a retry
+    or double submission), leaving that request's timer and status alone.
+    """
+    timer = request_timings.get(request_id)
+    if (timer is not None and timer.finished is None) or job_queue.active(request_id):
+        raise HTTPException(status_code=409, detail=f"Request {request_id} is already in progress")
+    request_logger.start(request_id)
+    coordinator.publish(request_id, STATE_QUEUED)
+    return request_timings.start(request_id)
+
+def request_outcome(status_code):
+    """Final state of a request (completed, cancelled or failed) from the status code it finished with"""
+    if status_code is None or status_code < 400:
+        return STATE_COMPLETED
+    return STATE_CANCELLED if status_code == 499 else STATE_FAILED
+
+def record_request(endpoint, status_code, timer):
+    """Count a finished request, observe its latency and write its log summary"""
+    timer.finish(status_code)
+    if status_code < 400:
+        stored = output_store.get(timer.request_id) is not None
+        coordinator.publish(timer.request_id, STATE_COMPLETED,
+                            **({"result_url": f"/tts-result/{timer.request_id}"} if stored else {}))
+    else:
+        coordinator.publish(timer.request_id, request_outcome(status_code), http_status=status_code)
+    requests_total.inc(endpoint=endpoint, status=str(status_code))
+    request_seconds.observe(timer.finished - timer.started, endpoint=endpoint)
+    request_logger.finish(timer.request_id, endpoint, status_code, timer.to_dict())
+
+def publish_document_job(job):
+    """Share a document job's progress through the job registry, so that any instance can report or cancel it"""
+    status = job.to_dict()
+    del status["request_id"]
+    if status["status"] == JOB_COMPLETED:
+        status["result_url"] = f"/tts-result/{job.job_id}"
+    # Document job states are named like request states
+    coordinator.publish(job.job_id, status.pop("status"), **status)
+
+def publish_bulk_job(job):
+    """Share a bulk job's line counts through the job registry; the per-line list stays on this instance"""
+    status = job.to_dict(include_lines=False)
+    del status["batch_id"]
+    coordinator.publish(job.batch_id, status.pop("status"), **status)
+
+# Configure logging: written from a background thread, one summary record per request;
+# the detail lines of a request are only written if it fails or is sampled
+LOG_FILE = os.environ.get("F5_TTS_LOG_FILE", "tts_server.log")
+LOG_LEVEL = os.environ.get("F5_TTS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("F5_TTS_LOG_FORMAT", "json")
+LOG_MAX_MB = int(os.environ.get("F5_TTS_LOG_MAX_MB", "50"))
+LOG_BACKUPS = int(os.environ.get("F5_TTS_LOG_BACKUPS", "5"))
+LOG_DETAIL_SAMPLE_RATE = float(os.environ.get("F5_TTS_LOG_DETAIL_SAMPLE_RATE", "0.01"))
+request_logger = RequestLogger(detail_sample_rate=LOG_DETAIL_SAMPLE_RATE)
+request_logger.configure(
+    LOG_FILE, level=LOG_LEVEL, max_bytes=LOG_MAX_MB * 1024 * 1024, backup_count=LOG_BACKUPS,
+    json_file=LOG_FORMAT == "json"
+)
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -73,14 +313,106 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.on_event("startup")
 async def startup_event():
+    startup_phases["imports"] = time.perf_counter() - IMPORT_STARTED
     logger.info("F5-TTS Server starting up...")
     logger.info(f"Project root: {project_root}")
-    logger.info("Server ready to accept TTS requests")
+    logger.info(f"Imports and module setup took {startup_phases['imports']:.2f}s")
+    
+    # Workers load and warm up in the background; /readyz reports when they are done
+    start = time.perf_counter()
+    tts_engine.start(warmup_job=await run_in_threadpool(build_warmup_job) if WARMUP_ENABLED else None)
+    startup_phases["engine_spawn"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    await run_in_threadpool(ref_audio_index.build)
+    # Document jobs interrupted by the last shutdown continue from their finished chunks; with several
+    # processes, each job continues in the one that claims it first
+    for job in await run_in_threadpool(document_jobs.load):
+        if not document_jobs.start(job):
+            logger.info(f"Document job {job.job_id} is resumed by another process")
+    startup_phases["ref_index"] = time.perf_counter() - start
+    logger.info(f"Indexed reference audios in {startup_phases['ref_index']:.2f}s")
+    
+    app.state.eviction_task = asyncio.create_task(evict_outputs_periodically())
+    coordinator.start()
+    app.state.coordinator_task = asyncio.create_task(coordinate_periodically())
+    app.state.warmup_task = asyncio.create_task(wait_for_engine())
+    logger.info("Server accepting requests; waiting for the engine to warm up")
+
+def build_warmup_job():
+    """Engine job for the warmup phrase with the default voice, or None if the voice is missing"""
+    ref_audio_path = os.path.join(project_root, "ref_audios", WARMUP_VOICE)
+    try:
+        features_path = voice_registry.features_path(voice_registry.voice_key(ref_audio_path))
+    except OSError as e:
+        logger.warning(f"Skipping engine warmup, {WARMUP_VOICE} is not available: {e}")
+        return None
+    return {
+        "ref_audio": ref_audio_path,
+        # Precomputing the default voice's features is part of the warmup
+        "features_path": features_path,
+        "ref_text": ref_audio_index.known_texts.get(WARMUP_VOICE, ""),
+        "gen_text": WARMUP_TEXT,
+        "remove_silence": False,
+        "speed": 1.0,
+        "seed": 0,
+        "nfe_steps": NFE_STEPS,
+    }
+
+async def wait_for_engine():
+    """Mark the server ready once every engine worker has loaded and warmed up"""
+    start = time.perf_counter()
+    ready = await run_in_threadpool(tts_engine.wait_ready)
+    startup_phases["engine_ready"] = time.perf_counter() - start
+    if not ready:
+        server_state["status"] = "engine_failed"
+        logger.error(f"TTS engine did not become ready after {startup_phases['engine_ready']:.2f}s")
+        return
+    server_state["status"] = "ready"
+    total = time.perf_counter() - IMPORT_STARTED
+    logger.info(f"Server ready after {total:.2f}s ("
+                + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_phases.items()) + ")")
+
+async def evict_outputs_periodically():
+    """Background task keeping the output store within its size and age limits"""
+    while True:
+        await asyncio.sleep(OUTPUT_EVICTION_INTERVAL)
+        try:
+            await run_in_threadpool(output_store.evict)
+        except Exception as e:
+            logger.error(f"Output store eviction failed: {e}")
+
+async def coordinate_periodically():
+    """Background task sending heartbeats to the job registry and applying cancellations from other instances"""
+    while True:
+        try:
+            cancellations = await run_in_threadpool(coordinator.heartbeat)
+        except Exception as e:
+            logger.error(f"Job registry heartbeat failed: {e}")
+            cancellations = []
+        for request_id in cancellations:
+            if cancel_request(request_id):
+                cancellations_total.inc(reason="client")
+                logger.info(f"Cancelled TTS request {request_id} on behalf of another instance")
+        await asyncio.sleep(COORDINATOR_INTERVAL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    server_state["status"] = "shutting_down"
+    app.state.warmup_task.cancel()
+    app.state.eviction_task.cancel()
+    app.state.coordinator_task.cancel()
+    document_jobs.shutdown()
+    job_queue.shutdown()
+    tts_engine.stop()
+    coordinator.stop()
+    request_logger.stop()
 
 class TTSRequest(BaseModel):
     gen_text: str
-    speed: float = 1.0
-    nfe_steps: int = 32
+    # The time-stretch needs a positive speed; beyond this range speech is no longer intelligible anyway
+    speed: float = Field(1.0, ge=0.25, le=4.0)
+    nfe_steps: int = Field(32, ge=1, le=MAX_NFE_STEPS)
     crossfade_duration: float = 0.15
     remove_silence: bool = False
     randomize_seed: bool = True
@@ -88,6 +420,11 @@ class TTSRequest(BaseModel):
     ref_audio: str = "default/basic_ref_en.wav"
     ref_text: str = ""
     request_id: str | None = None
+    store_output: bool = False
+    quality: str | None = None
+    deadline_ms: int | None = None
+    format: str | None = None
+    bitrate: int | None = None
 
 @app.get("/", response_class=HTMLResponse)
 async def read_index():
@@ -110,71 +447,40 @@ async def read_conversation():
         raise HTTPException(status_code=500, detail="Error reading conversation interface")
 
 @app.get("/ref-audios/")
-async def list_reference_audios():
+async def list_reference_audios(request: Request, prefix: str = "", offset: int = 0, limit: int | None = None):
     """List available reference audio files from both default and custom folders"""
-    ref_audios_path = os.path.join(project_root, "ref_audios")
+    if offset < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit >= 1")
     
-    if not os.path.exists(ref_audios_path):
-        return {"files": [], "default": "default/basic_ref_en.wav", "ref_texts": {}}
+    # Served from the in-memory index; only mtimes are checked for outside changes
+    await run_in_threadpool(ref_audio_index.refresh)
+    etag, files, ref_texts, total = ref_audio_index.listing(prefix, offset, limit)
     
-    try:
-        # Get all audio files from both default and custom directories
-        audio_extensions = {'.wav', '.mp3', '.flac', '.m4a', '.ogg'}
-        files = []
-        ref_texts = {}
-        
-        # Known reference texts for common files
-        known_ref_texts = {
-            "default/basic_ref_en.wav": "Some call me nature, others call me mother nature.",
-            "default/basic_ref_zh.wav": "对，这就是我，万人敬仰的太乙真人。"
-        }
-        
-        # Scan both default and custom folders
-        folders_to_scan = ["default", "custom"]
-        
-        for folder in folders_to_scan:
-            folder_path = os.path.join(ref_audios_path, folder)
-            if not os.path.exists(folder_path):
-                continue
-                
-            for filename in os.listdir(folder_path):
-                if any(filename.lower().endswith(ext) for ext in audio_extensions):
-                    file_path = os.path.join(folder_path, filename)
-                    if os.path.isfile(file_path):
-                        # Store with folder prefix for identification
-                        file_key = f"{folder}/{filename}"
-                        files.append(file_key)
-                        
-                        # Try to find corresponding .txt file first
-                        base_name = os.path.splitext(filename)[0]
-                        txt_file_path = os.path.join(folder_path, f"{base_name}.txt")
-                        
-                        if os.path.isfile(txt_file_path):
-                            try:
-                                with open(txt_file_path, 'r', encoding='utf-8') as f:
-                                    ref_texts[file_key] = f.read().strip()
-                                    logger.info(f"Loaded reference text from {folder}/{base_name}.txt")
-                            except Exception as e:
-                                logger.error(f"Error reading {txt_file_path}: {e}")
-                                ref_texts[file_key] = known_ref_texts.get(file_key, "")
-                        else:
-                            # Fall back to known reference texts
-                            ref_texts[file_key] = known_ref_texts.get(file_key, "")
-        
-        files.sort()  # Sort alphabetically
-        
-        return {
-            "files": files,
-            "default": "default/basic_ref_en.wav" if "default/basic_ref_en.wav" in files else (files[0] if files else None),
-            "ref_texts": ref_texts
-        }
-    except Exception as e:
-        logger.error(f"Error listing reference audio files: {e}")
-        return {"files": [], "default": "default/basic_ref_en.wav", "ref_texts": {}}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    if "default/basic_ref_en.wav" in ref_audio_index:
+        default = "default/basic_ref_en.wav"
+    else:
+        default = files[0] if files else None
+    
+    return JSONResponse({
+        "files": files,
+        "default": default,
+        "ref_texts": ref_texts,
+        "total": total,
+        "offset": offset,
+        "limit": limit
+    }, headers={"ETag": etag})
 
 @app.post("/upload-ref-audio/")
-async def upload_reference_audio(file: UploadFile = File(...)):
-    """Upload a reference audio file"""
+async def upload_reference_audio(request: Request, file: UploadFile = File(...)):
+    """Upload a reference audio file
+    
+    The upload is stored as custom/<name>.wav once it has been converted to the
+    canonical reference format in the background; poll /ref-audio-status/ for
+    progress. Synthesis requests for the voice wait for the conversion.
+    """
     
     # Validate file type - support multiple formats as per F5-TTS
     allowed_types = ['audio/wav', 'audio/mpeg', 'audio/mp3', 'audio/flac', 'audio/x-m4a', 'audio/ogg']
@@ -186,10 +492,10 @@ async def upload_reference_audio(file: UploadFile = File(...)):
         if file_extension not in allowed_extensions:
             raise HTTPException(status_code=400, detail="Invalid file type. Only WAV, MP3, FLAC, M4A, and OGG files are allowed.")
     
-    # Validate file size (50MB limit)
+    # Validate file size (50MB limit): reject early on the declared length, then enforce while copying
     max_size = 50 * 1024 * 1024  # 50MB
-    file_content = await file.read()
-    if len(file_content) > max_size:
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + 64 * 1024:
         raise HTTPException(status_code=400, detail="File size must be less than 50MB.")
     
     # Sanitize filename
@@ -197,39 +503,82 @@ async def upload_reference_audio(file: UploadFile = File(...)):
     if not safe_filename or safe_filename.startswith('.'):
         safe_filename = f"uploaded_audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file.filename.split('.')[-1].lower()}"
     
+    # Every upload ends up as a canonical WAV file
+    base_name = os.path.splitext(safe_filename)[0]
+    
     # Check if file already exists and create unique name if needed
     ref_audios_path = os.path.join(project_root, "ref_audios")
     custom_folder_path = os.path.join(ref_audios_path, "custom")
     os.makedirs(custom_folder_path, exist_ok=True)
     
-    final_filename = safe_filename
+    final_filename = f"{base_name}.wav"
     counter = 1
-    while os.path.exists(os.path.join(custom_folder_path, final_filename)):
-        name, ext = os.path.splitext(safe_filename)
-        final_filename = f"{name}_{counter}{ext}"
+    while (os.path.exists(os.path.join(custom_folder_path, final_filename))
+           or voice_ingest.is_active(f"custom/{final_filename}")):
+        final_filename = f"{base_name}_{counter}.wav"
         counter += 1
     
+    file_key = f"custom/{final_filename}"
     file_path = os.path.join(custom_folder_path, final_filename)
+    staging_path = os.path.join(upload_staging_path, f"{uuid.uuid4()}{os.path.splitext(safe_filename)[1]}")
     
     try:
-        # Write file to disk
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
-        
-        logger.info(f"Reference audio uploaded successfully: custom/{final_filename}")
-        
-        return {
-            "message": "File uploaded successfully",
-            "filename": f"custom/{final_filename}",  # Return with folder prefix
-            "size": len(file_content)
-        }
-        
+        size = await save_upload(file, staging_path, max_size)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="File size must be less than 50MB.")
     except Exception as e:
         logger.error(f"Error saving uploaded file: {e}")
-        # Clean up partial file if it exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail="Failed to save uploaded file")
+    
+    # A previous upload with this name may still have cached preprocessing
+    ref_audio_cache.invalidate(file_path)
+    voice_ingest.start(file_key, ingest_reference_audio(staging_path, file_path, file_key))
+    
+    logger.info(f"Reference audio uploaded: {file_key} ({size} bytes), converting in the background")
+    
+    return {
+        "message": "File uploaded successfully",
+        "filename": file_key,  # Return with folder prefix
+        "size": size,
+        "status": INGEST_PROCESSING
+    }
+
+async def ingest_reference_audio(staging_path, file_path, file_key):
+    """Convert an upload to the canonical format, then transcribe it and precompute its features"""
+    try:
+        duration = await run_in_threadpool(transcode_reference, staging_path, file_path)
+    finally:
+        os.remove(staging_path)
+    ref_audio_index.update("custom", os.path.basename(file_path))
+    logger.info(f"Converted {file_key} to {duration:.2f}s of {SAMPLE_RATE} Hz mono PCM")
+    
+    async def transcribe():
+        # A sidecar .txt (uploaded now or later) takes priority, so only transcribe without one
+        txt_path = os.path.splitext(file_path)[0] + ".txt"
+        if F5_TTS_AVAILABLE and not os.path.isfile(txt_path):
+            await run_in_threadpool(
+                ref_audio_cache.get, file_path,
+                lambda path: preprocess_ref_audio_text(path, "", show_info=logger.info)
+            )
+    
+    async def precompute_features():
+        voice_key = await run_in_threadpool(voice_registry.voice_key, file_path)
+        if not voice_registry.has_features(voice_key):
+            await run_in_threadpool(
+                tts_engine.prepare_voice, f"ingest-{uuid.uuid4()}", file_path, voice_registry.features_path(voice_key)
+            )
+    
+    await asyncio.gather(transcribe(), precompute_features())
+
+@app.get("/ref-audio-status/{file_path:path}")
+async def get_reference_audio_status(file_path: str):
+    """Ingest status of an uploaded reference audio file"""
+    status = voice_ingest.status(file_path)
+    if status is None:
+        if file_path not in ref_audio_index:
+            raise HTTPException(status_code=404, detail="Reference audio file not found")
+        status = {"status": INGEST_READY}
+    return {"filename": file_path, **status}
 
 @app.post("/upload-text-file/")
 async def upload_text_file(file: UploadFile = File(...)):
@@ -279,6 +628,7 @@ async def upload_text_file(file: UploadFile = File(...)):
         with open(file_path, "w", encoding="utf-8") as buffer:
             buffer.write(text_content)
         
+        ref_audio_index.update("custom", final_filename)
         logger.info(f"Text file uploaded successfully: custom/{final_filename}")
         
         return {
@@ -322,6 +672,10 @@ async def delete_reference_audio(file_path: str):
         raise HTTPException(status_code=400, detail="Invalid audio file format")
     
     try:
+        # Drop cached preprocessing and features for this voice before the file goes away
+        voice_registry.remove(voice_registry.voice_key(actual_file_path))
+        ref_audio_cache.invalidate(actual_file_path)
+        
         # Delete the audio file
         os.remove(actual_file_path)
         logger.info(f"Deleted reference audio file: {file_path}")
@@ -333,6 +687,9 @@ async def delete_reference_audio(file_path: str):
             os.remove(txt_file_path)
             logger.info(f"Deleted corresponding text file: custom/{base_name}.txt")
         
+        ref_audio_index.remove("custom", filename)
+        voice_ingest.forget(file_path)
+        
         return {
             "message": "Reference audio file deleted successfully",
             "filename": file_path
@@ -371,12 +728,16 @@ async def serve_reference_audio(file_path: str):
     return FileResponse(actual_file_path, media_type="audio/wav", filename=filename)
 
 @app.post("/tts/")
-async def text_to_speech(request: TTSRequest):
+async def text_to_speech(request: TTSRequest, http_request: Request):
+    redirect = route_request(request, http_request)
+    if redirect is not None:
+        return redirect
     start_time = time.time()
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
     
     # Generate or use provided request ID
     request_id = request.request_id or str(uuid.uuid4())
+    timer = start_request(request_id)
     
     # Log the incoming request
     logger.info(f"TTS Request received - ID: {timestamp}, Request ID: {request_id}")
@@ -390,17 +751,718 @@ async def text_to_speech(request: TTSRequest):
     logger.info(f"Seed: {request.seed if not request.randomize_seed else 'random'}")
     logger.info(f"Reference audio: {request.ref_audio}")
     logger.info(f"Reference text: '{request.ref_text[:50]}{'...' if len(request.ref_text) > 50 else ''}'" if request.ref_text else "Reference text: (auto-transcribe)")
+
+    try:
+        request = plan_quality(request, request_id)
+        output_format, bitrate = resolve_output_format(request, http_request)
+    except HTTPException as e:
+        record_request("tts", e.status_code, timer)
+        raise
+    annotate_request(request, format=output_format)
+    work = asyncio.ensure_future(
+        generate_audio(request, request_id, timestamp, start_time, timer, client=client_key(http_request))
+    )
+    watcher = asyncio.ensure_future(cancel_on_disconnect(http_request, request_id, work))
+    try:
+        audio, used_seed, cache_status = await work
+    except HTTPException as e:
+        record_request("tts", e.status_code, timer)
+        raise
+    finally:
+        watcher.cancel()
+    
+    stored = False
+    if request.store_output or STORE_OUTPUTS:
+        with timer.stage("store"):
+            await run_in_threadpool(output_store.save, request_id, audio)
+        stored = True
+    
+    # Synthesis and the caches work with WAV; other formats are encoded per response
+    media_type = OUTPUT_FORMATS[output_format]["media_type"]
+    if output_format != "wav":
+        with timer.stage("encode"):
+            waveform = np.frombuffer(audio, dtype="<i2", offset=WAV_HEADER_SIZE).astype(np.float32) / 32767
+            audio, encode_cpu = await run_in_threadpool(encode_waveform, waveform, output_format, SAMPLE_RATE, bitrate)
+        timer.add("encode_cpu", encode_cpu)
+    
+    file_size = len(audio)
+    bytes_streamed.inc(file_size, endpoint="tts")
+    
+    # Log file details
+    generation_time = time.time() - start_time
+    
+    logger.info(f"Audio generated successfully (cache: {cache_status})")
+    logger.info(f"File size: {file_size} bytes ({file_size/1024:.1f} KB)")
+    logger.info(f"Generation time: {generation_time:.2f} seconds")
+    logger.info(f"Request {timestamp} completed successfully")
+    request_logger.annotate(cache=cache_status, seed=used_seed, bytes=file_size)
+    record_request("tts", 200, timer)
+    
+    # Add generation time and seed to response headers
+    headers = {
+        "X-Generation-Time": str(generation_time),
+        "X-Cache": cache_status,
+        "X-File-Size": str(file_size),
+        "X-Used-Seed": str(used_seed),
+        "X-NFE-Steps": str(request.nfe_steps),
+        "X-Request-ID": request_id,
+        "Vary": "Accept",
+        "Server-Timing": timer.server_timing()
+    }
+    if stored:
+        headers["X-Result-URL"] = f"/tts-result/{request_id}"
+    
+    # Send the in-memory audio in one piece (iterating a BytesIO would yield it line by line)
+    return Response(content=audio, media_type=media_type, headers=headers)
+
+@app.post("/tts/stream")
+async def text_to_speech_stream(request: TTSRequest, http_request: Request):
+    """Synthesize sentence by sentence and stream WAV audio as each batch finishes"""
+    redirect = route_request(request, http_request)
+    if redirect is not None:
+        return redirect
+    start_time = time.time()
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    request_id = request.request_id or str(uuid.uuid4())
+    timer = start_request(request_id)
+    
+    logger.info(f"Streaming TTS Request received - ID: {timestamp}, Request ID: {request_id}")
+    logger.info(f"Input text: '{request.gen_text[:100]}{'...' if len(request.gen_text) > 100 else ''}'")
+    if request.speed != 1.0:
+        logger.info(f"Speed setting: {request.speed}x")
+    
+    try:
+        request = plan_quality(request, request_id)
+        output_format, bitrate = resolve_output_format(request, http_request)
+    except HTTPException as e:
+        record_request("tts_stream", e.status_code, timer)
+        raise
+    annotate_request(request, format=output_format)
+    encoder = AudioEncoder(output_format, SAMPLE_RATE, bitrate)
+    with timer.stage("ingest_wait"):
+        await voice_ingest.wait(request.ref_audio)
+    used_seed = resolve_seed(request)
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    
+    def on_chunk(wave):
+        # Called from the engine thread for every finished sentence batch
+        loop.call_soon_threadsafe(chunks.put_nowait, wave)
+    
+    job = asyncio.ensure_future(run_tts_job(
+        request_id, synthesize_request_stream, request, request_id, timestamp, start_time, used_seed, on_chunk, timer,
+        timer=timer, request=request, client=client_key(http_request)
+    ))
+    # Runs until the job is done, including while the response streams
+    asyncio.ensure_future(cancel_on_disconnect(http_request, request_id, job))
+    
+    # Hold the response until the first batch is ready so that queue and
+    # engine errors can still be reported with a proper status code
+    first_chunk = asyncio.ensure_future(chunks.get())
+    await asyncio.wait({job, first_chunk}, return_when=asyncio.FIRST_COMPLETED)
+    if not first_chunk.done():
+        first_chunk.cancel()
+        try:
+            job.result()
+        except HTTPException as e:
+            record_request("tts_stream", e.status_code, timer)
+            raise
+    
+    time_to_first_audio = time.time() - start_time
+    timer.add("first_audio", time_to_first_audio)
+    logger.info(f"First audio for {request_id} ready after {time_to_first_audio:.2f} seconds")
+    
+    async def stream_audio():
+        crossfader = StreamingCrossfader(int(request.crossfade_duration * SAMPLE_RATE))
+        stretcher = TimeStretcher(request.speed, SAMPLE_RATE) if request.speed != 1.0 else None
+        
+        # Keep a copy of the PCM data when the result should be persisted
+        stored_pcm = [] if request.store_output or STORE_OUTPUTS else None
+        
+        def encode(wave, final=False):
+            with timer.stage("encode"):
+                if stretcher is not None:
+                    wave = stretcher.push(wave)
+                    if final:
+                        wave = np.concatenate([wave, stretcher.flush()])
+                if stored_pcm is not None:
+                    stored_pcm.append(float_to_pcm16(wave))
+                data = encoder.encode(wave)
+                if final:
+                    data += encoder.finish()
+                    timer.add("encode_cpu", encoder.cpu_seconds)
+                return data
+        
+        def emit(data):
+            bytes_streamed.inc(len(data), endpoint="tts_stream")
+            return data
+        
+        pending = first_chunk
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(chunks.get())
+                done, _ = await asyncio.wait({job, pending}, return_when=asyncio.FIRST_COMPLETED)
+                if pending in done:
+                    yield emit(encode(crossfader.push(pending.result())))
+                    pending = None
+                    continue
+                
+                # Job finished; emit anything that arrived just before it did
+                pending.cancel()
+                while not chunks.empty():
+                    yield emit(encode(crossfader.push(chunks.get_nowait())))
+                break
+            
+            yield emit(encode(crossfader.flush(), final=True))
+        finally:
+            # The response was abandoned (the disconnect watcher cancels the job)
+            if not job.done():
+                if pending is not None:
+                    pending.cancel()
+                job.add_done_callback(lambda f: f.cancelled() or f.exception())
+                record_request("tts_stream", 499, timer)
+        
+        if job.exception() is not None:
+            logger.error(f"Streaming TTS request {request_id} ended early: {job.exception()}")
+            record_request("tts_stream", getattr(job.exception(), "status_code", 500), timer)
+        else:
+            logger.info(f"Streaming TTS request {request_id} completed in {time.time() - start_time:.2f} seconds")
+            if stored_pcm is not None:
+                pcm = b"".join(stored_pcm)
+                with timer.stage("store"):
+                    await run_in_threadpool(output_store.save, request_id, wav_header(SAMPLE_RATE, len(pcm) // 2) + pcm)
+            record_request("tts_stream", 200, timer)
+    
+    headers = {
+        "X-Time-To-First-Audio": str(time_to_first_audio),
+        "X-Used-Seed": str(used_seed),
+        "X-NFE-Steps": str(request.nfe_steps),
+        "X-Request-ID": request_id,
+        "Vary": "Accept",
+        # Stages up to the first audio; the full breakdown is in /tts-status
+        "Server-Timing": timer.server_timing()
+    }
+    
+    return StreamingResponse(stream_audio(), media_type=encoder.media_type, headers=headers)
+
+@app.websocket("/ws/tts")
+async def text_to_speech_websocket(websocket: WebSocket):
+    """Duplex TTS: incremental text in, 16-bit PCM frames out, with barge-in
+    
+    Client messages are JSON: ``config`` (TTSRequest fields for the following
+    clauses), ``text`` (a fragment), ``flush`` (end of the utterance) and
+    ``cancel`` (barge-in). Audio is sent as binary frames of mono PCM at
+    SAMPLE_RATE, framed by ``clause_start``/``clause_end`` events.
+    """
+    await websocket.accept()
+    session_id = str(uuid.uuid4())
+    client = client_key(websocket)
+    settings = TTSRequest(gen_text="")
+    logger.info(f"Duplex TTS session {session_id} opened")
+    
+    async def synthesize(text, request_id, on_chunk):
+        request = settings.model_copy(update={"gen_text": text, "request_id": request_id})
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+        timer = start_request(request_id)
+        try:
+            request = plan_quality(request, request_id)
+            annotate_request(request, session_id=session_id)
+            with timer.stage("ingest_wait"):
+                await voice_ingest.wait(request.ref_audio)
+            used_seed = resolve_seed(request)
+            await run_tts_job(
+                request_id, synthesize_request_stream, request, request_id, timestamp, time.time(), used_seed, on_chunk,
+                timer, timer=timer, request=request, client=client
+            )
+        except HTTPException as e:
+            record_request("ws", e.status_code, timer)
+            raise
+        except asyncio.CancelledError:
+            record_request("ws", 499, timer)
+            raise
+        record_request("ws", 200, timer)
+    
+    async def send_bytes(data):
+        bytes_streamed.inc(len(data), endpoint="ws")
+        await websocket.send_bytes(data)
+    
+    session = DuplexSession(
+        session_id, synthesize, send_bytes, websocket.send_json, SAMPLE_RATE,
+        crossfade_duration=settings.crossfade_duration, speed=settings.speed, lookahead=WS_LOOKAHEAD
+    )
+    
+    async def send_error(detail):
+        await websocket.send_json({"type": "error", "detail": detail})
+    
+    try:
+        await websocket.send_json({
+            "type": "ready",
+            "session_id": session_id,
+            "sample_rate": SAMPLE_RATE,
+            "channels": 1,
+            "encoding": "pcm_s16le",
+        })
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is None:
+                await send_error("Messages must be JSON text")
+                continue
+            try:
+                data = json.loads(message["text"])
+            except json.JSONDecodeError as e:
+                await send_error(f"Invalid JSON: {e}")
+                continue
+            kind = data.get("type") if isinstance(data, dict) else None
+            
+            if kind == "text":
+                session.push_text(str(data.get("text", "")))
+            elif kind == "flush":
+                session.flush()
+            elif kind == "cancel":
+                cancelled = await session.cancel()
+                if cancelled:
+                    cancellations_total.inc(cancelled, reason="barge_in")
+            elif kind == "config":
+                fields = {key: value for key, value in data.items() if key not in ("type", "gen_text", "request_id")}
+                try:
+                    settings = TTSRequest(**{**settings.model_dump(), **fields, "gen_text": ""})
+                except ValidationError as e:
+                    await send_error(f"Invalid config: {e.errors()}")
+                    continue
+                session.crossfade_duration = settings.crossfade_duration
+                session.speed = settings.speed
+            else:
+                await send_error(f"Unknown message type {kind!r}, expected config, text, flush or cancel")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        logger.info(f"Duplex TTS session {session_id} closed")
+
+@app.post("/tts/batch")
+async def text_to_speech_batch(
+    http_request: Request,
+    file: UploadFile | None = File(None),
+    path: str | None = Form(None),
+    archive: str = Form("zip")
+):
+    """Synthesize every line of a JSONL job file, streaming results back as a zip or tar archive"""
+    if archive not in ARCHIVE_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported archive format: {archive}")
+    
+    if file is not None:
+        content = await file.read()
+        source = file.filename
+    elif path:
+        # Job files given by path must live inside the project directory
+        full_path = os.path.realpath(os.path.join(project_root, path))
+        if not full_path.startswith(os.path.realpath(project_root) + os.sep):
+            raise HTTPException(status_code=403, detail="Access denied")
+        if not os.path.isfile(full_path):
+            raise HTTPException(status_code=404, detail="Job file not found")
+        with open(full_path, "rb") as f:
+            content = f.read()
+        source = path
+    else:
+        raise HTTPException(status_code=400, detail="Provide a JSONL file upload or a path")
+    
+    try:
+        parsed = parse_jsonl(content.decode("utf-8"))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Job file must be UTF-8 encoded JSONL")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="Job file contains no requests")
+    
+    batch_id = str(uuid.uuid4())
+    job = bulk_jobs.create(batch_id, parsed)
+    logger.info(f"Bulk TTS job {batch_id} received from {source}: {len(parsed)} line(s)")
+    
+    headers = {
+        "X-Batch-ID": batch_id,
+        "X-Batch-Lines": str(len(parsed)),
+        "Content-Disposition": f'attachment; filename="tts_batch_{batch_id}.{archive}"'
+    }
+    return StreamingResponse(
+        stream_bulk_archive(
+            job, parsed, functools.partial(synthesize_bulk_line, client=client_key(http_request)), BULK_CONCURRENCY,
+            archive
+        ),
+        media_type=ARCHIVE_MEDIA_TYPES[archive],
+        headers=headers
+    )
+
+@app.get("/tts/batch/{batch_id}")
+async def get_tts_batch_status(batch_id: str, lines: bool = True):
+    """Progress of a bulk job, with the status of every line"""
+    job = bulk_jobs.get(batch_id)
+    if job is None:
+        # Possibly received by another instance; its last published counts (without the lines)
+        record = await run_in_threadpool(coordinator.lookup, batch_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Bulk job not found")
+        return dict(record["status"], batch_id=batch_id, instance=record["instance_id"], updated=record["updated"])
+    return job.to_dict(include_lines=lines)
+
+async def synthesize_bulk_line(obj, request_id, client=None):
+    """Synthesize one line of a bulk job, waiting for room when the queue is full"""
+    request = TTSRequest(**{**obj, "request_id": request_id})
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    timer = start_request(request_id)
+    try:
+        request = plan_quality(request, request_id)
+    except HTTPException as e:
+        record_request("tts_batch", e.status_code, timer)
+        raise
+    annotate_request(request)
+    while True:
+        try:
+            audio, _, _ = await generate_audio(request, request_id, timestamp, time.time(), timer, client=client)
+        except HTTPException as e:
+            if e.status_code != 503:
+                record_request("tts_batch", e.status_code, timer)
+                raise
+            await asyncio.sleep(int(e.headers.get("Retry-After", "1")))
+            continue
+        record_request("tts_batch", 200, timer)
+        return audio
+
+@app.post("/tts/jobs", status_code=202)
+async def create_document_job(request: TTSRequest, http_request: Request):
+    """Synthesize a long document as a resumable job of chunks synthesized in parallel
+    
+    Progress is reported by /tts-status/{request_id}, the stitched WAV is
+    fetched from /tts-result/{request_id}.
+    """
+    job_id = request.request_id or str(uuid.uuid4())
+    if document_jobs.get(job_id) is not None:
+        raise HTTPException(status_code=409, detail="A document job with this request ID already exists")
+    chunks = split_document(request.gen_text, DOCUMENT_CHUNK_CHARS)
+    if not chunks:
+        raise HTTPException(status_code=400, detail="The document contains no text")
+    
+    request = plan_quality(request, job_id)
+    settings = request.model_dump(exclude={"gen_text", "request_id"})
+    job = document_jobs.create(job_id, settings, chunks, resolve_seed(request), client=client_key(http_request))
+    logger.info(f"Document job {job_id} received: {len(request.gen_text)} characters in {len(chunks)} chunk(s)")
+    return {
+        **job.to_dict(),
+        "status_url": f"/tts-status/{job_id}",
+        "result_url": f"/tts-result/{job_id}",
+    }
+
+@app.post("/tts/jobs/{job_id}/resume")
+async def resume_document_job(job_id: str):
+    """Restart a failed or cancelled document job; chunks that already finished are kept"""
+    job = document_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Document job not found")
+    if job.status != JOB_COMPLETED and not document_jobs.start(job):
+        raise HTTPException(status_code=409, detail="Document job is still running")
+    return job.to_dict()
+
+async def synthesize_document_chunk(job, index, request_id):
+    """Synthesize one chunk of a document job, waiting for room when the queue is full"""
+    request = TTSRequest(**{
+        **job.request,
+        "gen_text": job.chunks[index],
+        "request_id": request_id,
+        "randomize_seed": False,
+        "seed": job.chunk_seed(index),
+    })
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    timer = start_request(request_id)
+    annotate_request(request, document=job.job_id, chunk=index)
+    try:
+        with timer.stage("ingest_wait"):
+            await voice_ingest.wait(request.ref_audio)
+        while True:
+            try:
+                audio, _ = await run_tts_job(
+                    request_id, synthesize_request, request, request_id, timestamp, time.time(), request.seed, timer,
+                    timer=timer, request=request, client=job.client
+                )
+                break
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                await asyncio.sleep(int(e.headers.get("Retry-After", "1")))
+    except HTTPException as e:
+        record_request("tts_document", e.status_code, timer)
+        raise
+    except asyncio.CancelledError:
+        record_request("tts_document", 499, timer)
+        raise
+    record_request("tts_document", 200, timer)
+    return audio
+
+document_jobs = DocumentJobManager(
+    os.path.join(project_root, "cache", "documents"),
+    synthesize_document_chunk,
+    output_store.save_file,
+    SAMPLE_RATE,
+    concurrency=DOCUMENT_CONCURRENCY,
+    ttl=OUTPUT_STORE_TTL,
+    on_update=publish_document_job,
+)
+
+def annotate_request(request, **fields):
+    """Add a request's main parameters to its log summary"""
+    request_logger.annotate(
+        chars=len(request.gen_text), voice=request.ref_audio, nfe_steps=request.nfe_steps, speed=request.speed, **fields
+    )
+
+def resolve_output_format(request, http_request):
+    """Output format (from ``format``, else the Accept header) and bitrate of a request"""
+    try:
+        output_format = negotiate_format(request.format, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return output_format, request.bitrate or OUTPUT_BITRATES.get(output_format)
+
+def plan_quality(request, request_id):
+    """Settle a request's sampler step count from its quality tier and deadline
+
+    Returns a copy of the request with ``nfe_steps`` set to the chosen count.
+    """
+    queue_wait = 0.0
+    if job_queue.depth or job_queue.in_flight >= job_queue.max_concurrency:
+        queue_wait = job_queue.estimate_wait(job_queue.depth + 1)
+    deadline = request.deadline_ms / 1000 if request.deadline_ms is not None else None
+    try:
+        nfe_steps, reason = quality_planner.choose(
+            request.nfe_steps, len(request.gen_text), quality=request.quality, deadline=deadline, queue_wait=queue_wait
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    nfe_steps_total.inc(nfe_steps=nfe_steps, reason=reason)
+    if nfe_steps != request.nfe_steps:
+        estimate = quality_planner.estimate(nfe_steps, len(request.gen_text), queue_wait)
+        logger.info(f"Using {nfe_steps} NFE steps instead of {request.nfe_steps} for request {request_id} ({reason}"
+                    + (f", estimated {estimate:.2f}s)" if estimate is not None else ")"))
+    return request.model_copy(update={"nfe_steps": nfe_steps})
+
+async def generate_audio(request, request_id, timestamp, start_time, timer, client=None):
+    """Synthesize a request through the job queue and result cache
+    
+    Returns the WAV bytes, the seed that was used and the cache status.
+    Stage timings are recorded on ``timer``; ``client`` is the fair-share
+    key the job is queued under.
+    """
+    # A freshly uploaded voice may still be converting
+    with timer.stage("ingest_wait"):
+        await voice_ingest.wait(request.ref_audio)
+    used_seed = resolve_seed(request)
+    
+    # Requests with a fixed seed are deterministic and can be served from the result cache
+    with timer.stage("cache_key"):
+        cache_key = await run_in_threadpool(result_cache_key, request)
+    
+    if cache_key is None:
+        audio, used_seed = await run_tts_job(
+            request_id, synthesize_request, request, request_id, timestamp, start_time, used_seed, timer,
+            timer=timer, request=request, client=client
+        )
+        return audio, used_seed, CACHE_BYPASS
+    
+    async def compute():
+        audio, _ = await run_tts_job(
+            request_id, synthesize_request, request, request_id, timestamp, start_time, used_seed, timer,
+            timer=timer, request=request, client=client
+        )
+        return {"audio": audio, "seed": used_seed}
+    
+    entry, cache_status = await result_cache.get_or_compute(cache_key, compute)
+    return entry["audio"], entry["seed"], cache_status
+
+def result_cache_key(request):
+    """Cache key for a request, or None if its output is not reproducible"""
+    if request.randomize_seed or request.seed is None or not 0 <= request.seed <= 2**31 - 1:
+        return None
+    if len(set(tts_engine.worker_modes)) > 1:
+        # Which worker runs the request decides the output (int8 and fp32 differ), so a seed does not pin it
+        return None
+    
+    ref_audio_path = os.path.join(project_root, "ref_audios", request.ref_audio)
+    try:
+        voice_key = voice_registry.voice_key(ref_audio_path)
+    except OSError:
+        return None
+    
+    ref_text = request.ref_text.strip()
+    if not ref_text:
+        # The voice's sidecar text is used instead (transcription if there is none); editing it changes the audio
+        ref_audio_index.refresh()
+        ref_text = ref_audio_index.text(request.ref_audio)
+    
+    return make_cache_key({
+        "gen_text": request.gen_text,
+        "voice": voice_key,
+        "ref_text": ref_text,
+        "speed": request.speed,
+        "nfe_steps": request.nfe_steps,
+        "crossfade_duration": request.crossfade_duration,
+        "remove_silence": request.remove_silence,
+        "seed": request.seed,
+        "model": ENGINE_MODEL,
+        "mode": tts_engine.worker_modes[0]
+    })
+
+def client_key(connection):
+    """Fair-share key of a request: its API key, else its X-Client-ID header, else the client address"""
+    api_key = connection.headers.get("x-api-key")
+    authorization = connection.headers.get("authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if api_key:
+        # Keys are only compared, never shown
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    client_id = connection.headers.get("x-client-id")
+    if client_id:
+        return "id:" + client_id[:64]
+    return "ip:" + (connection.client.host if connection.client else "unknown")
+
+def route_request(request, http_request):
+    """Redirect a synthesis request to the instance that has its voice warm, or None to serve it here"""
+    if http_request.query_params.get("routed"):
+        # Already redirected once; never bounce a request twice
+        return None
+    target = coordinator.route(request.ref_audio)
+    if target is None:
+        return None
+    logger.info(f"Routing request for voice {request.ref_audio} to instance {target['instance_id']}")
+    return RedirectResponse(
+        f"{target['url']}{http_request.url.path}?routed={coordinator.instance_id}", status_code=307
+    )
+
+def estimate_request_cost(request):
+    """Scheduling cost of a request from its text length, reference voice and step count"""
+    ref_audio_path = os.path.join(project_root, "ref_audios", request.ref_audio)
+    ref_seconds = None
+    try:
+        meta = voice_registry.metadata(voice_registry.voice_key(ref_audio_path))
+        if meta is not None:
+            ref_seconds = meta["frames"] * meta["hop_length"] / meta["sample_rate"]
+        else:
+            ref_seconds = min(sf.info(ref_audio_path).duration, REF_MAX_SECONDS)
+    except (OSError, RuntimeError, KeyError, ZeroDivisionError):
+        pass
+    if not ref_seconds:
+        ref_seconds = REF_MAX_SECONDS
+    ref_text = request.ref_text.strip() or ref_audio_index.text(request.ref_audio)
+    return job_cost(len(request.gen_text.encode("utf-8")), request.nfe_steps, ref_seconds,
+                    len(ref_text.encode("utf-8")) or None)
+
+async def run_tts_job(request_id, fn, *args, timer=None, request=None, client=None):
+    """Run a blocking TTS job function on the job queue, mapping queue errors to HTTP errors
     
+    With the TTSRequest ``request``, the job is scheduled by its estimated
+    cost; ``client`` is the key its fair share is accounted under. If the
+    caller stops waiting (its task is cancelled), the job is cancelled too.
+    """
+    queued_at = time.perf_counter()
+    cost = None
+    if request is not None:
+        cost = await run_in_threadpool(estimate_request_cost, request)
+    job_fn = fn
+    
+    def fn(*args):
+        if timer is not None:
+            timer.add("queue", time.perf_counter() - queued_at)
+        try:
+            return job_fn(*args)
+        finally:
+            with process_lock:
+                cancelled_requests.discard(request_id)
+    
+    try:
+        return await job_queue.run(request_id, fn, *args, cost=cost, client=client)
+    except asyncio.CancelledError:
+        # Nobody is waiting for the result any more
+        cancel_request(request_id)
+        raise
+    except QueueFullError as e:
+        logger.warning(f"Rejecting TTS request {request_id}: queue is full ({job_queue.depth} waiting)")
+        raise HTTPException(
+            status_code=503,
+            detail="TTS queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except JobCancelled:
+        logger.info(f"TTS request {request_id} was cancelled while queued")
+        raise HTTPException(status_code=499, detail="TTS generation was cancelled")
+    except DuplicateJobError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def cancel_request(request_id):
+    """Cancel a request wherever it is in the pipeline
+
+    Queued requests are dropped from the job queue, requests in the engine
+    are cancelled there (the worker stays up), and requests still preparing
+    their engine job are flagged so that they stop before dispatch. Returns
+    False if the request is not in progress. Document jobs stop with their
+    finished chunks kept.
+    """
+    if document_jobs.cancel(request_id):
+        logger.info(f"Stopped document job {request_id}")
+        return True
+    if job_queue.cancel(request_id):
+        logger.info(f"Removed queued TTS request {request_id} from the queue")
+        return True
+    if tts_engine.cancel(request_id):
+        with process_lock:
+            running_processes.pop(request_id, None)
+        return True
+    queue_status = job_queue.status(request_id)
+    if queue_status is not None and queue_status["state"] == "running":
+        with process_lock:
+            cancelled_requests.add(request_id)
+        logger.info(f"TTS request {request_id} will be cancelled before it reaches the engine")
+        return True
+    return False
+
+async def cancel_on_disconnect(http_request, request_id, task):
+    """Cancel a request's synthesis if its client disconnects before ``task`` is done"""
+    while not task.done():
+        if await http_request.is_disconnected():
+            if cancel_request(request_id):
+                cancellations_total.inc(reason="disconnect")
+                logger.info(f"Client of TTS request {request_id} disconnected, job cancelled")
+            return
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+
+def resolve_seed(request):
+    """Seed for a request: the requested one if valid, otherwise a random one"""
+    # Handle seed setting for reproducibility
+    if request.randomize_seed:
+        # Generate random seed like F5-TTS does
+        used_seed = np.random.randint(0, 2**31 - 1)
+        logger.info(f"Generated random seed: {used_seed}")
+    else:
+        # Use provided seed, with validation
+        if request.seed is None or request.seed < 0 or request.seed > 2**31 - 1:
+            logger.warning(f"Invalid seed {request.seed}, using random seed instead")
+            used_seed = np.random.randint(0, 2**31 - 1)
+        else:
+            used_seed = request.seed
+        logger.info(f"Using specified seed: {used_seed}")
+    
+    return int(used_seed)
+
+def build_engine_job(request, used_seed, timer):
+    """Resolve reference audio, reference text and voice features into an engine job"""
     # Handle folder-aware ref audio paths
     ref_audio_path = os.path.join(project_root, "ref_audios", request.ref_audio)
-    output_filename = f"{timestamp}.wav"
-    output_path = os.path.join("output", output_filename)
     
     logger.info(f"Using reference audio: {ref_audio_path}")
-    logger.info(f"Output file: {output_path}")
 
     # Reference text priority: user textarea > .txt file > F5-TTS preprocessing
-    processed_ref_audio = ref_audio_path
+    ref_text_start = time.perf_counter()
+    # Clipped reference audio from the reference cache, when it was consulted
+    processed_ref_audio = None
     processed_ref_text = request.ref_text.strip()
     
     if processed_ref_text:
@@ -431,10 +1493,9 @@ async def text_to_speech(request: TTSRequest):
         if not processed_ref_text and F5_TTS_AVAILABLE:
             try:
                 logger.info("No reference text found, using F5-TTS preprocessing to generate it")
-                processed_ref_audio, processed_ref_text = preprocess_ref_audio_text(
-                    ref_audio_path, 
-                    "", 
-                    show_info=logger.info
+                processed_ref_audio, processed_ref_text = ref_audio_cache.get(
+                    ref_audio_path,
+                    lambda path: preprocess_ref_audio_text(path, "", show_info=logger.info)
                 )
                 logger.info(f"F5-TTS generated reference text: '{processed_ref_text[:100]}{'...' if len(processed_ref_text) > 100 else ''}'")
             except Exception as e:
@@ -442,202 +1503,265 @@ async def text_to_speech(request: TTSRequest):
                 processed_ref_text = ""
         elif not processed_ref_text:
             logger.info("No reference text available from any source")
+    timer.add("ref_text", time.perf_counter() - ref_text_start)
 
-    # Handle seed setting for reproducibility
-    if request.randomize_seed:
-        # Generate random seed like F5-TTS does
-        import numpy as np
-        used_seed = np.random.randint(0, 2**31 - 1)
-        logger.info(f"Generated random seed: {used_seed}")
-    else:
-        # Use provided seed, with validation
-        if request.seed is None or request.seed < 0 or request.seed > 2**31 - 1:
-            logger.warning(f"Invalid seed {request.seed}, using random seed instead")
-            import numpy as np
-            used_seed = np.random.randint(0, 2**31 - 1)
-        else:
-            used_seed = request.seed
-        logger.info(f"Using specified seed: {used_seed}")
-    
-    # Set PyTorch seed for reproducibility
+    # Conditioning features are computed once per voice and reused across requests
+    features_path = None
     try:
-        import torch
-        torch.manual_seed(used_seed)
-        logger.info(f"Set PyTorch manual seed to: {used_seed}")
-    except ImportError:
-        logger.warning("PyTorch not available for seed setting")
-
-    command = [
-        "f5-tts_infer-cli",
-        "--model", "F5TTS_v1_Base",
-        "--ref_audio", processed_ref_audio,
-        "--gen_text", request.gen_text,
-        "-o", "output",
-        "-w", output_filename
-    ]
-    
-    # Add reference text if available (either provided or generated)
-    if processed_ref_text:
-        command.extend(["--ref_text", processed_ref_text])
-    
-    # Add remove silence flag if enabled
-    if request.remove_silence:
-        command.append("--remove_silence")
-        logger.info("Added --remove_silence flag to F5-TTS command")
+        voice_key = voice_registry.voice_key(ref_audio_path)
+        features_path = voice_registry.features_path(voice_key)
+        # The voice is warm on this instance from now on; other instances route its requests here
+        coordinator.touch_voice(request.ref_audio)
+        if voice_registry.has_features(voice_key):
+            logger.info(f"Using precomputed voice features {voice_key[:12]}")
+            voice_features_total.inc(result="hit")
+        else:
+            voice_features_total.inc(result="miss")
+            logger.info(f"Voice features {voice_key[:12]} will be computed on first use")
+    except OSError as e:
+        logger.warning(f"Could not resolve voice features for {ref_audio_path}: {e}")
 
-    logger.info(f"Executing TTS command: {' '.join(command)}")
-    logger.info("Starting TTS generation...")
+    job = {
+        "ref_audio": ref_audio_path,
+        "processed_ref_audio": processed_ref_audio,
+        "features_path": features_path,
+        "ref_text": processed_ref_text,
+        "gen_text": request.gen_text,
+        "remove_silence": request.remove_silence,
+        "speed": request.speed,
+        "seed": used_seed,
+        "nfe_steps": request.nfe_steps,
+        "crossfade_duration": request.crossfade_duration,
+    }
+    if request.remove_silence:
+        logger.info("Silence removal enabled for this request")
+    if request.speed != 1.0:
+        logger.info(f"Applying in-process speed change: {request.speed}x")
     
-    try:
-        # Start the process using Popen so we can track and terminate it
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        # Store the process in our tracking dictionary
+    return job
+
+def run_engine_job(request_id, job, timestamp, start_time, timer, on_chunk=None):
+    """Run a job on the resident engine, tracking it in running_processes for cancellation"""
+    logger.info("Starting TTS generation on resident engine...")
+
+    def register_process(process):
+        # Track the worker running this request so it can be cancelled
         with process_lock:
             running_processes[request_id] = {
                 'process': process,
                 'timestamp': timestamp,
                 'start_time': start_time
             }
-        
-        logger.info(f"TTS process started with PID: {process.pid}, Request ID: {request_id}")
-        
-        # Wait for the process to complete
-        stdout, stderr = process.communicate()
-        
+            cancelled = request_id in cancelled_requests
+        coordinator.publish(request_id, STATE_RUNNING, pid=process.pid, start_time=start_time, timestamp=timestamp)
+        logger.info(f"TTS job dispatched to worker PID: {process.pid}, Request ID: {request_id}")
+        if cancelled:
+            # Cancelled after the check below but before the engine knew the job
+            tts_engine.cancel(request_id)
+
+    with process_lock:
+        if request_id in cancelled_requests:
+            logger.info(f"TTS request {request_id} was cancelled before reaching the engine")
+            raise HTTPException(status_code=499, detail="TTS generation was cancelled")
+
+    try:
+        result = tts_engine.synthesize(request_id, job, on_dispatch=register_process, on_chunk=on_chunk)
+        # Stages measured inside the engine (batch wait, features, sampling, vocoding, post-processing)
+        for stage, seconds in result.get("timings", {}).items():
+            timer.add(stage, seconds)
+        quality_planner.observe(job["nfe_steps"], len(job["gen_text"]), result.get("timings", {}))
+        logger.info(f"TTS generation completed successfully ({result['duration']:.2f}s of audio)")
+    except EngineCancelled:
+        raise HTTPException(status_code=499, detail="TTS generation was cancelled")
+    except EngineError as e:
+        logger.error(f"TTS generation failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Error during TTS generation: {e}")
+    finally:
         # Remove from tracking dictionary when done
         with process_lock:
             if request_id in running_processes:
                 del running_processes[request_id]
                 logger.info(f"Removed completed process {request_id} from tracking")
-        
-        # Check if process was successful
-        if process.returncode != 0:
-            logger.error(f"TTS generation failed with return code {process.returncode}")
-            logger.error(f"TTS stderr: {stderr}")
-            logger.error(f"TTS stdout: {stdout}")
-            if process.returncode == -15:  # SIGTERM (process was killed)
-                raise HTTPException(status_code=499, detail="TTS generation was cancelled")
-            else:
-                raise HTTPException(status_code=500, detail=f"Error during TTS generation: {stderr}")
-        
-        logger.info("TTS generation completed successfully")
-        if stdout:
-            logger.info(f"TTS stdout: {stdout}")
-        if stderr:
-            logger.info(f"TTS stderr: {stderr}")
-            
-    except FileNotFoundError:
-        # Clean up tracking if command not found
-        with process_lock:
-            if request_id in running_processes:
-                del running_processes[request_id]
-        logger.error("f5-tts_infer-cli command not found")
-        raise HTTPException(status_code=500, detail="'f5-tts_infer-cli' not found. Ensure the virtual environment is activated and dependencies are installed correctly.")
-    except Exception as e:
-        # Clean up tracking on any other exception
-        with process_lock:
-            if request_id in running_processes:
-                del running_processes[request_id]
-        raise e
 
-    if os.path.exists(output_path):
-        final_output_path = output_path
-        
-        # Apply speed change if needed
-        if request.speed != 1.0:
-            logger.info(f"Applying speed change: {request.speed}x")
-            speed_output_path = os.path.join("output", f"{timestamp}_speed_{request.speed}.wav")
-            
-            if apply_speed_change(output_path, speed_output_path, request.speed):
-                final_output_path = speed_output_path
-                logger.info(f"Speed change applied successfully")
-            else:
-                logger.warning(f"Speed change failed, using original audio")
-        
-        # Log file details
-        file_size = os.path.getsize(final_output_path)
-        generation_time = time.time() - start_time
-        
-        logger.info(f"Audio file generated successfully")
-        logger.info(f"File size: {file_size} bytes ({file_size/1024:.1f} KB)")
-        logger.info(f"Generation time: {generation_time:.2f} seconds")
-        logger.info(f"Request {timestamp} completed successfully")
-        
-        def iter_file():
-            with open(final_output_path, "rb") as file_like:
-                yield from file_like
-        
-        # Add generation time and seed to response headers
-        headers = {
-            "X-Generation-Time": str(generation_time),
-            "X-File-Size": str(file_size),
-            "X-Used-Seed": str(used_seed),
-            "X-Request-ID": request_id
-        }
-        
-        return StreamingResponse(iter_file(), media_type="audio/wav", headers=headers)
-    else:
-        logger.error(f"Generated audio file not found at {output_path}")
-        logger.error(f"Request {timestamp} failed - file not found")
-        raise HTTPException(status_code=404, detail="Generated audio file not found. The TTS command may have failed silently.")
+    return result
+
+def synthesize_request(request, request_id, timestamp, start_time, used_seed, timer):
+    """Blocking part of a TTS request, run on the job queue's thread pool
+
+    Returns the WAV bytes of the generated audio and the seed that was used.
+    """
+    job = build_engine_job(request, used_seed, timer)
+    result = run_engine_job(request_id, job, timestamp, start_time, timer)
+    
+    with timer.stage("encode"):
+        waveform = result["audio"]
+        audio = wav_header(result["sample_rate"], len(waveform)) + float_to_pcm16(waveform)
+    return audio, used_seed
+
+def synthesize_request_stream(request, request_id, timestamp, start_time, used_seed, on_chunk, timer):
+    """Blocking part of a streaming TTS request; each sentence batch is passed to on_chunk"""
+    job = build_engine_job(request, used_seed, timer)
+    return run_engine_job(request_id, job, timestamp, start_time, timer, on_chunk=on_chunk)
+
+@app.get("/tts-result/{request_id}")
+async def get_tts_result(request_id: str):
+    """Fetch the stored audio of a completed request (requires store_output)"""
+    path = output_store.get(request_id)
+    if path is None or not os.path.isfile(path):
+        # Stored by another instance
+        record = await run_in_threadpool(coordinator.lookup, request_id)
+        owner = coordinator.peer(record["instance_id"]) if record is not None else None
+        # Processes of one deployment share a URL and the output directory; a redirect to it would loop
+        if owner is not None and owner["url"] and owner["url"] != coordinator.url and "result_url" in record["status"]:
+            return RedirectResponse(f"{owner['url']}/tts-result/{request_id}", status_code=307)
+        raise HTTPException(status_code=404, detail="No stored result for this request")
+    return FileResponse(path, media_type="audio/wav", filename=os.path.basename(path))
 
 @app.post("/cancel-tts/{request_id}")
 async def cancel_tts_generation(request_id: str):
-    """Cancel a running TTS generation process"""
+    """Cancel a queued or running TTS generation"""
     
-    with process_lock:
-        if request_id not in running_processes:
-            logger.info(f"Cancel request for {request_id}: Process not found (likely already completed)")
+    try:
+        cancelled = cancel_request(request_id)
+    except Exception as e:
+        logger.error(f"Error cancelling TTS request {request_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to cancel TTS generation: {str(e)}")
+    
+    if not cancelled:
+        owner = await run_in_threadpool(coordinator.request_cancel, request_id)
+        if owner is not None:
+            logger.info(f"Cancel request for {request_id} forwarded to instance {owner}")
             return {
-                "message": "TTS request not found or already completed",
+                "message": "TTS generation will be cancelled by the instance running it",
                 "request_id": request_id,
-                "status": "already_completed"
-            }
-        
-        process_info = running_processes[request_id]
-        process = process_info['process']
-        
-        try:
-            # For F5-TTS inference, use immediate force kill since SIGTERM often doesn't work during inference
-            process.kill()  # Send SIGKILL directly
-            logger.info(f"Force killed TTS process with PID: {process.pid}, Request ID: {request_id}")
-            
-            # Wait for the process to be fully terminated
-            try:
-                process.wait(timeout=2)
-                logger.info(f"TTS process {process.pid} terminated successfully")
-            except subprocess.TimeoutExpired:
-                logger.warning(f"TTS process {process.pid} did not terminate within timeout")
-            
-            # Remove from tracking dictionary
-            del running_processes[request_id]
-            
-            return {
-                "message": "TTS generation cancelled successfully",
-                "request_id": request_id
+                "status": "cancel_requested",
+                "instance": owner
             }
-            
-        except Exception as e:
-            logger.error(f"Error cancelling TTS process {request_id}: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to cancel TTS generation: {str(e)}")
+        logger.info(f"Cancel request for {request_id}: Process not found (likely already completed)")
+        return {
+            "message": "TTS request not found or already completed",
+            "request_id": request_id,
+            "status": "already_completed"
+        }
+    
+    cancellations_total.inc(reason="client")
+    return {
+        "message": "TTS generation cancelled successfully",
+        "request_id": request_id
+    }
 
 @app.get("/tts-status/{request_id}")
 async def get_tts_status(request_id: str):
     """Get the status of a TTS generation request"""
     
+    document = document_jobs.get(request_id)
+    if document is not None and not document.active:
+        # Run by another process, which publishes its progress
+        record = await run_in_threadpool(coordinator.lookup, request_id)
+        if record is not None:
+            return dict(record["status"], request_id=request_id, instance=record["instance_id"],
+                        updated=record["updated"])
+    if document is not None:
+        status = document.to_dict()
+        if status["status"] == JOB_COMPLETED:
+            status["result_url"] = f"/tts-result/{request_id}"
+        return status
+    
+    queue_status = job_queue.status(request_id)
+    timer = request_timings.get(request_id)
+    
     with process_lock:
-        if request_id in running_processes:
-            process_info = running_processes[request_id]
-            return {
-                "status": "running",
+        process_info = running_processes.get(request_id)
+    
+    if process_info is not None:
+        status = {
+            "status": "running",
+            "request_id": request_id,
+            "pid": process_info['process'].pid,
+            "start_time": process_info['start_time'],
+            "timestamp": process_info['timestamp']
+        }
+        if queue_status:
+            status["wait_time"] = queue_status["wait_time"]
+    elif queue_status is None:
+        if output_store.get(request_id) is not None:
+            status = {
+                "status": "completed",
                 "request_id": request_id,
-                "pid": process_info['process'].pid,
-                "start_time": process_info['start_time'],
-                "timestamp": process_info['timestamp']
+                "result_url": f"/tts-result/{request_id}"
             }
-        else:
-            return {
-                "status": "not_found",
+        elif timer is not None and timer.finished is not None:
+            status = {
+                "status": request_outcome(timer.status_code),
                 "request_id": request_id
             }
+            if timer.status_code is not None and timer.status_code >= 400:
+                status["http_status"] = timer.status_code
+        else:
+            # Possibly handled by another instance; its last published state
+            record = await run_in_threadpool(coordinator.lookup, request_id)
+            if record is None:
+                return {
+                    "status": "not_found",
+                    "request_id": request_id
+                }
+            return dict(record["status"], request_id=request_id, instance=record["instance_id"],
+                        updated=record["updated"])
+    elif queue_status["state"] == "queued":
+        status = {
+            "status": "queued",
+            "request_id": request_id,
+            "queue_position": queue_status["queue_position"],
+            "queue_length": queue_status["queue_length"],
+            "wait_time": queue_status["wait_time"],
+            "estimated_wait": queue_status["estimated_wait"],
+            "estimated_start": queue_status["estimated_start"],
+            "estimated_duration": queue_status["estimated_duration"]
+        }
+    else:
+        # Holding a slot but not yet dispatched to an engine worker (e.g. preprocessing)
+        status = {
+            "status": "preparing",
+            "request_id": request_id,
+            "wait_time": queue_status["wait_time"]
+        }
+    
+    # Per-stage timing breakdown, complete once the request has finished
+    if timer is not None:
+        status["timings"] = timer.to_dict()
+    return status
+
+@app.get("/healthz")
+async def get_health():
+    """Liveness: the server process is up and its event loop responds"""
+    return {"status": "ok", "uptime": time.perf_counter() - IMPORT_STARTED}
+
+@app.get("/readyz")
+async def get_readiness():
+    """Readiness: 200 once the engine has warmed up and has a worker to serve requests, 503 before"""
+    ready_workers = tts_engine.stats()["ready_workers"]
+    status = server_state["status"]
+    if status == "ready" and ready_workers == 0:
+        # All workers are restarting after crashes
+        status = "no_ready_workers"
+    return JSONResponse(
+        {"status": status, "ready_workers": ready_workers, "startup_phases": startup_phases},
+        status_code=200 if status == "ready" else 503
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/engine-stats/")
+async def get_engine_stats():
+    """Engine worker, batching and cache statistics"""
+    return {
+        "engine": tts_engine.stats(),
+        "queue": {"depth": job_queue.depth, "in_flight": job_queue.in_flight},
+        "quality": quality_planner.stats(),
+        "result_cache": result_cache.stats(),
+        "output_store": output_store.stats(),
+        "cluster": coordinator.stats(),
+    }
@@ -0,0 +1,228 @@
+"""Prometheus metrics and per-request timing breakdowns.
+
+Metrics are kept in-process and rendered in the Prometheus text exposition
+format by ``/metrics``, so no client library is needed. Values that other
+components already track (queue depth, cache counters, ...) are read through
+callbacks at scrape time instead of being copied.
+
+Each request also gets a ``RequestTimer`` whose stage durations feed the
+per-stage histogram and are returned in the ``Server-Timing`` header and in
+``/tts-status``.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (milliseconds) up to long multi-batch syntheses
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose samples are read from ``fn`` at scrape time
+
+    ``fn`` returns a number, or a dict mapping label value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), metric_type="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.type = metric_type
+
+    def _samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_fn(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, "gauge"))
+
+    def counter_fn(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, "counter"))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+class RequestTimer:
+    """Stage durations of one request, in the order the stages ran"""
+
+    def __init__(self, request_id, on_stage=None):
+        self.request_id = request_id
+        self.started = time.time()
+        self.finished = None
+        # HTTP status the request finished with
+        self.status_code = None
+        self.stages = OrderedDict()
+        self._on_stage = on_stage
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        """Record ``seconds`` spent in ``stage`` (added up if the stage repeats)"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self._on_stage is not None:
+            self._on_stage(stage, seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def finish(self, status_code=None):
+        self.finished = time.time()
+        self.status_code = status_code
+
+    def server_timing(self):
+        """Value for the ``Server-Timing`` response header"""
+        with self._lock:
+            entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        total = (self.finished or time.time()) - self.started
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self):
+        with self._lock:
+            stages = dict(self.stages)
+        return {
+            "stages": stages,
+            "total": (self.finished or time.time()) - self.started,
+        }
+
+
+class TimingStore:
+    """Timers of recent requests by request ID, for status queries"""
+
+    def __init__(self, max_entries=1000, on_stage=None):
+        self.max_entries = max_entries
+        self.on_stage = on_stage
+        self._timers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, request_id):
+        timer = RequestTimer(request_id, on_stage=self.on_stage)
+        with self._lock:
+            self._timers[request_id] = timer
+            self._timers.move_to_end(request_id)
+            while len(self._timers) > self.max_entries:
+                self._timers.popitem(last=False)
+        return timer
+
+    def get(self, request_id):
+        with self._lock:
+            return self._timers.get(request_id)
@@ -0,0 +1,142 @@
+"""Bounded on-disk store for generated audio.
+
+Generated audio is normally streamed straight from memory and never touches
+the disk. Clients that want to fetch a result again later (for example after
+reconnecting) can opt in to persisting it here under its request ID. The
+store is capped by total size and by age: expired artifacts are removed
+first, then the least recently accessed ones until the store fits.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def safe_name(request_id):
+    """Filesystem-safe form of a request or job ID"""
+    return re.sub(r'[^a-zA-Z0-9._-]', '_', request_id)
+
+
+class OutputStore:
+    """Size- and TTL-bounded LRU store of audio artifacts keyed by request ID"""
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttl=24 * 3600, extension=".wav"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.extension = extension
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Index artifacts left over from a previous run, oldest access first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extension):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, name[:-len(self.extension)], path, stat))
+        for accessed, key, path, stat in sorted(entries):
+            self._index[key] = {"path": path, "size": stat.st_size, "created": stat.st_mtime, "accessed": accessed}
+            self._total_bytes += stat.st_size
+        if entries:
+            logger.info(f"Output store indexed {len(entries)} existing artifact(s), {self._total_bytes} bytes")
+
+    def save(self, request_id, audio):
+        """Persist ``audio`` bytes for ``request_id`` and return the file path"""
+        key = safe_name(request_id)
+        path = os.path.join(self.directory, key + self.extension)
+        with open(path + ".tmp", "wb") as f:
+            f.write(audio)
+        os.replace(path + ".tmp", path)
+        self._add(key, path, len(audio))
+        return path
+
+    def save_file(self, request_id, source_path):
+        """Move the finished file at ``source_path`` into the store for ``request_id``"""
+        key = safe_name(request_id)
+        path = os.path.join(self.directory, key + self.extension)
+        os.replace(source_path, path)
+        self._add(key, path, os.path.getsize(path))
+        return path
+
+    def _add(self, key, path, size):
+        now = time.time()
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous["size"]
+            self._index[key] = {"path": path, "size": size, "created": now, "accessed": now}
+            self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def get(self, request_id):
+        """Path of the stored artifact for ``request_id``, or None
+
+        Artifacts saved by other processes sharing the directory are indexed
+        on first access.
+        """
+        key = safe_name(request_id)
+        with self._lock:
+            known = key in self._index
+        if not known:
+            self._index_shared(key)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or time.time() - entry["created"] > self.ttl:
+                return None
+            entry["accessed"] = time.time()
+            self._index.move_to_end(key)
+            return entry["path"]
+
+    def _index_shared(self, key):
+        path = os.path.join(self.directory, key + self.extension)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            if key not in self._index:
+                self._index[key] = {
+                    "path": path, "size": stat.st_size, "created": stat.st_mtime, "accessed": time.time(),
+                }
+                self._total_bytes += stat.st_size
+
+    def evict(self):
+        """Remove expired artifacts, then least recently used ones beyond the size cap"""
+        now = time.time()
+        removed = []
+        with self._lock:
+            for key, entry in list(self._index.items()):
+                if now - entry["created"] > self.ttl:
+                    removed.append(self._index.pop(key))
+            while self._total_bytes - sum(e["size"] for e in removed) > self.max_bytes and self._index:
+                _, entry = self._index.popitem(last=False)
+                removed.append(entry)
+            self._total_bytes -= sum(e["size"] for e in removed)
+
+        for entry in removed:
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Output store evicted {len(removed)} artifact(s)")
+        return len(removed)
+
+    def stats(self):
+        with self._lock:
+            return {"artifacts": len(self._index), "bytes": self._total_bytes}
@@ -0,0 +1,94 @@
+"""Quality tiers and deadline-driven choice of sampler steps (NFE).
+
+Sampling cost grows linearly with the number of flow-matching steps, so the
+step count is the main quality/latency trade-off. A request can cap it with
+a quality tier, and can ask for a deadline: the planner then picks the
+largest step count whose estimated completion time (queue wait plus
+measured per-step sampling cost plus fixed overhead) still meets it.
+
+Only a few step counts are ever chosen (``NFE_LADDER``), because the engine
+batches jobs with equal step counts together; a continuous choice would
+split batches.
+"""
+
+import threading
+
+# Step counts the planner steps down through, highest quality first
+NFE_LADDER = (32, 24, 16, 12, 8, 6, 4)
+MIN_NFE_STEPS = NFE_LADDER[-1]
+# Most steps a request may ask for; each step is a full model pass for every
+# request sharing the batch
+MAX_NFE_STEPS = 64
+
+# Upper bound on the step count per tier; None keeps the requested count
+QUALITY_TIERS = {
+    "high": None,
+    "balanced": 16,
+    "fast": 8,
+}
+
+
+class QualityPlanner:
+    """Estimates synthesis time from recent jobs and picks step counts for deadlines"""
+
+    def __init__(self, smoothing=0.2):
+        self.smoothing = smoothing
+        # Sampling seconds per step per character of generated text
+        self._step_cost = None
+        # Engine seconds outside sampling (batch wait, features, vocoding, post-processing)
+        self._overhead = None
+        self._lock = threading.Lock()
+
+    def _smooth(self, old, new):
+        return new if old is None else (1 - self.smoothing) * old + self.smoothing * new
+
+    def observe(self, nfe_steps, chars, timings):
+        """Record the engine stage timings of a finished job"""
+        sampling = timings.get("sampling")
+        if not sampling or nfe_steps <= 0 or chars <= 0:
+            return
+        overhead = sum(seconds for stage, seconds in timings.items() if stage != "sampling")
+        with self._lock:
+            self._step_cost = self._smooth(self._step_cost, sampling / (nfe_steps * chars))
+            self._overhead = self._smooth(self._overhead, overhead)
+
+    def estimate(self, nfe_steps, chars, queue_wait=0.0):
+        """Estimated seconds until a job finishes, or None before any job was observed"""
+        with self._lock:
+            if self._step_cost is None:
+                return None
+            return queue_wait + self._overhead + nfe_steps * chars * self._step_cost
+
+    def choose(self, requested, chars, quality=None, deadline=None, queue_wait=0.0):
+        """Step count for a request and the reason for it
+
+        ``requested`` is the client's step count, kept within 1 and
+        ``MAX_NFE_STEPS`` and capped by the ``quality`` tier. With a
+        ``deadline`` (seconds), the largest ladder step count not above the
+        cap whose estimate meets it is used, or the lowest one if none does.
+        Raises ``ValueError`` for an unknown tier.
+        """
+        if quality is not None and quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier {quality!r}, expected one of {', '.join(QUALITY_TIERS)}")
+
+        nfe_steps = min(max(1, requested), MAX_NFE_STEPS)
+        reason = "requested"
+        cap = QUALITY_TIERS.get(quality)
+        if cap is not None and cap < nfe_steps:
+            nfe_steps, reason = cap, "quality"
+
+        if deadline is None or self.estimate(nfe_steps, chars, queue_wait) is None:
+            return nfe_steps, reason
+
+        candidates = [nfe_steps] + [n for n in NFE_LADDER if n < nfe_steps]
+        for candidate in candidates:
+            if self.estimate(candidate, chars, queue_wait) <= deadline:
+                return candidate, reason if candidate == nfe_steps else "deadline"
+        return candidates[-1], "deadline"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "step_cost_ms_per_char": self._step_cost * 1000 if self._step_cost is not None else None,
+                "overhead_seconds": self._overhead,
+            }
@@ -0,0 +1,162 @@
+"""Persistent cache for reference-audio preprocessing.
+
+F5-TTS preprocessing clips and trims the reference audio and, when no
+reference text is known, transcribes it with an ASR model. The result only
+depends on the audio bytes, so it is cached by a hash of the file content:
+the processed audio and its transcript are kept on disk (surviving restarts)
+and the most recently used entries are also kept in memory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RefAudioCache:
+    """Content-hashed LRU cache of preprocessed reference audio and transcripts"""
+
+    def __init__(self, cache_dir, max_entries=256, max_memory_entries=64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        # path -> (mtime_ns, size, hash) so unchanged files are not re-hashed
+        self._path_hashes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_paths(self, audio_hash):
+        return (os.path.join(self.cache_dir, f"{audio_hash}.wav"),
+                os.path.join(self.cache_dir, f"{audio_hash}.json"))
+
+    def content_hash(self, audio_path):
+        """Hash of the file at ``audio_path``, reusing the last hash if it is unchanged"""
+        stat = os.stat(audio_path)
+        with self._lock:
+            known = self._path_hashes.get(audio_path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+
+        audio_hash = hash_file(audio_path)
+        with self._lock:
+            self._path_hashes[audio_path] = (stat.st_mtime_ns, stat.st_size, audio_hash)
+        return audio_hash
+
+    def _load_from_disk(self, audio_hash):
+        wav_path, meta_path = self._entry_paths(audio_hash)
+        if not (os.path.isfile(wav_path) and os.path.isfile(meta_path)):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable reference cache entry {audio_hash}: {e}")
+            self._remove_entry(audio_hash)
+            return None
+        # Refresh mtime so disk eviction is least-recently-used
+        os.utime(meta_path)
+        return wav_path, meta["ref_text"]
+
+    def _remember(self, audio_hash, entry):
+        with self._lock:
+            self._memory[audio_hash] = entry
+            self._memory.move_to_end(audio_hash)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, audio_path, preprocess):
+        """Return (processed_audio_path, ref_text) for ``audio_path``
+
+        ``preprocess(audio_path)`` is only called on a cache miss and must
+        return the processed audio path and the transcript.
+        """
+        audio_hash = self.content_hash(audio_path)
+
+        with self._lock:
+            entry = self._memory.get(audio_hash)
+            if entry is not None:
+                self._memory.move_to_end(audio_hash)
+        if entry is not None and os.path.isfile(entry[0]):
+            logger.info(f"Reference cache hit (memory) for {os.path.basename(audio_path)}")
+            self.hits += 1
+            return entry
+
+        entry = self._load_from_disk(audio_hash)
+        if entry is not None:
+            logger.info(f"Reference cache hit (disk) for {os.path.basename(audio_path)}")
+            self.hits += 1
+            self._remember(audio_hash, entry)
+            return entry
+
+        logger.info(f"Reference cache miss for {os.path.basename(audio_path)}, preprocessing")
+        self.misses += 1
+        processed_path, ref_text = preprocess(audio_path)
+
+        wav_path, meta_path = self._entry_paths(audio_hash)
+        shutil.copyfile(processed_path, wav_path + ".tmp")
+        os.replace(wav_path + ".tmp", wav_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ref_text": ref_text, "source": audio_path}, f, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        entry = (wav_path, ref_text)
+        self._remember(audio_hash, entry)
+        self._evict_disk()
+        return entry
+
+    def _remove_entry(self, audio_hash):
+        with self._lock:
+            self._memory.pop(audio_hash, None)
+        for path in self._entry_paths(audio_hash):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _evict_disk(self):
+        """Drop least recently used entries beyond ``max_entries``"""
+        try:
+            metas = [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        except OSError:
+            return
+        if len(metas) <= self.max_entries:
+            return
+        metas.sort(key=lambda name: os.path.getmtime(os.path.join(self.cache_dir, name)))
+        for name in metas[:len(metas) - self.max_entries]:
+            audio_hash = os.path.splitext(name)[0]
+            self._remove_entry(audio_hash)
+            logger.info(f"Evicted reference cache entry {audio_hash}")
+
+    def invalidate(self, audio_path):
+        """Forget cached preprocessing for the file at ``audio_path``
+
+        Call before the file is deleted or replaced.
+        """
+        with self._lock:
+            known = self._path_hashes.pop(audio_path, None)
+        audio_hash = known[2] if known else None
+        if audio_hash is None and os.path.isfile(audio_path):
+            audio_hash = hash_file(audio_path)
+        if audio_hash is None:
+            return
+        self._remove_entry(audio_hash)
+        logger.info(f"Invalidated reference cache for {os.path.basename(audio_path)}")
+
+    def stats(self):
+        with self._lock:
+            return {"memory_entries": len(self._memory), "hits": self.hits, "misses": self.misses}
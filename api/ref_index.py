@@ -0,0 +1,164 @@
+"""In-memory index of the reference voices under ``ref_audios/``.
+
+Listing voices used to mean a directory scan plus a read of every sidecar
+``.txt`` on each request. The index is built once at startup and kept
+current by the upload and delete handlers. Changes made outside the server
+are picked up by cheap mtime checks (folder mtimes for added or removed
+files, sidecar mtimes for edited texts), done at most once per
+``check_interval`` seconds. Every change bumps a version that is used as the
+listing's ETag.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".m4a", ".ogg")
+
+
+def is_audio_file(filename):
+    return filename.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class RefAudioIndex:
+    """Reference audio files and their sidecar texts, keyed by ``folder/filename``"""
+
+    def __init__(self, root, folders=("default", "custom"), known_texts=None, check_interval=1.0):
+        self.root = root
+        self.folders = folders
+        self.known_texts = known_texts or {}
+        self.check_interval = check_interval
+        self._entries = {}
+        self._folder_mtimes = {}
+        self._sorted_keys = None
+        # The token keeps ETags from one server run from matching another's
+        self._token = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Scan every folder; called once at startup"""
+        start = time.time()
+        with self._lock:
+            for folder in self.folders:
+                self._scan_folder(folder)
+            self._checked_at = time.monotonic()
+            self._changed()
+        logger.info(f"Indexed {len(self._entries)} reference audio file(s) in {time.time() - start:.3f}s")
+
+    def _sidecar_path(self, key):
+        return os.path.join(self.root, os.path.splitext(key)[0] + ".txt")
+
+    def _load_entry(self, key):
+        """(Re)read one voice's sidecar text; returns False if the audio file is gone"""
+        if not os.path.isfile(os.path.join(self.root, key)):
+            return False
+        sidecar = self._sidecar_path(key)
+        text_mtime = _mtime(sidecar)
+        text = self.known_texts.get(key, "")
+        if text_mtime is not None:
+            try:
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    text = f.read().strip()
+                logger.debug(f"Loaded reference text from {os.path.splitext(key)[0]}.txt")
+            except (OSError, UnicodeDecodeError) as e:
+                logger.error(f"Error reading {sidecar}: {e}")
+        self._entries[key] = {"text": text, "text_mtime": text_mtime}
+        return True
+
+    def _scan_folder(self, folder):
+        """Sync the entries of one folder with its directory listing"""
+        folder_path = os.path.join(self.root, folder)
+        self._folder_mtimes[folder] = _mtime(folder_path)
+        try:
+            present = {f"{folder}/{name}" for name in os.listdir(folder_path) if is_audio_file(name)}
+        except FileNotFoundError:
+            present = set()
+
+        known = {key for key in self._entries if key.startswith(folder + "/")}
+        for key in known - present:
+            del self._entries[key]
+        for key in present - known:
+            if not self._load_entry(key):
+                present.discard(key)
+        return present != known
+
+    def _changed(self):
+        self._version += 1
+        self._sorted_keys = None
+
+    def refresh(self, force=False):
+        """Pick up changes made outside the server, at most once per check interval"""
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+
+            changed = False
+            for folder in self.folders:
+                if _mtime(os.path.join(self.root, folder)) != self._folder_mtimes.get(folder):
+                    changed |= self._scan_folder(folder)
+            # Edited sidecars do not necessarily touch the folder mtime
+            for key, entry in list(self._entries.items()):
+                if _mtime(self._sidecar_path(key)) != entry["text_mtime"]:
+                    self._load_entry(key)
+                    changed = True
+            if changed:
+                self._changed()
+
+    def update(self, folder, filename):
+        """Re-index after the server wrote an audio file or sidecar text"""
+        base = os.path.splitext(filename)[0]
+        with self._lock:
+            if is_audio_file(filename):
+                keys = [f"{folder}/{filename}"]
+            else:
+                keys = [key for key in self._entries if os.path.splitext(key)[0] == f"{folder}/{base}"]
+            for key in keys:
+                if not self._load_entry(key):
+                    self._entries.pop(key, None)
+            self._changed()
+
+    def remove(self, folder, filename):
+        """Drop a voice after the server deleted it"""
+        with self._lock:
+            self._entries.pop(f"{folder}/{filename}", None)
+            self._changed()
+
+    def text(self, key):
+        """Reference text of a voice, or "" if it has none or is not indexed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["text"] if entry is not None else ""
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def listing(self, prefix="", offset=0, limit=None):
+        """One page of the sorted voice keys starting with ``prefix``
+
+        Returns the ETag of the index version, the page of keys, their
+        reference texts and the total number of matching keys.
+        """
+        with self._lock:
+            if self._sorted_keys is None:
+                self._sorted_keys = sorted(self._entries)
+            keys = self._sorted_keys
+            matching = [key for key in keys if key.startswith(prefix)] if prefix else keys
+            page = matching[offset:offset + limit] if limit is not None else matching[offset:]
+            texts = {key: self._entries[key]["text"] for key in page}
+            etag = f'"{self._token}-{self._version}"'
+            return etag, page, texts, len(matching)
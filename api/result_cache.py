@@ -0,0 +1,126 @@
+"""Synthesis result cache with in-flight request coalescing.
+
+With a fixed seed, synthesis is deterministic in its inputs, so the audio for
+a repeated request can be served from memory. Entries are keyed by a
+canonical hash of the effective request parameters, bounded by total size
+(least recently used entries go first) and expire after a TTL. Identical
+requests that arrive while the first one is still running wait for that
+computation instead of starting their own.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_COALESCED = "COALESCED"
+CACHE_BYPASS = "BYPASS"
+
+
+def make_cache_key(params):
+    """Canonical hash of a dict of request parameters"""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded, TTL-limited LRU cache of synthesized audio"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        """Cached entry for ``key`` or None; expired entries are dropped"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["created"] > self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, audio, **info):
+        """Store ``audio`` bytes with extra response info (seed, media type, ...)"""
+        size = len(audio)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {"audio": audio, "size": size, "created": time.time(), **info}
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                logger.info(f"Evicted cached TTS result {oldest[:12]}")
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry["size"]
+
+    async def get_or_compute(self, key, compute):
+        """Return (entry, cache_status) for ``key``, running ``compute()`` at most once
+
+        ``compute`` is an async function returning a dict with an ``audio``
+        bytes field plus any extra info to store alongside it.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry, CACHE_HIT
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                entry = await asyncio.shield(inflight)
+                self.coalesced += 1
+                return entry, CACHE_COALESCED
+            except Exception:
+                # The leading request failed or was cancelled; compute on our own
+                logger.info(f"Coalesced TTS request {key[:12]} falling back to its own synthesis")
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+            self.put(key, **result)
+            entry = self.get(key) or {"created": time.time(), "size": len(result["audio"]), **result}
+            future.set_result(entry)
+            return entry, CACHE_MISS
+        except BaseException as e:
+            # Waiters only need to know that the computation did not produce a result
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("TTS computation was cancelled"))
+            # Nobody may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
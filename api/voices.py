@@ -0,0 +1,60 @@
+"""Registry of precomputed voice-conditioning features.
+
+Every synthesis conditions the model on the mel spectrogram of the reference
+audio. Computing it means decoding, clipping, resampling and running the mel
+extractor, so it is done once per voice and stored as ``{hash}.npy`` (float32
+frames x mel channels) next to a small ``{hash}.json`` with the loudness
+information needed to rescale the output. Workers open the ``.npy`` files
+memory-mapped, so all worker processes share the same pages.
+
+Feature files are written by the engine workers (which own the mel
+extractor); this module only decides where they live and tracks them.
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceRegistry:
+    """Maps reference voices to their on-disk conditioning features"""
+
+    def __init__(self, features_dir, hasher):
+        self.features_dir = features_dir
+        # hasher(audio_path) -> content hash, shared with the reference cache
+        self.hasher = hasher
+        os.makedirs(features_dir, exist_ok=True)
+
+    def voice_key(self, audio_path):
+        """Content-derived key for the voice stored at ``audio_path``"""
+        return self.hasher(audio_path)
+
+    def features_path(self, voice_key):
+        """Path of the ``.npy`` features file for ``voice_key``"""
+        return os.path.join(self.features_dir, f"{voice_key}.npy")
+
+    def meta_path(self, voice_key):
+        return os.path.join(self.features_dir, f"{voice_key}.json")
+
+    def has_features(self, voice_key):
+        return os.path.isfile(self.features_path(voice_key)) and os.path.isfile(self.meta_path(voice_key))
+
+    def metadata(self, voice_key):
+        """Stored metadata for a voice, or None if its features are not computed yet"""
+        if not self.has_features(voice_key):
+            return None
+        try:
+            with open(self.meta_path(voice_key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable voice metadata for {voice_key}: {e}")
+            return None
+
+    def remove(self, voice_key):
+        """Delete the features of a voice"""
+        for path in (self.features_path(voice_key), self.meta_path(voice_key)):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Removed voice features {voice_key}")
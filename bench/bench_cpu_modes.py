@@ -0,0 +1,133 @@
+"""Benchmark CPU inference in fp32 against dynamic int8 quantization.
+
+Loads the model once per mode (``cpu`` and ``cpu-int8``) with the same
+thread budget, synthesizes the same texts with the bundled
+``basic_ref_en.wav`` voice and the same seeds, and reports the real-time
+factor (sampling plus vocoding seconds per second of audio) and how close
+the int8 output is to fp32: cosine similarity and mean absolute difference
+of the log-mel spectrograms. Both modes draw the same sampler noise, so the
+outputs are directly comparable.
+
+    python -m bench.bench_cpu_modes
+    python -m bench.bench_cpu_modes --threads 4 --nfe-steps 16 --json results/cpu_modes.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from api.engine import NFE_STEPS, _set_threads, _Synthesizer, available_cores
+
+project_root = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+REF_AUDIO = os.path.join(project_root, "ref_audios", "default", "basic_ref_en.wav")
+REF_TEXT = "Some call me nature, others call me mother nature."
+TEXTS = [
+    "The quick brown fox jumps over the lazy dog.",
+    "I don't really care what you call me. I've been a silent spectator, watching species evolve.",
+    "Quantized weights trade a little accuracy for speed, which is worth measuring before turning them on.",
+]
+MODES = ["cpu", "cpu-int8"]
+
+
+def synthesize(synthesizer, text, seed, nfe_steps):
+    """Waveform and engine timings of one job"""
+    results = {}
+
+    def send(kind, job_id, payload):
+        results[kind] = payload
+
+    job = {
+        "job_id": 0,
+        "ref_audio": REF_AUDIO,
+        "features_path": None,
+        "ref_text": REF_TEXT,
+        "gen_text": text,
+        "remove_silence": False,
+        "speed": 1.0,
+        "seed": seed,
+        "nfe_steps": nfe_steps,
+        "crossfade_duration": 0.15,
+    }
+    synthesizer.synthesize_batch([job], send, max_batch_size=1)
+    if "error" in results:
+        raise RuntimeError(results["error"])
+    return results["result"]["audio"], results["result"]["timings"]
+
+
+def log_mel(synthesizer, wave):
+    import torch
+
+    with torch.inference_mode():
+        mel = synthesizer.model.mel_spec(torch.from_numpy(np.asarray(wave, dtype=np.float32))[None])
+    return torch.log(torch.clamp(mel[0], min=1e-5)).numpy()
+
+
+def compare(synthesizer, reference, wave):
+    """Cosine similarity and mean absolute difference of the log-mel spectrograms"""
+    a, b = log_mel(synthesizer, reference), log_mel(synthesizer, wave)
+    frames = min(a.shape[-1], b.shape[-1])
+    a, b = a[..., :frames].ravel(), b[..., :frames].ravel()
+    cosine = float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    return cosine, float(np.mean(np.abs(a - b)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="F5TTS_v1_Base", help="F5-TTS model to load")
+    parser.add_argument("--threads", type=int, default=available_cores(), help="Intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=1, help="Inter-op threads")
+    parser.add_argument("--nfe-steps", type=int, default=NFE_STEPS, help="Sampler steps per job")
+    parser.add_argument("--repeat", type=int, default=2, help="Timed runs per text and mode")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    _set_threads(args.threads, args.interop_threads)
+    outputs = {}
+    results = []
+    reference = None
+    for mode in MODES:
+        start = time.perf_counter()
+        synthesizer = _Synthesizer(args.model, mode)
+        load_seconds = time.perf_counter() - start
+        # The first job pays for lazy initialization
+        synthesize(synthesizer, TEXTS[0], 0, args.nfe_steps)
+
+        rtfs = []
+        for n, text in enumerate(TEXTS):
+            for _ in range(args.repeat):
+                wave, timings = synthesize(synthesizer, text, 1000 + n, args.nfe_steps)
+                rtfs.append((timings["sampling"] + timings["vocoding"]) / (len(wave) / synthesizer.sample_rate))
+            outputs[(mode, n)] = wave
+
+        result = {"mode": mode, "load_seconds": load_seconds, "median_rtf": statistics.median(rtfs),
+                  "min_rtf": min(rtfs)}
+        if reference is None:
+            reference = synthesizer
+        else:
+            scores = [compare(reference, outputs[(MODES[0], n)], outputs[(mode, n)]) for n in range(len(TEXTS))]
+            result["mel_cosine"] = statistics.mean(score[0] for score in scores)
+            result["mel_l1"] = statistics.mean(score[1] for score in scores)
+        results.append(result)
+
+    print(f"{args.threads} intra-op / {args.interop_threads} inter-op thread(s), {args.nfe_steps} NFE steps")
+    print(f"{'mode':<10} {'load s':>7} {'median RTF':>11} {'min RTF':>8} {'mel cos':>8} {'mel L1':>7}")
+    for r in results:
+        similarity = f"{r['mel_cosine']:>8.4f} {r['mel_l1']:>7.3f}" if "mel_cosine" in r else f"{'-':>8} {'-':>7}"
+        print(f"{r['mode']:<10} {r['load_seconds']:>7.1f} {r['median_rtf']:>11.3f} {r['min_rtf']:>8.3f} {similarity}")
+    if len(results) > 1:
+        print(f"int8 speedup: {results[0]['median_rtf'] / results[1]['median_rtf']:.2f}x")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"threads": args.threads, "interop_threads": args.interop_threads,
+                       "nfe_steps": args.nfe_steps, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Load-test the TTS endpoints and report latency, TTFB, throughput and memory.
+
+By default the server runs in-process on a free port with ``StubEngine`` in
+place of the model workers, so runs need no GPU or weights and only measure
+the server itself (queueing, caching, WAV encoding, streaming). Use ``--url``
+to drive a real server instead.
+
+    python -m bench.bench_load --requests 200 --concurrency 16
+    python -m bench.bench_load --endpoint stream --mix short=0.7,long=0.3
+    python -m bench.bench_load --replay jobs.jsonl --json bench_results/load.json
+    python -m bench.bench_load --url http://localhost:8000 --requests 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+TEXTS = {
+    "short": "Hello there, how are you doing today?",
+    "medium": (
+        "The quick brown fox jumps over the lazy dog. It was a bright cold day in April, "
+        "and the clocks were striking thirteen. Nobody expected what happened next."
+    ),
+    "long": " ".join([
+        "Speech synthesis turns written text into spoken audio.",
+        "Modern systems model the sound of a voice from a short reference clip.",
+        "Long documents are split into batches that are synthesized one after another.",
+        "Each batch is joined to the previous one with a short crossfade.",
+        "The result should sound like one continuous recording.",
+        "Latency grows with the length of the text, so long inputs dominate the tail.",
+    ]),
+}
+# Transcript of the default voice, sent along so no request waits for ASR
+REF_TEXT = "Some call me nature, others call me mother nature."
+DEFAULT_MIX = "short=0.5,medium=0.3,long=0.2"
+ENDPOINTS = {"tts": "/tts/", "stream": "/tts/stream"}
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in TEXTS:
+            raise argparse.ArgumentTypeError(f"Unknown text length {name!r}, expected one of {', '.join(TEXTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_workload(args):
+    """List of (label, request body) pairs, reproducible for a given ``--seed``"""
+    rng = random.Random(args.seed)
+    if args.replay:
+        from api.bulk import parse_jsonl
+
+        with open(args.replay, "r", encoding="utf-8") as f:
+            bodies = [obj for _, obj, error in parse_jsonl(f.read()) if error is None and obj.get("gen_text")]
+        if not bodies:
+            raise SystemExit(f"{args.replay} contains no requests with gen_text")
+        workload = [("replay", dict(bodies[i % len(bodies)])) for i in range(args.requests)]
+    else:
+        mix = parse_mix(args.mix)
+        names = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+        workload = [(name, {"gen_text": TEXTS[name], "ref_text": REF_TEXT}) for name in names]
+
+    for _, body in workload:
+        body.pop("request_id", None)
+        if args.fixed_seed:
+            # Repeated texts become result cache hits
+            body.setdefault("seed", 42)
+            body["randomize_seed"] = False
+        else:
+            # Distinct (but reproducible) seeds keep repeated texts from being served from the cache
+            body["seed"] = rng.randrange(2**31)
+            body["randomize_seed"] = False
+    return workload
+
+
+def parse_server_timing(value):
+    stages = {}
+    for entry in value.split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            stages[name] = float(params[4:]) / 1000
+    return stages
+
+
+async def send(client, url, label, body):
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            async for chunk in response.aiter_raw():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+            status = response.status_code
+            timing = response.headers.get("server-timing", "")
+    except httpx.HTTPError as e:
+        return {"label": label, "ok": False, "status": None, "error": str(e), "latency": time.perf_counter() - start}
+    return {
+        "label": label,
+        "ok": status == 200,
+        "status": status,
+        "latency": time.perf_counter() - start,
+        "ttfb": ttfb,
+        "bytes": size,
+        "stages": parse_server_timing(timing),
+    }
+
+
+async def drive(base_url, endpoint, workload, concurrency, timeout):
+    url = base_url.rstrip("/") + ENDPOINTS[endpoint]
+    queue = list(reversed(workload))
+    results = []
+
+    async def worker(client):
+        while queue:
+            label, body = queue.pop()
+            results.append(await send(client, url, label, body))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, round(q * (len(values) - 1)))]
+    return {
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "mean_ms": statistics.fmean(values) * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            key = str(r["status"] or r.get("error"))
+            errors[key] = errors.get(key, 0) + 1
+
+    stages = {}
+    for r in ok:
+        for name, seconds in r["stages"].items():
+            stages.setdefault(name, []).append(seconds)
+
+    by_label = {}
+    for label in sorted({r["label"] for r in ok}):
+        by_label[label] = percentiles([r["latency"] for r in ok if r["label"] == label])
+
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "latency": percentiles([r["latency"] for r in ok]),
+        "ttfb": percentiles([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "latency_by_length": by_label,
+        "stage_mean_ms": {name: statistics.fmean(values) * 1000 for name, values in stages.items()},
+        "bytes": sum(r["bytes"] for r in ok),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args):
+    """Serve the app with the stub engine from a background thread and return its URL"""
+    import uvicorn
+
+    from api import main as server
+
+    from .stub_engine import StubEngine
+
+    # The metric callbacks and endpoints look the engine up at call time
+    server.tts_engine = StubEngine(delay=args.stub_delay, rtf=args.stub_rtf, max_parallel=args.stub_workers)
+    logging.disable(logging.INFO)
+
+    port = free_port()
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning")
+    uvicorn_server = uvicorn.Server(config)
+    thread = threading.Thread(target=uvicorn_server.run, daemon=True)
+    thread.start()
+    while not uvicorn_server.started:
+        if not thread.is_alive():
+            raise SystemExit("Benchmark server failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", uvicorn_server, thread
+
+
+def print_summary(summary):
+    print(f"{summary['succeeded']}/{summary['requests']} succeeded in {summary['elapsed_s']:.2f}s, "
+          f"{summary['rps']:.2f} req/s, peak RSS {summary['peak_rss_mb']:.1f} MB")
+    if summary["errors"]:
+        print("errors: " + ", ".join(f"{key} x{count}" for key, count in sorted(summary["errors"].items())))
+
+    rows = [("latency", summary["latency"]), ("ttfb", summary["ttfb"])]
+    rows += [(f"  {label}", stats) for label, stats in summary["latency_by_length"].items()]
+    print(f"{'':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'max ms':>9}")
+    for name, stats in rows:
+        if stats:
+            print(f"{name:<12} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} "
+                  f"{stats['mean_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+
+    if summary["stage_mean_ms"]:
+        print("mean stage times (Server-Timing): " + ", ".join(
+            f"{name} {ms:.1f}ms" for name, ms in summary["stage_mean_ms"].items()
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Drive a running server instead of the in-process stub server")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="tts", help="Endpoint to load (default: tts)")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted text lengths (default: {DEFAULT_MIX})")
+    parser.add_argument("--replay", help="JSONL file of TTS request bodies to replay in a loop instead of --mix")
+    parser.add_argument("--fixed-seed", action="store_true", help="Use one seed so repeated texts hit the result cache")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the workload order and request seeds")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="Stub engine fixed cost per job in seconds")
+    parser.add_argument("--stub-rtf", type=float, default=0.02, help="Stub engine seconds of compute per second of audio")
+    parser.add_argument("--stub-workers", type=int, default=1, help="Jobs the stub engine runs at once")
+    parser.add_argument("--json", help="Write the summary to this JSON file")
+    args = parser.parse_args()
+
+    workload = build_workload(args)
+    server = thread = None
+    if args.url:
+        base_url = args.url
+    else:
+        base_url, server, thread = start_stub_server(args)
+
+    try:
+        results, elapsed = asyncio.run(drive(base_url, args.endpoint, workload, args.concurrency, args.timeout))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    summary = summarize(results, elapsed)
+    # With --url the server runs elsewhere and only the client's memory is seen here
+    summary["peak_rss_mb"] = peak_rss_mb()
+    print_summary(summary)
+
+    if args.json:
+        config = {key: value for key, value in vars(args).items() if key != "json"}
+        if args.url:
+            for key in ("stub_delay", "stub_rtf", "stub_workers"):
+                config.pop(key)
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "summary": summary}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
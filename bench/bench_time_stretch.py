@@ -0,0 +1,127 @@
+"""Benchmark the in-process WSOLA time-stretch against the old ffmpeg atempo path.
+
+Runs both on the bundled reference voices at several speeds and reports the
+wall time per call and the output length relative to the ideal length.
+
+    python -m bench.bench_time_stretch
+    python -m bench.bench_time_stretch --repeat 20 --json results/time_stretch.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from api.audio import TimeStretcher, float_to_pcm16, time_stretch
+
+project_root = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+SAMPLES = ["basic_ref_en.wav", "basic_ref_zh.wav"]
+SPEEDS = [0.75, 1.25, 1.5, 2.0]
+
+
+def read_wav(path):
+    with wave.open(path, "rb") as w:
+        frames = w.readframes(w.getnframes())
+        sample_rate = w.getframerate()
+    return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768, sample_rate
+
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(float_to_pcm16(samples))
+
+
+def run_numpy(samples, sample_rate, speed):
+    return time_stretch(samples, speed, sample_rate)
+
+
+def run_numpy_chunked(samples, sample_rate, speed, chunk_seconds=1.0):
+    stretcher = TimeStretcher(speed, sample_rate)
+    chunk = int(chunk_seconds * sample_rate)
+    out = [stretcher.push(samples[i:i + chunk]) for i in range(0, len(samples), chunk)]
+    out.append(stretcher.flush())
+    return np.concatenate(out)
+
+
+def run_ffmpeg(samples, sample_rate, speed, workdir):
+    # Mirrors the old server path: waveform on disk, ffmpeg process, result read back
+    input_path = os.path.join(workdir, "input.wav")
+    output_path = os.path.join(workdir, "output.wav")
+    write_wav(input_path, samples, sample_rate)
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", input_path, "-filter:a", f"atempo={speed}", "-y", output_path],
+        check=True, capture_output=True
+    )
+    return read_wav(output_path)[0]
+
+
+def measure(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per sample, speed and method")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+    if not has_ffmpeg:
+        print("ffmpeg not found, only the NumPy paths are measured")
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for sample in SAMPLES:
+            samples, sample_rate = read_wav(os.path.join(project_root, "ref_audios", "default", sample))
+            for speed in SPEEDS:
+                inputs = (samples, sample_rate, speed)
+                methods = {
+                    "numpy": functools.partial(run_numpy, *inputs),
+                    "numpy_chunked": functools.partial(run_numpy_chunked, *inputs),
+                }
+                if has_ffmpeg:
+                    methods["ffmpeg"] = functools.partial(run_ffmpeg, *inputs, workdir)
+
+                for method, fn in methods.items():
+                    output, times = measure(fn, args.repeat)
+                    expected = len(samples) / speed
+                    results.append({
+                        "sample": sample,
+                        "speed": speed,
+                        "method": method,
+                        "median_ms": statistics.median(times) * 1000,
+                        "min_ms": min(times) * 1000,
+                        "length_ratio": len(output) / expected,
+                    })
+
+    print(f"{'sample':<18} {'speed':>5} {'method':<14} {'median ms':>10} {'min ms':>8} {'len ratio':>9}")
+    for r in results:
+        print(f"{r['sample']:<18} {r['speed']:>5} {r['method']:<14} {r['median_ms']:>10.2f} "
+              f"{r['min_ms']:>8.2f} {r['length_ratio']:>9.3f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Deterministic stand-in for ``TTSEngine`` that needs no model weights.
+
+The stub "synthesizes" a tone whose length follows the text length (about
+15 characters per second of speech) and takes ``delay`` seconds plus
+``rtf`` seconds per second of audio to do so (scaled by the job's step
+count relative to the default), emitting one chunk per sentence in
+streaming mode. With the same inputs it always returns the same audio after
+the same time, so load-test runs are comparable on any machine.
+"""
+
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 24000
+CHARS_PER_SECOND = 15
+
+
+class _StubProcess:
+    """Looks enough like a worker process for /tts-status"""
+
+    pid = os.getpid()
+
+
+class StubEngine:
+    def __init__(self, delay=0.05, rtf=0.02, max_parallel=1):
+        self.delay = delay
+        self.rtf = rtf
+        # Limits how many jobs "compute" at once, like the number of workers
+        self._slots = threading.Semaphore(max(1, max_parallel))
+        self.worker_modes = ["auto"] * max(1, max_parallel)
+        self._running = set()
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self.jobs = 0
+
+    def start(self, warmup_job=None):
+        pass
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def stop(self):
+        pass
+
+    def _sentences(self, text):
+        sentences = [s for s in re.split(r"(?<=[.!?。！？])\s*", text) if s.strip()]
+        return sentences or [text]
+
+    def _wave(self, text, seed):
+        samples = max(1, int(len(text) / CHARS_PER_SECOND * SAMPLE_RATE))
+        t = np.arange(samples, dtype=np.float32) / SAMPLE_RATE
+        return (0.1 * np.sin(2 * np.pi * (180 + seed % 60) * t)).astype(np.float32)
+
+    def synthesize(self, request_id, job, on_dispatch=None, on_chunk=None):
+        from api.engine import NFE_STEPS, EngineCancelled
+
+        def check_cancelled():
+            with self._lock:
+                if request_id in self._cancelled:
+                    raise EngineCancelled(f"TTS job {request_id} was cancelled")
+
+        # Jobs are cancellable while waiting for a slot too, like pending engine jobs
+        with self._lock:
+            self._running.add(request_id)
+        try:
+            with self._slots:
+                check_cancelled()
+                if on_dispatch is not None:
+                    on_dispatch(_StubProcess())
+                started = time.perf_counter()
+                time.sleep(self.delay)
+                waves = []
+                for sentence in self._sentences(job["gen_text"]):
+                    wave = self._wave(sentence, job["seed"])
+                    # Sampling cost scales with the number of steps, as in the real sampler
+                    time.sleep(len(wave) / SAMPLE_RATE * self.rtf * job.get("nfe_steps", NFE_STEPS) / NFE_STEPS)
+                    check_cancelled()
+                    if on_chunk is not None:
+                        on_chunk(wave)
+                    waves.append(wave)
+                elapsed = time.perf_counter() - started
+        finally:
+            with self._lock:
+                self._running.discard(request_id)
+                self._cancelled.discard(request_id)
+
+        with self._lock:
+            self.jobs += 1
+        audio = np.concatenate(waves)
+        result = {
+            "seed": job["seed"],
+            "sample_rate": SAMPLE_RATE,
+            "duration": len(audio) / SAMPLE_RATE,
+            "batches": len(waves),
+            "timings": {"sampling": elapsed},
+        }
+        if on_chunk is None:
+            result["audio"] = audio
+        return result
+
+    def prepare_voice(self, request_id, ref_audio, features_path, ref_text=""):
+        return {"frames": 0, "timings": {}}
+
+    def cancel(self, request_id):
+        with self._lock:
+            if request_id not in self._running:
+                return False
+            self._cancelled.add(request_id)
+        return True
+
+    def stats(self):
+        return {
+            "workers": 1,
+            "ready_workers": 1,
+            "idle_workers": 1,
+            "pending_jobs": 0,
+            "batches": self.jobs,
+            "batch_fill": 1.0,
+            "pipeline": {"stage_busy_seconds": {}, "stage_occupancy": {}},
+        }
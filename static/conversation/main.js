@@ -5,8 +5,25 @@ document.addEventListener('DOMContentLoaded', function() {
     
     let isRecording = false;
     let isProcessing = false;
+    let isSpeaking = false;
     let animationId = null;
     
+    // Speech recognition (where the browser supports it) provides the text to speak
+    const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+    let recognition = null;
+    let transcript = '';
+    
+    // Duplex TTS connection and audio playback
+    let socket = null;
+    let sampleRate = 24000;
+    let audioContext = null;
+    let analyser = null;
+    let playHead = 0;
+    let activeSources = [];
+    // After a barge-in, audio frames are dropped until the server confirms the cancel
+    let awaitingCancel = false;
+    let utteranceDone = false;
+    
     // Canvas setup
     const centerX = canvas.width / 2;
     const centerY = canvas.height / 2;
@@ -121,10 +138,52 @@ document.addEventListener('DOMContentLoaded', function() {
         time += 0.1;
     }
     
+    // Speaking animation - bars following the output level
+    function drawSpeakingAnimation() {
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        
+        let level = 0;
+        if (analyser) {
+            const data = new Uint8Array(analyser.frequencyBinCount);
+            analyser.getByteTimeDomainData(data);
+            for (let i = 0; i < data.length; i++) {
+                level = Math.max(level, Math.abs(data[i] - 128) / 128);
+            }
+        }
+        
+        const gradient = ctx.createRadialGradient(centerX, centerY, 0, centerX, centerY, baseRadius);
+        gradient.addColorStop(0, 'rgba(46, 213, 115, 0.4)');
+        gradient.addColorStop(1, 'rgba(30, 144, 255, 0.1)');
+        
+        ctx.fillStyle = gradient;
+        ctx.beginPath();
+        ctx.arc(centerX, centerY, baseRadius + level * 30, 0, Math.PI * 2);
+        ctx.fill();
+        
+        const bars = 32;
+        for (let i = 0; i < bars; i++) {
+            const angle = (i / bars) * Math.PI * 2;
+            const barHeight = 5 + level * 60 * (0.6 + 0.4 * Math.sin(time * 6 + i));
+            const startRadius = baseRadius + 20;
+            const endRadius = startRadius + barHeight;
+            
+            ctx.strokeStyle = 'rgba(255, 255, 255, 0.8)';
+            ctx.lineWidth = 3;
+            ctx.beginPath();
+            ctx.moveTo(centerX + Math.cos(angle) * startRadius, centerY + Math.sin(angle) * startRadius);
+            ctx.lineTo(centerX + Math.cos(angle) * endRadius, centerY + Math.sin(angle) * endRadius);
+            ctx.stroke();
+        }
+        
+        time += 0.05;
+    }
+    
     // Animation loop
     function animate() {
         if (isRecording) {
             drawRecordingAnimation();
+        } else if (isSpeaking) {
+            drawSpeakingAnimation();
         } else if (isProcessing) {
             drawThinkingAnimation();
         } else {
@@ -138,50 +197,213 @@ document.addEventListener('DOMContentLoaded', function() {
     micButton.addEventListener('click', function() {
         if (isRecording) {
             stopRecording();
-        } else if (!isProcessing) {
+        } else if (isSpeaking || isProcessing) {
+            // Barge-in: interrupt the reply and listen again
+            bargeIn();
+            startRecording();
+        } else {
             startRecording();
         }
     });
     
+    function setButton(state, icon) {
+        micButton.classList.remove('recording', 'processing', 'speaking');
+        if (state) {
+            micButton.classList.add(state);
+        }
+        micButton.querySelector('.material-symbols-outlined').textContent = icon;
+    }
+    
+    function connect() {
+        if (socket && socket.readyState <= WebSocket.OPEN) {
+            return;
+        }
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        socket = new WebSocket(`${protocol}//${window.location.host}/ws/tts`);
+        socket.binaryType = 'arraybuffer';
+        
+        socket.addEventListener('message', function(event) {
+            if (event.data instanceof ArrayBuffer) {
+                if (!awaitingCancel) {
+                    playPcm(event.data);
+                }
+                return;
+            }
+            handleEvent(JSON.parse(event.data));
+        });
+        
+        socket.addEventListener('close', function() {
+            socket = null;
+            if (isProcessing || isSpeaking) {
+                stopPlayback();
+                finishReply();
+            }
+        });
+    }
+    
+    function send(message) {
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify(message));
+        } else if (socket) {
+            socket.addEventListener('open', () => socket.send(JSON.stringify(message)), { once: true });
+        }
+    }
+    
+    function handleEvent(message) {
+        switch (message.type) {
+            case 'ready':
+                sampleRate = message.sample_rate;
+                console.log(`Connected to TTS session ${message.session_id}`);
+                break;
+            case 'clause_start':
+                console.log(`Speaking clause ${message.clause} (first audio after ${message.latency.toFixed(2)}s): ${message.text}`);
+                break;
+            case 'cancelled':
+                awaitingCancel = false;
+                break;
+            case 'done':
+                utteranceDone = true;
+                checkFinished();
+                break;
+            case 'error':
+                console.error('TTS error:', message.detail);
+                break;
+        }
+    }
+    
+    function ensureAudio() {
+        if (!audioContext) {
+            audioContext = new (window.AudioContext || window.webkitAudioContext)();
+            analyser = audioContext.createAnalyser();
+            analyser.fftSize = 512;
+            analyser.connect(audioContext.destination);
+        }
+        if (audioContext.state === 'suspended') {
+            audioContext.resume();
+        }
+    }
+    
+    function playPcm(data) {
+        const pcm = new Int16Array(data);
+        if (!pcm.length) {
+            return;
+        }
+        const buffer = audioContext.createBuffer(1, pcm.length, sampleRate);
+        const channel = buffer.getChannelData(0);
+        for (let i = 0; i < pcm.length; i++) {
+            channel[i] = pcm[i] / 32768;
+        }
+        
+        const source = audioContext.createBufferSource();
+        source.buffer = buffer;
+        source.connect(analyser);
+        // Frames are queued back to back; a late frame starts as soon as it arrives
+        playHead = Math.max(playHead, audioContext.currentTime);
+        source.start(playHead);
+        playHead += buffer.duration;
+        activeSources.push(source);
+        source.addEventListener('ended', function() {
+            activeSources = activeSources.filter(s => s !== source);
+            checkFinished();
+        });
+        
+        if (!isSpeaking) {
+            isSpeaking = true;
+            isProcessing = false;
+            setButton('speaking', 'volume_up');
+        }
+    }
+    
+    function stopPlayback() {
+        activeSources.forEach(source => source.stop());
+        activeSources = [];
+        playHead = 0;
+    }
+    
+    function checkFinished() {
+        if (utteranceDone && activeSources.length === 0 && (isSpeaking || isProcessing)) {
+            finishReply();
+        }
+    }
+    
+    function finishReply() {
+        isSpeaking = false;
+        isProcessing = false;
+        setButton(null, 'mic');
+        console.log('Ready for next interaction');
+    }
+    
+    function bargeIn() {
+        send({ type: 'cancel' });
+        awaitingCancel = true;
+        utteranceDone = false;
+        stopPlayback();
+        finishReply();
+    }
+    
     function startRecording() {
         isRecording = true;
         isProcessing = false;
-        micButton.classList.add('recording');
-        micButton.querySelector('.material-symbols-outlined').textContent = 'mic_off';
+        setButton('recording', 'mic_off');
         
-        // TODO: Implement actual recording logic
-        console.log('Started recording...');
+        // Audio playback needs a user gesture, which this click is
+        ensureAudio();
+        connect();
         
-        // Simulate stopping recording after 5 seconds for demo
-        setTimeout(() => {
-            if (isRecording) {
-                stopRecording();
-            }
-        }, 5000);
+        transcript = '';
+        if (SpeechRecognition) {
+            recognition = new SpeechRecognition();
+            recognition.lang = navigator.language || 'en-US';
+            recognition.interimResults = false;
+            recognition.continuous = true;
+            recognition.addEventListener('result', function(event) {
+                for (let i = event.resultIndex; i < event.results.length; i++) {
+                    if (event.results[i].isFinal) {
+                        transcript += event.results[i][0].transcript + ' ';
+                    }
+                }
+            });
+            recognition.addEventListener('end', function() {
+                if (isRecording) {
+                    stopRecording();
+                }
+            });
+            recognition.start();
+        } else {
+            transcript = window.prompt('Speech recognition is not available in this browser. What should be said?') || '';
+            stopRecording();
+        }
+        console.log('Started recording...');
     }
     
     function stopRecording() {
         isRecording = false;
         isProcessing = true;
-        micButton.classList.remove('recording');
-        micButton.classList.add('processing');
-        micButton.querySelector('.material-symbols-outlined').textContent = 'hourglass_top';
-        
+        setButton('processing', 'hourglass_top');
+        if (recognition) {
+            const active = recognition;
+            recognition = null;
+            active.stop();
+            // The last result may arrive after stop(); speak once recognition has ended
+            active.addEventListener('end', speakTranscript, { once: true });
+        } else {
+            speakTranscript();
+        }
         console.log('Processing...');
-        
-        // TODO: Implement actual processing logic
-        // Simulate processing for 3 seconds
-        setTimeout(() => {
-            stopProcessing();
-        }, 3000);
     }
     
-    function stopProcessing() {
-        isProcessing = false;
-        micButton.classList.remove('processing');
-        micButton.querySelector('.material-symbols-outlined').textContent = 'mic';
+    function speakTranscript() {
+        const text = transcript.trim();
+        if (!text) {
+            finishReply();
+            return;
+        }
         
-        console.log('Ready for next interaction');
+        // The reply is sent word by word, the way tokens stream from a language model;
+        // the server starts synthesizing at the first clause boundary
+        utteranceDone = false;
+        text.split(/(\s+)/).forEach(word => send({ type: 'text', text: word }));
+        send({ type: 'flush' });
     }
     
     // Initialize
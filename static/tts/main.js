@@ -275,6 +275,24 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Poll the ingest status of an uploaded reference audio until it is ready
+    async function waitForReferenceAudio(filename) {
+        while (true) {
+            const response = await fetch(`/ref-audio-status/${filename}`);
+            const status = await response.json();
+            if (!response.ok) {
+                throw new Error(status.detail || `Status check failed with status: ${response.status}`);
+            }
+            if (status.status === 'ready') {
+                return;
+            }
+            if (status.status === 'failed') {
+                throw new Error(status.error || 'Processing failed');
+            }
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    }
+
     // Upload multiple reference audio files
     async function uploadReferenceAudios(files) {
         const allowedTypes = ['audio/wav', 'audio/mpeg', 'audio/mp3', 'audio/flac', 'audio/x-m4a', 'audio/ogg'];
@@ -342,6 +360,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 
                 const result = await response.json();
+                
+                // The server converts the upload in the background; wait until it can be used
+                uploadBtn.innerHTML = '<span class="upload-icon material-symbols-outlined">hourglass_top</span> Processing...';
+                await waitForReferenceAudio(result.filename);
                 uploadResults.push(result.filename);
                 
             } catch (error) {